@@ -2,12 +2,14 @@
 User Authentication Models
 SQLAlchemy models for user accounts, sessions, and authentication
 """
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, create_engine
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import scoped_session, sessionmaker
 from datetime import datetime
 import bcrypt
+import os
 import secrets
+import threading
 
 Base = declarative_base()
 
@@ -57,7 +59,7 @@ class Session(Base):
     user_id = Column(Integer, nullable=False, index=True)
     session_token = Column(String(255), unique=True, nullable=False, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
-    expires_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)  # session_sweeper
     ip_address = Column(String(45))  # IPv6 max length
     user_agent = Column(String(500))
     
@@ -67,16 +69,32 @@ class Session(Base):
         return secrets.token_urlsafe(32)
 
 
-# Database setup helper
-def get_db_engine(db_url=None):
+class Revocation(Base):
     """
-    Create and return database engine
-    
-    Args:
-        db_url: Database URL. If None, uses DATABASE_URL env var or defaults to SQLite
+    Revoked signed session tokens, shared between servers (see signed_tokens):
+    key 'token:<jti>' revokes one token, 'user:<id>' every token of the user
+    issued before issued_before. Rows can be dropped after expires_at.
     """
-    import os
+    __tablename__ = 'revocations'
     
+    key = Column(String(64), primary_key=True)
+    issued_before = Column(DateTime)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+
+# Database setup helpers
+# One engine per database URL and one session factory per engine, shared by every
+# AuthService in the process (tables are created once, when the engine is built)
+_engines = {}
+_session_factories = {}
+_setup_lock = threading.Lock()
+
+# SQLite: wait this long for a lock held by another connection instead of failing
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+
+
+def _resolve_db_url(db_url):
     if db_url is None:
         # Try to get from environment (Render provides DATABASE_URL for PostgreSQL)
         db_url = os.environ.get('DATABASE_URL')
@@ -88,7 +106,19 @@ def get_db_engine(db_url=None):
         # Fallback to SQLite for local development
         if not db_url:
             db_url = 'sqlite:///users.db'
-    
+    return db_url
+
+
+def _tune_sqlite(dbapi_connection, connection_record):
+    """WAL lets reads run alongside a write; NORMAL sync is safe with WAL"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}')
+    cursor.close()
+
+
+def _create_engine(db_url):
     # Configure connection pool for PostgreSQL
     if db_url.startswith('postgresql://'):
         engine = create_engine(
@@ -100,12 +130,41 @@ def get_db_engine(db_url=None):
         )
     else:
         engine = create_engine(db_url, echo=False)
+        if engine.dialect.name == 'sqlite':
+            event.listen(engine, 'connect', _tune_sqlite)
     
     Base.metadata.create_all(engine)
+    # create_all skips tables that exist: add indexes declared since they were created
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
     return engine
 
 
+def get_db_engine(db_url=None):
+    """
+    Return the database engine for the URL, created on first use
+    
+    Args:
+        db_url: Database URL. If None, uses DATABASE_URL env var or defaults to SQLite
+    """
+    db_url = _resolve_db_url(db_url)
+    with _setup_lock:
+        engine = _engines.get(db_url)
+        if engine is None:
+            engine = _engines[db_url] = _create_engine(db_url)
+        return engine
+
+
+def get_session_factory(engine):
+    """Thread-local (scoped) session factory of the engine"""
+    with _setup_lock:
+        factory = _session_factories.get(engine)
+        if factory is None:
+            factory = _session_factories[engine] = scoped_session(sessionmaker(bind=engine))
+        return factory
+
+
 def get_db_session(engine):
-    """Create and return database session"""
-    Session_maker = sessionmaker(bind=engine)
-    return Session_maker()
+    """Return the calling thread's database session; close() it when done"""
+    return get_session_factory(engine)()
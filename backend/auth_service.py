@@ -4,24 +4,48 @@ Handles user registration, login, session management, and authorization
 """
 from datetime import datetime, timedelta
 from typing import Optional, Tuple
+import os
 from auth_models import User, Session, get_db_engine, get_db_session
+from session_cache import SessionCache
+from session_sweeper import SessionSweeper
+import signed_tokens
 import re
 
+# Lifetime of a login (database session or signed token)
+SESSION_LIFETIME = timedelta(days=7)
+
 
 class AuthService:
     """Service for user authentication and session management"""
     
-    def __init__(self, db_url=None):
+    def __init__(self, db_url=None, session_cache=None, token_mode=None, signer=None):
         """
         Initialize AuthService
         
         Args:
             db_url: Database URL. If None, uses DATABASE_URL env var or defaults to SQLite
+            session_cache: SessionCache for validated tokens. If None, a new one
+                configured from SESSION_CACHE_SIZE / SESSION_CACHE_TTL
+            token_mode: 'db' (sessions table) or 'signed' (see signed_tokens) for
+                new logins. If None, uses SESSION_TOKEN_MODE
+            signer: TokenSigner for signed tokens. If None, one from SESSION_SIGNING_KEYS
+                when signed mode is on or keys are configured (tokens issued before
+                switching back to 'db' stay valid)
         """
         self.engine = get_db_engine(db_url)
+        self.session_cache = session_cache if session_cache is not None else SessionCache()
+        self.token_mode = token_mode or signed_tokens.MODE
+        if self.token_mode not in ('db', 'signed'):
+            raise ValueError(f"Unknown session token mode '{self.token_mode}' (expected 'db' or 'signed')")
+        if signer is None and (self.token_mode == 'signed' or os.environ.get('SESSION_SIGNING_KEYS')):
+            signer = signed_tokens.TokenSigner.from_env()
+        self.signer = signer
+        self.revocations = signed_tokens.RevocationSet(self.engine) if signer is not None else None
+        # Deletes expired sessions in the background once start()ed (see session_sweeper)
+        self.sweeper = SessionSweeper(self.engine)
         
     def _get_session(self):
-        """Get a new database session"""
+        """Get the thread's database session (shared engine and factory, see auth_models)"""
         return get_db_session(self.engine)
     
     def register_user(self, username: str, email: str, password: str, 
@@ -107,12 +131,18 @@ class AuthService:
             # Update last login
             user.last_login = datetime.utcnow()
             
+            if self.token_mode == 'signed':
+                # Stateless token: nothing stored besides the last login
+                db.commit()
+                session_token, _ = self.signer.issue(user.to_dict(), SESSION_LIFETIME)
+                return True, 'Login successful', user.to_dict(), session_token
+            
             # Create session
             session_token = Session.generate_token()
             session = Session(
                 user_id=user.id,
                 session_token=session_token,
-                expires_at=datetime.utcnow() + timedelta(days=7),  # 7 day session
+                expires_at=datetime.utcnow() + SESSION_LIFETIME,
                 ip_address=ip_address[:45] if ip_address else None,
                 user_agent=user_agent[:500] if user_agent else None
             )
@@ -132,17 +162,32 @@ class AuthService:
         """
         Validate session token and return user data
         
+        Valid sessions are served from session_cache for up to its TTL. Signed
+        tokens are checked without the database (signature, expiry, revocations)
+        and carry the user dict as of login, so role changes apply at the next login.
+        
         Returns:
             (is_valid, user_dict)
         """
+        if signed_tokens.is_signed(session_token):
+            claims = self._verify_signed(session_token)
+            return (True, dict(claims['usr'])) if claims else (False, None)
+        
+        cached = self.session_cache.get(session_token)
+        if cached is not None:
+            return True, cached
+        generation = self.session_cache.generation
+        
         db = self._get_session()
         try:
-            session = db.query(Session).filter(
+            # Session and user in one query (session_token is indexed)
+            row = db.query(Session, User).join(User, User.id == Session.user_id).filter(
                 Session.session_token == session_token
             ).first()
             
-            if not session:
+            if not row:
                 return False, None
+            session, user = row
             
             # Check if session expired
             if session.expires_at < datetime.utcnow():
@@ -150,26 +195,42 @@ class AuthService:
                 db.commit()
                 return False, None
             
-            # Get user
-            user = db.query(User).filter(User.id == session.user_id).first()
-            
-            if not user or not user.is_active:
+            if not user.is_active:
                 return False, None
             
-            return True, user.to_dict()
+            user_data = user.to_dict()
+            self.session_cache.put(session_token, user_data, session.expires_at, generation)
+            return True, user_data
             
         except Exception:
             return False, None
         finally:
             db.close()
     
+    def _verify_signed(self, session_token):
+        """Claims of a valid, unrevoked signed token, else None"""
+        if self.signer is None:
+            return None
+        claims = self.signer.verify(session_token)
+        if claims is None or self.revocations.is_revoked(claims):
+            return None
+        return claims
+    
     def logout(self, session_token: str) -> bool:
         """
-        Logout user by deleting session
+        Logout user by deleting session (or revoking a signed token)
         
         Returns:
             success
         """
+        if signed_tokens.is_signed(session_token):
+            claims = self._verify_signed(session_token)
+            if claims is None:
+                return False
+            self.revocations.revoke(claims['jti'], claims['exp'])
+            return True
+        
+        self.session_cache.invalidate(session_token)
         db = self._get_session()
         try:
             session = db.query(Session).filter(
@@ -189,15 +250,44 @@ class AuthService:
         finally:
             db.close()
     
-    def cleanup_expired_sessions(self):
-        """Remove all expired sessions"""
+    def set_user_active(self, user_id: int, active: bool) -> bool:
+        """
+        Enable or disable a user account; disabling ends its cached sessions and
+        revokes its signed tokens at once
+        
+        Returns:
+            success
+        """
+        if not active:
+            self.session_cache.invalidate_user(user_id)
+            if self.revocations is not None:
+                self.revocations.revoke_user(user_id, SESSION_LIFETIME)
         db = self._get_session()
         try:
-            db.query(Session).filter(
-                Session.expires_at < datetime.utcnow()
-            ).delete()
+            user = db.query(User).filter(User.id == user_id).first()
+            
+            if not user:
+                return False
+            
+            user.is_active = active
             db.commit()
+            return True
+            
         except Exception:
             db.rollback()
+            return False
         finally:
             db.close()
+            if not active:
+                # A validation racing the update may have cached the user again
+                self.session_cache.invalidate_user(user_id)
+    
+    def cleanup_expired_sessions(self) -> int:
+        """
+        Remove expired sessions now, in batches of the sweeper (which also runs this
+        periodically); at most sweeper.max_batches batches per call
+        
+        Returns:
+            number of sessions removed
+        """
+        return self.sweeper.sweep()['purged']
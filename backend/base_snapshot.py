@@ -0,0 +1,217 @@
+"""
+Base.xlsx Columnar Snapshot
+Compiles the reference workbook into a versioned directory of typed NumPy files,
+one structured .npy array per sheet, plus a manifest with the schema and the
+source workbook's hash. Loading a snapshot takes milliseconds instead of
+re-parsing the xlsx XML: the arrays are memory-mapped and the numeric columns of
+the loaded frames read straight from the mapping (only object columns, which are
+decoded, live in memory).
+
+Build: python base_snapshot.py [path/to/Base.xlsx] [--out DIR]
+
+Layout of <Base>.snapshot/:
+    manifest.json     format version, source sha256, schema hash, sheet names
+    <n>.npy           one structured array per normalized sheet
+
+Object columns (ids, names) are stored as fixed-width unicode plus a per-value
+kind code, so str/int/float/bool/None values round-trip exactly.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from toolBox import SHEET_COLUMNS
+
+FORMAT_VERSION = 1
+MANIFEST = 'manifest.json'
+KIND_SUFFIX = '\x00kind'
+
+# Per-value kind codes for object columns
+_NULL, _STR, _INT, _FLOAT, _BOOL = 0, 1, 2, 3, 4
+
+
+class SnapshotError(Exception):
+    """Raised when a sheet cannot be represented in the snapshot format"""
+
+
+def schema_hash():
+    """Hash of the required-column spec; a snapshot built under another spec is stale"""
+    return hashlib.sha256(json.dumps(SHEET_COLUMNS, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def default_dir(xlsx_path):
+    """Snapshot directory for a workbook: BASE_SNAPSHOT_DIR or <stem>.snapshot next to it"""
+    override = os.environ.get('BASE_SNAPSHOT_DIR')
+    if override:
+        return Path(override)
+    xlsx_path = Path(xlsx_path)
+    return xlsx_path.with_name(f'{xlsx_path.stem}.snapshot')
+
+
+def _encode_object(values):
+    kinds = np.empty(len(values), dtype='i1')
+    text = []
+    for i, v in enumerate(values):
+        if v is None or (isinstance(v, float) and np.isnan(v)):
+            kinds[i], s = _NULL, ''
+        elif isinstance(v, (bool, np.bool_)):
+            kinds[i], s = _BOOL, '1' if v else '0'
+        elif isinstance(v, (int, np.integer)):
+            kinds[i], s = _INT, str(int(v))
+        elif isinstance(v, (float, np.floating)):
+            kinds[i], s = _FLOAT, repr(float(v))
+        elif isinstance(v, str):
+            kinds[i], s = _STR, v
+        else:
+            raise SnapshotError(f'unsupported value type {type(v).__name__}')
+        text.append(s)
+    width = max((len(s) for s in text), default=1) or 1
+    return np.array(text, dtype=f'<U{width}'), kinds
+
+
+def _decode_object(text, kinds):
+    out = np.empty(len(kinds), dtype=object)
+    for i, (s, k) in enumerate(zip(text.tolist(), kinds.tolist())):
+        if k == _NULL:
+            out[i] = np.nan
+        elif k == _STR:
+            out[i] = s
+        elif k == _INT:
+            out[i] = int(s)
+        elif k == _FLOAT:
+            out[i] = float(s)
+        else:
+            out[i] = s == '1'
+    return out
+
+
+def frame_to_array(df):
+    """DataFrame -> structured array (one field per column, object columns encoded)"""
+    fields, columns = [], []
+    for col in df.columns:
+        series = df[col]
+        if series.dtype == object:
+            text, kinds = _encode_object(series.tolist())
+            fields += [(col, text.dtype), (col + KIND_SUFFIX, kinds.dtype)]
+            columns += [text, kinds]
+        else:
+            values = series.to_numpy()
+            fields.append((col, values.dtype))
+            columns.append(values)
+    arr = np.empty(len(df), dtype=fields)
+    for (name, _), values in zip(fields, columns):
+        arr[name] = values
+    return arr
+
+
+def array_to_frame(arr, columns):
+    """
+    Structured array -> DataFrame with the original column order and dtypes.
+    Typed columns are views of arr (one block per column, so nothing is copied
+    or consolidated): read-only when arr is memory-mapped read-only.
+    """
+    data = {}
+    for col in columns:
+        kind_field = col + KIND_SUFFIX
+        if kind_field in arr.dtype.names:
+            data[col] = _decode_object(arr[col], arr[kind_field])
+        else:
+            data[col] = np.asarray(arr[col])
+    return pd.DataFrame(data, columns=columns, copy=False)
+
+
+def compile_snapshot(xlsx_path, out_dir=None):
+    """Build the snapshot for xlsx_path; written to a temp dir and renamed into place"""
+    from reference_data import ReferenceData, file_hash
+
+    xlsx_path = Path(xlsx_path)
+    out_dir = Path(out_dir) if out_dir else default_dir(xlsx_path)
+    snapshot = ReferenceData.build(xlsx_path, use_snapshot=False)
+
+    out_dir.parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(tempfile.mkdtemp(prefix=f'.{out_dir.name}.', dir=out_dir.parent))
+    try:
+        sheets = {}
+        for i, (name, df) in enumerate(snapshot.frames.items()):
+            file_name = f'{i}.npy'
+            np.save(tmp_dir / file_name, frame_to_array(df), allow_pickle=False)
+            sheets[name] = {
+                'file': file_name,
+                'rows': len(df),
+                'columns': [str(c) for c in df.columns],
+                'dtypes': [str(t) for t in df.dtypes],
+            }
+        manifest = {
+            'format_version': FORMAT_VERSION,
+            'source': xlsx_path.name,
+            'source_sha256': file_hash(xlsx_path),
+            'schema_sha256': schema_hash(),
+            'sheet_names': snapshot.sheet_names,
+            'missing_columns': snapshot.missing_columns,
+            'sheets': sheets,
+        }
+        with open(tmp_dir / MANIFEST, 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+        # Swap the finished directory into place
+        if out_dir.exists():
+            old = out_dir.with_name(f'.{out_dir.name}.old')
+            shutil.rmtree(old, ignore_errors=True)
+            os.replace(out_dir, old)
+            os.replace(tmp_dir, out_dir)
+            shutil.rmtree(old, ignore_errors=True)
+        else:
+            os.replace(tmp_dir, out_dir)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return out_dir, manifest
+
+
+def load_snapshot(xlsx_path, source_hash, snapshot_dir=None):
+    """
+    Load the snapshot if it is fresh for the workbook content (source_hash) and
+    the current schema; returns the manifest plus {sheet: DataFrame}, or None.
+    """
+    snapshot_dir = Path(snapshot_dir) if snapshot_dir else default_dir(xlsx_path)
+    try:
+        with open(snapshot_dir / MANIFEST) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (manifest.get('format_version') != FORMAT_VERSION
+            or manifest.get('source_sha256') != source_hash
+            or manifest.get('schema_sha256') != schema_hash()):
+        return None
+
+    frames = {}
+    for name, info in manifest['sheets'].items():
+        arr = np.load(snapshot_dir / info['file'], mmap_mode='r', allow_pickle=False)
+        frames[name] = array_to_frame(arr, info['columns'])
+    return manifest, frames
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compile Base.xlsx into a columnar snapshot')
+    parser.add_argument('xlsx', nargs='?', default=os.environ.get('BASE_EXCEL_PATH')
+                        or str(Path(__file__).parent.parent / 'public' / 'sample_data' / 'Base.xlsx'))
+    parser.add_argument('--out', help='snapshot directory (default: <stem>.snapshot next to the workbook)')
+    args = parser.parse_args(argv)
+
+    out_dir, manifest = compile_snapshot(args.xlsx, args.out)
+    print(f"Compiled {args.xlsx} -> {out_dir}")
+    print(f"  source sha256 {manifest['source_sha256'][:12]}, {len(manifest['sheets'])} sheets")
+    for name, info in manifest['sheets'].items():
+        print(f"  {name}: {info['rows']} rows x {len(info['columns'])} columns")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
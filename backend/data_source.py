@@ -0,0 +1,84 @@
+"""
+Optimizer Data Sources
+Where tools reads its sheets from: an .xlsx workbook, or DataFrames already
+in memory (e.g. built straight from the /api/optimize JSON payload).
+"""
+from pathlib import Path
+
+import pandas as pd
+
+
+class ExcelSource:
+    """
+    Reads sheets from an .xlsx workbook.
+
+    load() opens the workbook once in read-only (streaming) mode and parses all
+    requested sheets in that single pass. Sheets that were not preloaded are
+    parsed lazily on their first read(), so optional sheets cost nothing unless
+    a stage actually uses them.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._frames = {}
+        self._sheet_names = None
+
+    def load(self, sheet_names):
+        """Parse every given sheet that exists in one pass over the workbook"""
+        with pd.ExcelFile(self.path, engine='openpyxl') as book:
+            self._sheet_names = list(book.sheet_names)
+            wanted = [s for s in sheet_names if s in self._sheet_names and s not in self._frames]
+            if wanted:
+                self._frames.update(book.parse(wanted))
+
+    def sheet_names(self):
+        if self._sheet_names is None:
+            self.load([])
+        return self._sheet_names
+
+    def has_sheet(self, sheet_name):
+        return sheet_name in self.sheet_names()
+
+    def read(self, sheet_name):
+        """Return the sheet as a DataFrame; raises KeyError if the sheet does not exist"""
+        if sheet_name not in self._frames:
+            if not self.has_sheet(sheet_name):
+                raise KeyError(f"Worksheet named '{sheet_name}' not found")
+            self.load([sheet_name])
+        return self._frames[sheet_name].copy()
+
+
+class FrameSource:
+    """
+    Serves sheets from in-memory DataFrames.
+
+    Sheets not present in frames are looked up in the optional fallback source
+    (typically the Base.xlsx reference workbook).
+    """
+
+    def __init__(self, frames, fallback=None):
+        self.frames = dict(frames)
+        self.fallback = fallback
+
+    def load(self, sheet_names):
+        if self.fallback is not None and hasattr(self.fallback, 'load'):
+            self.fallback.load([s for s in sheet_names if s not in self.frames])
+
+    def has_sheet(self, sheet_name):
+        if sheet_name in self.frames:
+            return True
+        return self.fallback is not None and self.fallback.has_sheet(sheet_name)
+
+    def read(self, sheet_name):
+        if sheet_name in self.frames:
+            return self.frames[sheet_name].copy()
+        if self.fallback is not None:
+            return self.fallback.read(sheet_name)
+        raise KeyError(f"Worksheet named '{sheet_name}' not found")
+
+
+def as_source(source):
+    """Accept a workbook path or an object with read(sheet_name)"""
+    if isinstance(source, (str, Path)):
+        return ExcelSource(source)
+    return source
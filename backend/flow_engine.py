@@ -0,0 +1,178 @@
+"""
+Min-Cost Flow
+Pure NumPy/Python min-cost maximum flow, used by the flow allocation engine
+(tools.optimize_buy_flow).
+
+Primal-dual method: Bellman-Ford, vectorized over the edge arrays, gives the
+shortest-path distances in the residual graph; a Dinic blocking flow then
+saturates every shortest augmenting path of that length at once. Repeat until
+the sink is unreachable (or, for a minimum-cost flow of any amount, until the
+shortest path no longer has a negative cost). Costs must be integers (e.g.
+cents) so distances are exact and reduced costs compare equal to zero reliably.
+"""
+import os
+from collections import deque
+
+import numpy as np
+
+# Largest graph min_cost_flow takes on (edges): about 3 s in pure NumPy/Python,
+# well inside the optimizer pool timeout; larger ones raise FlowTooLarge
+MAX_ARCS = int(os.environ.get('FLOW_MAX_ARCS', 20000))
+
+
+class FlowTooLarge(ValueError):
+    """Raised by min_cost_flow for a graph above max_arcs edges"""
+
+    def __init__(self, arcs, limit):
+        super().__init__(f"Flow graph has {arcs} edges, more than the limit of {limit} (FLOW_MAX_ARCS)")
+        self.arcs = arcs
+        self.limit = limit
+
+
+def _run_starts(keys):
+    """Start index of each run of equal values in a sorted array"""
+    if len(keys) == 0:
+        return np.empty(0, dtype=np.int64)
+    return np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+
+
+def _distances(n_nodes, tails, heads, costs, starts, source):
+    """
+    Bellman-Ford from source; np.inf where unreachable.
+
+    Edges are sorted by head, starts marks where each head's run begins, and
+    edges without residual capacity carry cost np.inf. Called with tails and
+    heads swapped it gives the distances to source instead.
+    """
+    dist = np.full(n_nodes, np.inf)
+    dist[source] = 0.0
+    if len(tails) == 0:
+        return dist
+    targets = heads[starts]
+    for _ in range(n_nodes):
+        best = np.minimum.reduceat(dist[tails] + costs, starts)
+        improved = best < dist[targets]
+        if not improved.any():
+            break
+        dist[targets[improved]] = best[improved]
+    return dist
+
+
+def _blocking_flow(n_nodes, edges, edge_tails, tail, head, residual, source, sink):
+    """
+    Dinic max flow from source to sink restricted to edges (an index array;
+    edge_tails is the tail array as NumPy); updates residual in place and
+    returns the flow pushed and the set of edges whose residual changed.
+    """
+    # Edges grouped by tail (CSR): out-edges of u are flat[first[u]:first[u + 1]]
+    tails = edge_tails[edges]
+    order = np.argsort(tails, kind='stable')
+    flat = edges[order].tolist()
+    first = np.searchsorted(tails[order], np.arange(n_nodes + 1)).tolist()
+
+    total = 0
+    touched = set()
+    while True:
+        # Levels by hop count over edges with capacity left
+        level = [-1] * n_nodes
+        level[source] = 0
+        queue = deque([source])
+        while queue:
+            u = queue.popleft()
+            for i in range(first[u], first[u + 1]):
+                e = flat[i]
+                v = head[e]
+                if residual[e] > 0 and level[v] < 0:
+                    level[v] = level[u] + 1
+                    queue.append(v)
+        if level[sink] < 0:
+            return total, touched
+
+        pointer = first[:-1]
+        while True:
+            # One augmenting path by iterative DFS along increasing levels
+            path = []
+            u = source
+            while u != sink:
+                end = first[u + 1]
+                while pointer[u] < end:
+                    e = flat[pointer[u]]
+                    if residual[e] > 0 and level[head[e]] == level[u] + 1:
+                        break
+                    pointer[u] += 1
+                if pointer[u] < end:
+                    e = flat[pointer[u]]
+                    path.append(e)
+                    u = head[e]
+                elif u == source:
+                    break
+                else:
+                    level[u] = -1  # dead end for this level graph
+                    e = path.pop()
+                    u = tail[e]
+                    pointer[u] += 1
+            if u != sink:
+                break
+            pushed = min(residual[e] for e in path)
+            for e in path:
+                residual[e] -= pushed
+                residual[e ^ 1] += pushed
+                touched.add(e)
+                touched.add(e ^ 1)
+            total += pushed
+
+
+def min_cost_flow(n_nodes, tail, head, capacity, cost, source, sink, max_flow=True, max_arcs=None):
+    """
+    Maximum flow from source to sink of minimum total cost.
+
+    tail/head/capacity/cost describe the directed edges (capacity and cost
+    integers; costs may be negative as long as the graph has no negative cycle).
+    With max_flow=False the flow is not maximized but stops growing once the
+    cheapest augmenting path costs >= 0: the flow of minimum total cost over any
+    amount (shortest path costs only rise, so no later path lowers it).
+    Raises FlowTooLarge above max_arcs edges (default MAX_ARCS; 0 for no limit).
+    Returns (flow per edge, total cost).
+    """
+    m = len(tail)
+    limit = MAX_ARCS if max_arcs is None else max_arcs
+    if limit and m > limit:
+        raise FlowTooLarge(m, limit)
+    u = np.empty(2 * m, dtype=np.int64)
+    v = np.empty(2 * m, dtype=np.int64)
+    c = np.empty(2 * m, dtype=float)
+    r = np.zeros(2 * m, dtype=np.int64)
+    # Edge 2i is edge i, 2i + 1 its residual reverse
+    u[0::2], v[0::2], c[0::2], r[0::2] = tail, head, cost, capacity
+    u[1::2], v[1::2], c[1::2] = head, tail, -np.asarray(cost, dtype=float)
+
+    # Residual edges sorted by head (forward search) and by tail (backward search from the sink)
+    by_head = np.argsort(v, kind='stable')
+    by_tail = np.argsort(u, kind='stable')
+    head_starts = _run_starts(v[by_head])
+    tail_starts = _run_starts(u[by_tail])
+
+    fwd_tails, fwd_heads, fwd_costs = u[by_head], v[by_head], c[by_head]
+    bwd_tails, bwd_heads, bwd_costs = v[by_tail], u[by_tail], c[by_tail]
+
+    # residual (list) is what the Dinic loop updates; r mirrors it for the vectorized searches
+    tail_list, head_list, residual = u.tolist(), v.tolist(), r.tolist()
+    while True:
+        live = r > 0
+        dist = _distances(n_nodes, fwd_tails, fwd_heads, np.where(live[by_head], fwd_costs, np.inf),
+                          head_starts, source)
+        if not np.isfinite(dist[sink]) or (not max_flow and dist[sink] >= 0):
+            break
+        to_sink = _distances(n_nodes, bwd_tails, bwd_heads, np.where(live[by_tail], bwd_costs, np.inf),
+                             tail_starts, sink)
+        # Zero reduced-cost edges that lie on a shortest source -> sink path
+        du = dist[u]
+        admissible = np.flatnonzero(np.isfinite(du) & (du + c == dist[v]) & (dist[v] + to_sink[v] == dist[sink]))
+        pushed, touched = _blocking_flow(n_nodes, admissible, u, tail_list, head_list, residual, source, sink)
+        if not pushed:
+            break
+        touched = np.fromiter(touched, dtype=np.int64, count=len(touched))
+        r[touched] = [residual[e] for e in touched.tolist()]
+
+    flow = r[1::2]
+    return flow, float(np.dot(flow, np.asarray(cost, dtype=float)))
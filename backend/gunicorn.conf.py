@@ -0,0 +1,48 @@
+"""
+Gunicorn configuration (gunicorn -c gunicorn.conf.py wsgi:app)
+
+The app is preloaded in the master, which warms up once (imports, Base.xlsx
+validation, auth database; see warmup.py) and then forks the web workers, which
+inherit the imported modules and the parsed Base.xlsx. Each web worker then
+starts its own optimizer pool in the background: a fork server, which is a
+fresh interpreter and so cannot inherit the master's copy, loads Base.xlsx once
+and forks OPTIMIZER_POOL_SIZE processes that share it; /ready answers 503 until
+it is up.
+"""
+import os
+
+# Optimizer pool workers fork from a server that already imported numpy/pandas
+# and the optimizer (see optimizer_pool.FORKSERVER_PRELOAD)
+os.environ.setdefault('OPTIMIZER_START_METHOD', 'forkserver')
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5001)}"
+preload_app = True
+# Threaded workers: streamed (/api/optimize/stream) and long optimization
+# requests wait on the optimizer pool without blocking the other requests
+worker_class = 'gthread'
+# One web worker: optimization jobs (optimize_jobs) and the result cache live in
+# its memory, so with more workers a job polled through another one is a 404.
+# Each web worker also runs its own optimizer pool, so raise OPTIMIZER_POOL_SIZE
+# (not this) for more parallel optimizations.
+workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+# Optimizations are bounded by OPTIMIZER_JOB_TIMEOUT; leave room for the response
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+accesslog = '-'
+
+
+def post_fork(server, worker):
+    import optimize_excel
+    import optimizer_pool
+    import warmup
+    warmup.after_fork(optimizer_pool.pool, optimize_excel.BASE_PATH, optimize_excel.auth_engine())
+    optimize_excel.start_session_sweeper()
+
+
+def worker_exit(server, worker):
+    import optimize_jobs
+    import optimizer_pool
+    optimize_jobs.jobs.shutdown()
+    optimizer_pool.pool.shutdown()
@@ -1,8 +1,13 @@
+import sys
+
 from optimizer_asml import optimizer
 
 opt = optimizer()
 
-flag = opt.version1()
+# Optional workbook path; defaults to MasterDB.xlsx in the working directory
+workbook = sys.argv[1] if len(sys.argv) > 1 else "MasterDB.xlsx"
+
+flag = opt.write_results(workbook, opt.version1(workbook))
 
 if flag == 1 :
     print("Optimization end ....")
@@ -0,0 +1,104 @@
+"""
+Money Truncation
+Monetary values are reported truncated to whole cents, never rounded up
+(2705.64414 -> 2705.64). Whole columns are converted at once: a vectorized floor
+of |value| * 100 gives int64 cents, exact for every value not within float noise
+of a cent boundary. The few that are (e.g. 1173.1899999999996) are settled by the
+decimal the value stands for, as truncate_value does, so the result equals the
+per-value Decimal path bit for bit while skipping Decimal for every float cell.
+"""
+import math
+from decimal import Decimal, ROUND_DOWN, InvalidOperation, localcontext
+
+import numpy as np
+
+CENT = Decimal('0.01')
+# Cents above this are not all exact in a float: such values take the Decimal path
+MAX_EXACT_CENTS = float(2 ** 53)
+# Relative distance to a cent boundary within which the float floor may be wrong:
+# the value's decimal form (str, or the float read back from at least 16
+# significant digits) is within about 1e-15 of it
+BOUNDARY_TOLERANCE = 1e-13
+
+
+def _decimal_text(v, digits=None):
+    """The decimal a value stands for: str(v), or the str of the float stored at digits"""
+    return str(v) if digits is None else str(float('%.*g' % (digits, v)))
+
+
+def truncate_value(v, digits=None):
+    """
+    Truncate one value to cents with Decimal, never rounding up.
+
+    The value is taken as its str() form or, with digits, as the float read back
+    from it written at that many significant digits: results used to be stored in
+    MasterDB.xlsx (openpyxl writes '%.16g') and read back before truncation, so
+    float noise such as 1173.1899999999996 truncates to 1173.19, and 8217.39 stays
+    8217.39 although '%.16g' of it may end in ...89999. Values Decimal cannot take
+    are floored as floats; anything else is 0.0.
+    """
+    try:
+        with localcontext() as ctx:
+            ctx.prec = 28
+            d = Decimal(_decimal_text(v, digits))
+            return float(d.quantize(CENT, rounding=ROUND_DOWN))
+    except (InvalidOperation, Exception):
+        try:
+            return math.floor(float(v) * 100.0) / 100.0
+        except Exception:
+            return 0.0
+
+
+def _decimal_cents(v, digits=None):
+    """|v| truncated to cents from its decimal form (finite v, |v| * 100 < MAX_EXACT_CENTS)"""
+    whole, _, fraction = _decimal_text(abs(v), digits).partition('.')
+    return int(whole) * 100 + int((fraction + '00')[:2])
+
+
+def to_cents(values, digits=None):
+    """
+    (cents, exact) for a float array: int64 |value| truncated to cents as
+    truncate_value would (digits as there: None or at least 16), and a mask of
+    the values it covers; non-finite and huge values must go through truncate_value.
+
+    Values within float noise of a cent boundary are settled from their decimal form.
+    """
+    values = np.asarray(values, dtype=float)
+    with np.errstate(invalid='ignore', over='ignore'):
+        scaled = np.abs(values) * 100.0
+        floor = np.floor(scaled)
+        exact = np.isfinite(scaled) & (scaled < MAX_EXACT_CENTS)
+        # Integral values have an exact decimal form; others must be clear of the boundary
+        boundary = np.minimum(scaled - floor, floor + 1.0 - scaled)
+        near = exact & (values != np.trunc(values)) & (boundary <= scaled * BOUNDARY_TOLERANCE)
+    cents = np.where(exact, floor, 0.0).astype(np.int64)
+    for i in np.flatnonzero(near):
+        cents[i] = _decimal_cents(values[i], digits)
+    return cents, exact
+
+
+def truncate(values, digits=None):
+    """
+    Truncate a column of monetary values to cents: float64 array equal, element for
+    element, to truncate_value(v, digits).
+
+    Accepts any sequence; elements that are not floats or ints (strings, None,
+    bools) are handled by truncate_value.
+    """
+    if isinstance(values, np.ndarray) and values.dtype.kind == 'f':
+        items = floats = values
+        numeric = np.ones(len(values), dtype=bool)
+    else:
+        items = list(values)
+        numeric = np.fromiter((type(v) in (float, int) or isinstance(v, (np.floating, np.integer))
+                               for v in items), dtype=bool, count=len(items))
+        floats = np.array([float(v) if ok and abs(v) < MAX_EXACT_CENTS else np.nan
+                           for v, ok in zip(items, numeric)], dtype=float)
+
+    cents, exact = to_cents(floats, digits)
+    exact &= numeric
+    # cents / 100 is the float nearest the truncated decimal, as float(Decimal) gives
+    out = np.copysign(cents / 100.0, floats)
+    for i in np.flatnonzero(~exact):
+        out[i] = truncate_value(items[i], digits)
+    return out
@@ -1,21 +1,36 @@
 """
 ASML Buy Back Optimizer - Python Backend
-This script reads data from Base.xlsx, saves System Recommendation data to MasterDB.xlsx,
-runs the optimizer script, and updates Base.xlsx with results.
+This script turns the System Recommendation data from the UI into DataFrames, runs the
+optimizer in memory on a pool of pre-warmed worker processes (reference sheets come from
+Base.xlsx), and returns the results.
 """
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, Response, request, jsonify
 from flask_cors import CORS
 import pandas as pd
-import openpyxl
 from pathlib import Path
+import json
 import logging
-import subprocess
+import queue
 import shutil
 import os
+import math
+import time
 from functools import wraps
 
-app = Flask(__name__)
-CORS(app, supports_credentials=True)
+import numpy as np
+
+import money
+import optimize_jobs
+import optimizer_pool
+import payload_schema
+import reference_data
+import response_format
+import result_cache
+import warmup
+from optimizer_asml import ENGINES
+from workspace import Workspace
+
+api = Blueprint('api', __name__)
 
 # Import auth service
 try:
@@ -42,6 +57,16 @@ if not BASE_PATH.exists():
 
 MASTER_DB_PATH = Path(__file__).parent / 'MasterDB.xlsx'
 
+# Upper bound on the scenarios one /api/optimize/batch request may carry
+BATCH_MAX_SCENARIOS = int(os.environ.get('BATCH_MAX_SCENARIOS', 200))
+
+# Seconds between keep-alive comments on an idle /api/optimize/stream connection
+STREAM_KEEPALIVE = float(os.environ.get('OPTIMIZE_STREAM_KEEPALIVE', 15))
+
+# Margin sensitivity grid ("sensitivity": true) and its size limit, in percent
+SENSITIVITY_DEFAULT_GRID = {'min': 0, 'max': 80, 'step': 1}
+SENSITIVITY_MAX_POINTS = 1001
+
 # Authentication decorator
 def require_auth(f):
     """Decorator to require authentication for endpoints"""
@@ -71,9 +96,21 @@ def require_auth(f):
     return decorated_function
 
 
+def require_admin(f):
+    """Decorator to require an authenticated admin user (403 for other users)"""
+    @wraps(f)
+    @require_auth
+    def decorated_function(*args, **kwargs):
+        if AUTH_ENABLED and not request.user.get('is_admin'):
+            return jsonify({'status': 'error', 'message': 'Admin access required'}), 403
+        return f(*args, **kwargs)
+
+    return decorated_function
+
+
 # ============ Authentication Endpoints ============
 
-@app.route('/api/auth/register', methods=['POST'])
+@api.route('/api/auth/register', methods=['POST'])
 def register():
     """Register a new user account"""
     if not AUTH_ENABLED:
@@ -102,7 +139,7 @@ def register():
         }), 400
 
 
-@app.route('/api/auth/login', methods=['POST'])
+@api.route('/api/auth/login', methods=['POST'])
 def login():
     """Login and create user session"""
     if not AUTH_ENABLED:
@@ -135,7 +172,7 @@ def login():
         }), 401
 
 
-@app.route('/api/auth/logout', methods=['POST'])
+@api.route('/api/auth/logout', methods=['POST'])
 @require_auth
 def logout():
     """Logout and destroy session"""
@@ -156,7 +193,7 @@ def logout():
     return response
 
 
-@app.route('/api/auth/me', methods=['GET'])
+@api.route('/api/auth/me', methods=['GET'])
 @require_auth
 def get_current_user():
     """Get current authenticated user info"""
@@ -169,460 +206,616 @@ def get_current_user():
     })
 
 
+@api.route('/api/auth/cache', methods=['GET'])
+@require_admin
+def auth_cache_stats():
+    """Session validation cache counters: entries, hits, misses, hit rate, invalidations"""
+    if not AUTH_ENABLED:
+        return jsonify({'status': 'error', 'message': 'Authentication not available'}), 503
+    
+    return jsonify({'status': 'success', 'cache': auth_service.session_cache.stats()})
+
+
+@api.route('/api/auth/sweeper', methods=['GET'])
+@require_admin
+def auth_sweeper_stats():
+    """Expired session sweeper: sessions table size and rows purged per sweep"""
+    if not AUTH_ENABLED:
+        return jsonify({'status': 'error', 'message': 'Authentication not available'}), 503
+    
+    return jsonify({'status': 'success', 'sweeper': auth_service.sweeper.stats()})
+
+
 # ============ Main Application Endpoints ============
 
 
-@app.route('/api/optimize', methods=['POST'])
-@app.route('/optimize', methods=['POST'])  # Add route without /api prefix for nginx compatibility
-# @require_auth  # Uncomment to require authentication for optimization
-def optimize():
+# Results are truncated as the float read back from 16 significant digits - how
+# they were stored in and read back from MasterDB.xlsx (see money.truncate_value)
+RESULT_MONEY_DIGITS = 16
+
+
+def _frame_rows(df, truncate_money=False):
+    """DataFrame -> list of row dicts for JSON (NaN becomes None, floats optionally truncated)"""
+    # Float columns are truncated whole; floats in object columns one by one
+    float_columns = {c for c in df.columns if df[c].dtype.kind == 'f'} if truncate_money else set()
+    if float_columns:
+        df = df.copy()
+        for column in float_columns:
+            df[column] = money.truncate(df[column].to_numpy(), RESULT_MONEY_DIGITS)
+    rows = []
+    for record in df.to_dict('records'):
+        row = {}
+        for key, value in record.items():
+            if isinstance(value, float):
+                if math.isnan(value):
+                    value = None
+                elif truncate_money and key not in float_columns:
+                    value = money.truncate_value(value, RESULT_MONEY_DIGITS)
+            row[key] = value
+        rows.append(row)
+    return rows
+
+
+def _result_body(result):
+    """Response fields for a version1 result (monetary values truncated, not rounded)"""
+    return {
+        'outbase_data': _frame_rows(result['out_bb'], truncate_money=True),
+        'outprofit_data': _frame_rows(result['out_tot'], truncate_money=True),
+        'warnings': result['warnings'],
+        'engine': result['engine'],
+        'harvest': result['harvest'],
+        **({'sensitivity': _truncate_curves(result['sensitivity'])} if result.get('sensitivity') else {}),
+    }
+
+
+def _truncate_curves(sensitivity):
+    """margin_curves result with every valuation truncated like the result tables"""
+    def rows(entries, value_key):
+        return [{**entry, value_key: money.truncate(np.asarray(entry[value_key], dtype=float),
+                                                    RESULT_MONEY_DIGITS).tolist()} for entry in entries]
+    return {
+        'margins': sensitivity['margins'],
+        'machines': rows(sensitivity['machines'], 'Recommended BB Price'),
+        'metrics': rows(sensitivity['metrics'], 'Max_BBB_Valuation'),
+    }
+
+
+def _cache_key(frames, engine, margins, version=None):
+    """
+    Result cache key: the normalized input sheets, run options and Base.xlsx version
+    (by default the current one; a result is stored under the version its worker used)
+    """
+    if version is None:
+        version = reference_data.workbook_version(BASE_PATH)
+    return result_cache.request_key(frames, version, engine=engine, margins=margins)
+
+
+def _margin_grid(spec):
+    """
+    Required-margin grid (percent) for a "sensitivity" request, or None when not
+    requested: true for the default grid, a list of margins, or
+    {"min": ..., "max": ..., "step": ...}. Raises ValueError when invalid.
+    """
+    if spec in (None, False, '', '0', 'false'):
+        return None
+    if spec in (True, '1', 'true'):
+        spec = SENSITIVITY_DEFAULT_GRID
+    if isinstance(spec, dict):
+        lo, hi, step = (float(spec.get(k, d)) for k, d in (('min', 0), ('max', 80), ('step', 1)))
+        if step <= 0 or hi < lo:
+            raise ValueError('sensitivity needs min <= max and step > 0')
+        count = int(math.floor((hi - lo) / step + 1e-9)) + 1
+        spec = [lo + i * step for i in range(min(count, SENSITIVITY_MAX_POINTS + 1))]
+    if not isinstance(spec, list) or not spec:
+        raise ValueError('sensitivity must be true, a list of margins or {"min", "max", "step"}')
+    grid = [float(m) for m in spec]
+    if len(grid) > SENSITIVITY_MAX_POINTS:
+        raise ValueError(f'sensitivity grid is limited to {SENSITIVITY_MAX_POINTS} points')
+    if any(not math.isfinite(m) or m < 0 or m > 100 for m in grid):
+        raise ValueError('sensitivity margins must be between 0 and 100')
+    return grid
+
+
+def _payload_frames(data):
     """
-    Optimization endpoint that:
-    1. Copies Base.xlsx to MasterDB.xlsx
-    2. Reads System Recommendation data from frontend
-    3. Saves as User Input1 and User Input2 sheets in MasterDB.xlsx
-    4. Runs the Python optimizer script (main_optimizer.py)
-    5. Copies output sheets (out_bb, out_tot) back to Base.xlsx as OutBase and OutProfit
-    6. Returns success status
+    Build the optimizer's input sheets from a UI payload: User Input1 from
+    systemRecommendation, User Input2 from maxBuyback (plus margin defaults) and the
+    Systems/Modules/Parts demand when sent. Returns {sheet name: DataFrame}; raises
+    payload_schema.PayloadError listing every invalid field.
     """
+    tables, default_margins = payload_schema.parse(data)
+
+    # Step 1: User Input1 from System Recommendation (counts as integers, monetary
+    # values truncated to 2 decimals, probabilities in percent)
+    df_input1 = tables['systemRecommendation']
+    logger.info(f"Created User Input1 with {len(df_input1)} rows and {len(df_input1.columns)} columns")
+    if len(df_input1) > 0:
+        logger.info(f"Sample first row: {df_input1.iloc[0].to_dict()}")
+
+    # Step 2: Prepare User Input2 data - ensure all required metrics exist
+    # Define all required metrics that bb_recom expects
+    required_metrics = [
+        'Refurbishment',
+        'Harvesting - Module',
+        'Harvesting - Parts',
+        'EOL',
+        'Total Without Scrap',
+        'Scrap',
+        'Total With Scrap'
+    ]
+
+    # Incoming rows by metric (a later row for the same metric wins)
+    metrics_dict = {}
+    if 'maxBuyback' in tables:
+        for row in tables['maxBuyback'].to_dict('records'):
+            row['Metric'] = row['Metric'].strip()
+            metrics_dict[row['Metric']] = row
+
+    # Ensure all required metrics exist with defaults
+    for metric in required_metrics:
+        if metric not in metrics_dict:
+            metrics_dict[metric] = {
+                'Metric': metric,
+                'Max_BBB_Valuation': 0,
+                # Default 40% for all metrics; Scrap has no margin requirement
+                'Required Margin': default_margins.get(metric, 0),
+            }
+
+    # Build list in the order of required_metrics to maintain consistent ordering
+    user_input2_data = [metrics_dict[metric] for metric in required_metrics if metric in metrics_dict]
+
+    df_input2 = pd.DataFrame(user_input2_data)
+    logger.info(f"Created User Input2 with {len(df_input2)} rows")
+
+    # Step 3: Systems, Modules, Parts demand data
+    frames = {'User Input1': df_input1, 'User Input2': df_input2}
+    for key in ('systems', 'modules', 'parts'):
+        if key in tables and len(tables[key]) > 0:
+            frames[payload_schema.TABLES[key][0]] = tables[key]
+
+    return frames
+
+
+def run_optimization(data, args=None, headers=None, cancel=None, progress=None):
+    """
+    One optimization request, independent of the Flask request context:
+    1. Reads System Recommendation data from frontend
+    2. Builds User Input1, User Input2 and Systems/Modules/Parts demand as DataFrames
+    3. Runs the optimizer on a pre-warmed worker process, with Base.xlsx supplying
+       the reference sheets (QTC, Scrap, ...) - no MasterDB.xlsx round trip
+    4. Returns out_bb / out_tot results and warnings
+
+    Results are cached by the normalized inputs and the Base.xlsx version (see
+    result_cache); the X-Cache response header says HIT, MISS or BYPASS, and
+    "Cache-Control: no-cache" forces a fresh run.
+
+    The buy allocation engine is chosen with ?engine= or "engine" in the payload:
+    'greedy' (default) or 'flow' (highest total Delta, leaving demand open that only
+    a loss would fill; the response reports the profit gap against greedy, or the
+    fallback to greedy for a graph above FLOW_MAX_ARCS).
+
+    "sensitivity" (or ?sensitivity=1) adds valuation curves over a grid of required
+    margins, from the same run: true for 0-80 % in steps of 1, a list of margins,
+    or {"min", "max", "step"} (see tools.margin_curves).
+
+    With USE_EXCEL_INPUTS the inputs are instead read from a scratch copy of
+    MasterDB.xlsx, which is published back atomically with the output sheets.
+
+    data is the JSON payload, args / headers the query string and headers; cancel
+    is an optional threading.Event that aborts the run (OptimizerCancelled), and
+    progress an optional callback for the optimizer's stage events.
+    Returns (response payload, HTTP status, X-Cache value).
+    """
+    args = args or {}
+    headers = headers or {}
+    ws = None
+    body = None
+    cache_key = None
+    cache_status = 'BYPASS'
     try:
         logger.info(f"Starting optimization, reading from: {BASE_PATH}")
         
-        # Get JSON payload and determine mode
-        data = request.get_json(silent=True) or {}
+        # Determine mode
         use_excel_only = bool(os.environ.get('USE_EXCEL_INPUTS') == '1' or data.get('use_excel_inputs'))
+        engine = args.get('engine') or data.get('engine') or 'greedy'
+        if engine not in ENGINES:
+            return {
+                'status': 'error',
+                'message': f"Unknown engine '{engine}' (expected one of: {', '.join(ENGINES)})"
+            }, 400, cache_status
+        try:
+            margins = _margin_grid(args.get('sensitivity') or data.get('sensitivity'))
+        except (TypeError, ValueError) as e:
+            return {'status': 'error', 'message': f'Invalid sensitivity: {e}'}, 400, cache_status
 
         if use_excel_only:
             logger.info("USE_EXCEL_INPUTS enabled: reading inputs directly from MasterDB.xlsx and skipping UI write.")
+            # Scratch copy of MasterDB.xlsx for this request only; published atomically at the end
+            ws = Workspace.create()
+            master_path = ws.master_db
             # If a source Master Excel is provided, copy it first
             master_src = os.environ.get('MASTER_EXCEL_PATH')
             if master_src and Path(master_src).exists():
-                logger.info(f"Copying MASTER_EXCEL_PATH from {master_src} -> {MASTER_DB_PATH}")
-                shutil.copy2(master_src, MASTER_DB_PATH)
-            elif not MASTER_DB_PATH.exists():
-                return jsonify({
+                logger.info(f"Copying MASTER_EXCEL_PATH from {master_src} -> {master_path}")
+                shutil.copy2(master_src, master_path)
+            elif MASTER_DB_PATH.exists():
+                shutil.copy2(MASTER_DB_PATH, master_path)
+            else:
+                return {
                     'status': 'error',
                     'message': 'MasterDB.xlsx not found. Provide MASTER_EXCEL_PATH or create MasterDB.xlsx with required sheets.'
-                }), 400
+                }, 400, cache_status
+
+            logger.info("Running optimizer on worker pool...")
+            result = optimizer_pool.pool.run(optimizer_pool.run_workbook, master_path, cancel=cancel,
+                                             on_event=progress, progress=progress is not None,
+                                             engine=engine, margins=margins)
+            ws.publish(MASTER_DB_PATH)
+            logger.info(f"Saved results to: {MASTER_DB_PATH}")
         else:
-            # Standard flow: accept UI payload and persist to MasterDB.xlsx
+            # Standard flow: accept UI payload and hand it to the optimizer in memory
             if 'systemRecommendation' not in data:
-                return jsonify({
+                return {
                     'status': 'error',
                     'message': 'Missing systemRecommendation data in request'
-                }), 400
-
-            system_rec_data = data['systemRecommendation']
-            logger.info(f"Received System Recommendation data with {len(system_rec_data)} rows")
-
-            if len(system_rec_data) > 0:
-                logger.info(f"First row sample: {system_rec_data[0]}")
-
-            # Step 1: Copy ALL sheets from Base.xlsx to MasterDB.xlsx
-            logger.info("Copying all sheets from Base.xlsx to MasterDB.xlsx...")
-            import openpyxl
-            wb_base = openpyxl.load_workbook(BASE_PATH)
-            wb_master = openpyxl.Workbook()
-            # Remove default sheet
-            if 'Sheet' in wb_master.sheetnames:
-                std = wb_master['Sheet']
-                wb_master.remove(std)
-            for sheet in wb_base.sheetnames:
-                ws_base = wb_base[sheet]
-                ws_master = wb_master.create_sheet(title=sheet)
-                for row in ws_base.iter_rows(values_only=True):
-                    ws_master.append(row)
-            wb_master.save(MASTER_DB_PATH)
-
-            # Step 2: Prepare User Input1 data from System Recommendation
-            user_input1_data = []
-            for row in system_rec_data:
-                prob = row.get('deal_outcome_probability', 0)
-                if isinstance(prob, (int, float)) and prob <= 1:
-                    prob = prob * 100
-
-                # Preserve two decimal precision for monetary values; keep counts as integers
-                def to_int(v):
-                    try:
-                        return int(float(v))
-                    except Exception:
-                        return 0
-                # Monetary values must be truncated to 2 decimals (no rounding up)
-                # Example: 2705.64414542864 -> 2705.64 (NOT 2705.65/2706)
-                def to_money(v):
-                    try:
-                        from decimal import Decimal, ROUND_DOWN, InvalidOperation, localcontext
-                        with localcontext() as ctx:
-                            ctx.prec = 28
-                            d = Decimal(str(v))
-                            return float(d.quantize(Decimal('0.01'), rounding=ROUND_DOWN))
-                    except (InvalidOperation, Exception):
-                        try:
-                            # Fallback: truncate using math for non-decimal-friendly inputs
-                            import math
-                            f = float(v)
-                            return math.floor(f * 100.0) / 100.0
-                        except Exception:
-                            return 0.0
-                user_input1_data.append({
-                    'Machine type': row.get('machine_type', ''),
-                    'Offered Bundle': to_int(row.get('offered_bundle', 0)),
-                    'QTC average BB price': to_money(row.get('qtc_avg_bb_price', 0)),
-                    'Units in sales pipeline': to_int(row.get('units_in_sales_pipeline', 0)),
-                    'Deal outcome probability': prob,
-                    'Expected pipeline units': to_int(row.get('expected_pipeline_units', 0)),
-                    'Units in qualified inventory': to_int(row.get('units_in_qualified_inventory', 0)),
-                    'Recommended from other inventory': to_int(row.get('recommended_from_other_inventory', 0)),
-                    'Recommended Buy for 12 M': to_int(row.get('recommended_buy_12m', 0)),
-                    'Required margin (%)': to_int(row.get('required_margin', 0)),
-                    'Recommended BB Price on Bundle (K)': to_money(row.get('recommended_bb_price_on_bundle', 0))
-                })
-
-            df_input1 = pd.DataFrame(user_input1_data)
-            logger.info(f"Created User Input1 with {len(df_input1)} rows and {len(df_input1.columns)} columns")
-            logger.info(f"Columns: {list(df_input1.columns)}")
-            if len(df_input1) > 0:
-                logger.info(f"Sample first row: {df_input1.iloc[0].to_dict()}")
-
-            # Step 3: Prepare User Input2 data - ensure all required metrics exist
-            max_buyback_data = data.get('maxBuyback', [])
-            
-            # Define all required metrics that bb_recom expects
-            required_metrics = [
-                'Refurbishment',
-                'Harvesting - Module',
-                'Harvesting - Parts',
-                'EOL',
-                'Total Without Scrap',
-                'Scrap',
-                'Total With Scrap'
-            ]
-            
-            # Build a dictionary from incoming data
-            metrics_dict = {}
-            if max_buyback_data and len(max_buyback_data) > 0:
-                for row in max_buyback_data:
-                    metric = str(row.get('metric', '')).strip()
-                    required_margin_val = row.get('required_margin', 0)
-                    try:
-                        required_margin = int(float(required_margin_val)) if required_margin_val not in [None, ''] else 0
-                    except Exception:
-                        required_margin = 0
-                    metrics_dict[metric] = {
-                        'Metric': metric,
-                        'Max_BBB_Valuation': int(float(row.get('valuation', 0))) if row.get('valuation', 0) not in [None, ''] else 0,
-                        'Required Margin': required_margin
-                    }
-            
-            # Ensure all required metrics exist with defaults
-            for metric in required_metrics:
-                if metric not in metrics_dict:
-                    default_margin = 40  # Default 40% for all metrics
-                    if metric == 'Refurbishment':
-                        default_margin = int(float(data.get('refurbishmentMargin', 40)))
-                    elif metric == 'Harvesting - Module':
-                        default_margin = int(float(data.get('harvestingModuleMargin', 40)))
-                    elif metric == 'Harvesting - Parts':
-                        default_margin = int(float(data.get('harvestingPartsMargin', 40)))
-                    elif metric == 'EOL':
-                        default_margin = int(float(data.get('eolMargin', 40)))
-                    elif metric == 'Total Without Scrap':
-                        default_margin = int(float(data.get('totalWithoutScrapMargin', 40)))
-                    elif metric == 'Total With Scrap':
-                        default_margin = int(float(data.get('totalWithScrapMargin', 40)))
-                    elif metric == 'Scrap':
-                        default_margin = 0  # Scrap has no margin requirement
-                    metrics_dict[metric] = {
-                        'Metric': metric,
-                        'Max_BBB_Valuation': 0,
-                        'Required Margin': default_margin
-                    }
-            
-            # Build list in the order of required_metrics to maintain consistent ordering
-            user_input2_data = [metrics_dict[metric] for metric in required_metrics if metric in metrics_dict]
-
-            df_input2 = pd.DataFrame(user_input2_data)
-            logger.info(f"Created User Input2 with {len(df_input2)} rows")
-
-            # Step 3.5: Save Systems, Modules, Parts demand data to MasterDB.xlsx
-            systems_data = data.get('systems', [])
-            modules_data = data.get('modules', [])
-            parts_data = data.get('parts', [])
-
-            systems_list = [{
-                'System': row.get('item', ''),
-                'Demand_12M': int(float(row.get('demand_12m', 0))),
-                'Demand_24M': int(float(row.get('demand_24m', 0))),
-                'Qinventory_12M': int(float(row.get('finished_12m', 0))),
-                'Qinventory_24M': int(float(row.get('finished_24m', 0)))
-            } for row in systems_data]
-
-            modules_list = [{
-                'Module': row.get('item', ''),
-                'Demand_12M': int(float(row.get('demand_12m', 0))),
-                'Demand_24M': int(float(row.get('demand_24m', 0))),
-                'Qinventory_12M': int(float(row.get('finished_12m', 0))),
-                'Qinventory_24M': int(float(row.get('finished_24m', 0)))
-            } for row in modules_data]
-
-            parts_list = [{
-                'Module': row.get('item', ''),
-                'Demand_12M': int(float(row.get('demand_12m', 0))),
-                'Demand_24M': int(float(row.get('demand_24m', 0))),
-                'Qinventory_12M': int(float(row.get('finished_12m', 0))),
-                'Qinventory_24M': int(float(row.get('finished_24m', 0)))
-            } for row in parts_data]
-
-            df_systems = pd.DataFrame(systems_list)
-            df_modules = pd.DataFrame(modules_list)
-            df_parts = pd.DataFrame(parts_list)
-
-            with pd.ExcelWriter(MASTER_DB_PATH, engine='openpyxl', mode='a', if_sheet_exists='replace') as writer:
-                df_input1.to_excel(writer, sheet_name='User Input1', index=False)
-                df_input2.to_excel(writer, sheet_name='User Input2', index=False)
-                if len(df_systems) > 0:
-                    df_systems.to_excel(writer, sheet_name='Systems', index=False)
-                if len(df_modules) > 0:
-                    df_modules.to_excel(writer, sheet_name='Modules', index=False)
-                if len(df_parts) > 0:
-                    df_parts.to_excel(writer, sheet_name='Parts', index=False)
-            logger.info("Saved all data to MasterDB.xlsx")
-        
-        # Step 5: Run the optimizer script
-        logger.info("Running optimizer script...")
-        
-        # Detect platform and set correct Python path
-        import platform
-        import sys
-        
-        optimizer_script = Path(__file__).parent / 'main_optimizer.py'
-        
-        # On Windows, use shell=True to avoid Win32 application error
-        if platform.system() == 'Windows':
-            logger.info(f"Running on Windows with Python: {sys.executable}")
-            logger.info(f"Optimizer script: {optimizer_script}")
-            
-            result = subprocess.run(
-                f'"{sys.executable}" "{optimizer_script}"',
-                shell=True,
-                cwd=str(Path(__file__).parent),
-                capture_output=True,
-                text=True,
-                timeout=60
-            )
+                }, 400, cache_status
+
+            try:
+                frames = _payload_frames(data)
+            except payload_schema.PayloadError as e:
+                return {'status': 'error', 'message': str(e), 'errors': e.errors}, 400, cache_status
+            df_input1, df_input2 = frames['User Input1'], frames['User Input2']
+
+            # Same normalized inputs on the same Base.xlsx: reuse the earlier result
+            if result_cache.cache.enabled:
+                cache_key = _cache_key(frames, engine, margins)
+                if headers.get('Cache-Control', '').lower() != 'no-cache':
+                    body = result_cache.cache.get(cache_key)
+                    cache_status = 'HIT' if body is not None else 'MISS'
+
+            if body is None:
+                # Step 4: Run the optimizer on the pre-warmed worker pool; sheets not sent
+                # (QTC, Scrap, CoreQInventory, ...) come from the worker's cached Base.xlsx data
+                logger.info("Running optimizer on worker pool...")
+                result = optimizer_pool.pool.run(optimizer_pool.run_frames, frames, str(BASE_PATH), cancel=cancel,
+                                                 on_event=progress, progress=progress is not None,
+                                                 engine=engine, margins=margins)
+
+        if body is None:
+            logger.info("Optimizer finished")
+            for timing in result['harvest']:
+                logger.info(f"Harvest {timing['machine']} (group {timing['group']}): "
+                            f"{timing['harvested']:g} units in {timing['seconds'] * 1000:.1f} ms")
+            # Step 5: Convert result tables for the frontend (monetary values truncated, not rounded)
+            body = _result_body(result)
+            if cache_key is not None:
+                result_cache.cache.put(_cache_key(frames, engine, margins, result['reference_version']), body)
         else:
-            # Unix-like systems (Mac, Linux) - use list format
-            python_path = sys.executable
-            venv_python = Path(__file__).parent.parent / '.venv' / 'bin' / 'python'
-            if venv_python.exists():
-                python_path = str(venv_python)
-            
-            logger.info(f"Running on {platform.system()} with Python: {python_path}")
-            logger.info(f"Optimizer script: {optimizer_script}")
-            
-            result = subprocess.run(
-                [python_path, str(optimizer_script)],
-                cwd=str(Path(__file__).parent),
-                capture_output=True,
-                text=True,
-                timeout=60
-            )
-        
-        if result.returncode != 0:
-            logger.error(f"Optimizer script failed: {result.stderr}")
-            return jsonify({
-                'status': 'error',
-                'message': f'Optimizer script failed: {result.stderr}'
-            }), 500
-        
-        logger.info(f"Optimizer output: {result.stdout}")
-        
-        # Step 6: Read output sheets from MasterDB.xlsx (no changes to Base.xlsx)
-        logger.info("Reading output sheets from MasterDB.xlsx...")
-        
-        # Close and reopen the workbook to ensure optimizer changes are visible
-        import time
-        time.sleep(0.5)  # Give file system a moment to sync
-        
-        master_wb = openpyxl.load_workbook(MASTER_DB_PATH)
-        
-        # Debug: Log all available sheets
-        logger.info(f"All sheets in MasterDB.xlsx: {master_wb.sheetnames}")
-        
-        # Find the generated output sheets (look for out_bb variations: out_bb, out_bb1, Out_BB, etc.)
-        out_bb_sheet_name = None
-        out_tot_sheet_name = None
-        
-        for sheet in master_wb.sheetnames:
-            if sheet.lower().startswith('out_bb') or sheet.lower() == 'out_bb':
-                out_bb_sheet_name = sheet
-            if sheet.lower().startswith('out_tot') or sheet.lower() == 'out_tot':
-                out_tot_sheet_name = sheet
-        
-        logger.info(f"Found output sheets - OutBase: {out_bb_sheet_name}, OutProfit: {out_tot_sheet_name}")
-        
-        # Read User Input1 data to return to frontend (System Recommendation green columns)
-        user_input1_data = []
-        if 'User Input1' in master_wb.sheetnames:
-            input1_ws = master_wb['User Input1']
-            # Read header row
-            headers = [cell.value for cell in input1_ws[1]]
-            # Read data rows
-            for row in input1_ws.iter_rows(min_row=2, values_only=True):
-                row_dict = {}
-                for idx, value in enumerate(row):
-                    if idx < len(headers) and headers[idx]:
-                        row_dict[headers[idx]] = value
-                user_input1_data.append(row_dict)
-            logger.info(f"Read {len(user_input1_data)} rows from User Input1")
-        
-        # Read User Input2 data to return to frontend (Max Buy Back required margins)
-        user_input2_data = []
-        if 'User Input2' in master_wb.sheetnames:
-            input2_ws = master_wb['User Input2']
-            # Read header row
-            headers = [cell.value for cell in input2_ws[1]]
-            # Read data rows
-            for row in input2_ws.iter_rows(min_row=2, values_only=True):
-                row_dict = {}
-                for idx, value in enumerate(row):
-                    if idx < len(headers) and headers[idx]:
-                        row_dict[headers[idx]] = value
-                user_input2_data.append(row_dict)
-            logger.info(f"Read {len(user_input2_data)} rows from User Input2")
-        
-        # Read OutBase data to return to frontend (System Recommendation yellow columns)
-        # Use the original generated sheet name (out_bb1, out_bb, etc.)
-        outbase_data = []
-        if out_bb_sheet_name and out_bb_sheet_name in master_wb.sheetnames:
-            # Helper function to truncate monetary values (NOT round)
-            def to_money_outbase(v):
-                try:
-                    from decimal import Decimal, ROUND_DOWN, InvalidOperation, localcontext
-                    with localcontext() as ctx:
-                        ctx.prec = 28
-                        d = Decimal(str(v))
-                        return float(d.quantize(Decimal('0.01'), rounding=ROUND_DOWN))
-                except (InvalidOperation, Exception):
-                    try:
-                        import math
-                        f = float(v)
-                        return math.floor(f * 100.0) / 100.0
-                    except Exception:
-                        return 0.0
-            
-            outbase_ws = master_wb[out_bb_sheet_name]
-            # Read header row
-            headers = [cell.value for cell in outbase_ws[1]]
-            # Read data rows
-            for row in outbase_ws.iter_rows(min_row=2, values_only=True):
-                row_dict = {}
-                for idx, value in enumerate(row):
-                    if idx < len(headers) and headers[idx]:
-                        # Truncate monetary values to 2 decimals (NO rounding)
-                        if isinstance(value, (int, float)) and not isinstance(value, bool):
-                            if isinstance(value, float):
-                                row_dict[headers[idx]] = to_money_outbase(value)
-                            else:
-                                row_dict[headers[idx]] = value
-                        else:
-                            row_dict[headers[idx]] = value
-                outbase_data.append(row_dict)
-            logger.info(f"Read {len(outbase_data)} rows from {out_bb_sheet_name}")
-        
-        # Read OutProfit data to return to frontend (Max Buy Back and Expected Profit tables)
-        # Use the original generated sheet name (out_tot1, out_tot, etc.)
-        outprofit_data = []
-        if out_tot_sheet_name and out_tot_sheet_name in master_wb.sheetnames:
-            # Helper function to truncate monetary values (NOT round)
-            def to_money(v):
-                try:
-                    from decimal import Decimal, ROUND_DOWN, InvalidOperation, localcontext
-                    with localcontext() as ctx:
-                        ctx.prec = 28
-                        d = Decimal(str(v))
-                        return float(d.quantize(Decimal('0.01'), rounding=ROUND_DOWN))
-                except (InvalidOperation, Exception):
-                    try:
-                        import math
-                        f = float(v)
-                        return math.floor(f * 100.0) / 100.0
-                    except Exception:
-                        return 0.0
-            
-            outprofit_ws = master_wb[out_tot_sheet_name]
-            # Read header row
-            headers = [cell.value for cell in outprofit_ws[1]]
-            # Read data rows
-            for row in outprofit_ws.iter_rows(min_row=2, values_only=True):
-                row_dict = {}
-                for idx, value in enumerate(row):
-                    if idx < len(headers) and headers[idx]:
-                        # Truncate monetary values to 2 decimals (NO rounding)
-                        if isinstance(value, (int, float)) and not isinstance(value, bool):
-                            if isinstance(value, float):
-                                row_dict[headers[idx]] = to_money(value)
-                            else:
-                                row_dict[headers[idx]] = value
-                        else:
-                            row_dict[headers[idx]] = value
-                outprofit_data.append(row_dict)
-            logger.info(f"Read {len(outprofit_data)} rows from {out_tot_sheet_name}")
-        
-        # Optional warnings sheet
-        warnings_list = []
-        if 'warnings' in master_wb.sheetnames:
-            warn_ws = master_wb['warnings']
-            headers = [cell.value for cell in warn_ws[1]]
-            for row in warn_ws.iter_rows(min_row=2, values_only=True):
-                w = {}
-                for idx, value in enumerate(row):
-                    if idx < len(headers) and headers[idx]:
-                        w[headers[idx]] = value
-                warnings_list.append(w)
-
-        master_wb.close()
-        
-        logger.info(f"Saved results to: {MASTER_DB_PATH}")
-        
+            logger.info("Served optimization result from the result cache")
+
         response = {
             'status': 'success',
-            'message': 'Optimization completed successfully. Results saved to MasterDB.xlsx',
-            'output_file': 'MasterDB.xlsx',
-            'outbase_data': outbase_data,
-            'outprofit_data': outprofit_data,
-            'warnings': warnings_list
+            'message': 'Optimization completed successfully',
+            **body,
         }
+        logger.info(f"Optimizer returned {len(response['outbase_data'])} out_bb rows and "
+                    f"{len(response['outprofit_data'])} out_tot rows")
 
-        # Only include input echoes if we wrote them from UI
-        if not use_excel_only:
+        if use_excel_only:
+            response.update({
+                'message': 'Optimization completed successfully. Results saved to MasterDB.xlsx',
+                'output_file': 'MasterDB.xlsx',
+            })
+        else:
+            # Echo the inputs the optimizer actually used (System Recommendation green columns
+            # and Max Buy Back required margins); no sheet is written in this mode
             response.update({
-                'sheets_updated': ['User Input1', 'User Input2', 'OutBase', 'OutProfit'],
-                'user_input1_data': user_input1_data,
-                'user_input2_data': user_input2_data,
+                'user_input1_data': _frame_rows(df_input1),
+                'user_input2_data': _frame_rows(df_input2),
             })
 
-        return jsonify(response)
-        
-    except subprocess.TimeoutExpired:
-        logger.error("Optimizer script timed out")
-        return jsonify({
+        return response, 200, cache_status
+
+    except optimizer_pool.OptimizerCancelled:
+        logger.info("Optimization cancelled")
+        raise
+    except optimizer_pool.OptimizerTimeout as e:
+        logger.error(f"Optimizer timed out: {e}")
+        return {
             'status': 'error',
-            'message': 'Optimization timed out after 60 seconds'
-        }), 500
+            'message': str(e)
+        }, 500, cache_status
+    except optimizer_pool.OptimizerError as e:
+        logger.error(f"Optimizer failed: {e}\n{e.worker_traceback}")
+        return {
+            'status': 'error',
+            'message': f'Optimizer failed: {e}'
+        }, 500, cache_status
     except Exception as e:
         logger.error(f"Optimization failed: {str(e)}", exc_info=True)
-        return jsonify({
+        return {
             'status': 'error',
             'message': str(e)
-        }), 500
+        }, 500, cache_status
+    finally:
+        if ws is not None:
+            ws.cleanup()
+
+
+@api.route('/api/optimize', methods=['POST'])
+@api.route('/optimize', methods=['POST'])  # Add route without /api prefix for nginx compatibility
+# @require_auth  # Uncomment to require authentication for optimization
+def optimize():
+    """
+    Synchronous optimization: runs run_optimization for this request and returns its
+    result, as row objects or in the format the client asks for (see response_format)
+    """
+    try:
+        response_format.negotiate(request)
+    except response_format.FormatError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), e.status
+    payload, status, cache_status = run_optimization(request.get_json(silent=True) or {},
+                                                     request.args, request.headers)
+    response = response_format.respond(payload, status, request)
+    response.headers['X-Cache'] = cache_status
+    return response
+
+
+def _job_response(job, status=200):
+    body = {'status': 'success', 'job': job.to_dict()}
+    if job.state in optimize_jobs.FINISHED:
+        body['result'] = job.result
+    return response_format.respond(body, status, request, arrow=False), status
+
+
+@api.route('/api/optimize/jobs', methods=['POST'])
+@api.route('/optimize/jobs', methods=['POST'])
+# @require_auth  # Uncomment to require authentication for optimization
+def optimize_job_submit():
+    """
+    Start an optimization in the background and return its job id at once (202).
+
+    Same payload and query parameters as /api/optimize. Poll
+    GET /api/optimize/jobs/<id> for the state (queued, running, succeeded, failed,
+    cancelled) and, once finished, the /api/optimize response as "result";
+    DELETE cancels it.
+    """
+    data = request.get_json(silent=True) or {}
+    args = request.args.to_dict()
+    headers = {'Cache-Control': request.headers.get('Cache-Control', '')}
+
+    def run(cancel):
+        payload, status, _ = run_optimization(data, args, headers, cancel=cancel)
+        return payload, status
+
+    try:
+        job = optimize_jobs.jobs.submit(run)
+    except optimize_jobs.JobQueueFull as e:
+        return jsonify({'status': 'error', 'message': f'Too many pending optimizations: {e}'}), 503
+    logger.info(f"Queued optimization job {job.id}")
+    response, status = _job_response(job, 202)
+    response.headers['Location'] = f'/api/optimize/jobs/{job.id}'
+    return response, status
+
+
+def _sse(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload, default=str)}\n\n"
+
+
+def _stage_event(event):
+    """Optimizer progress event as sent to the client (partial tables as truncated rows)"""
+    event = dict(event, elapsed_seconds=round(event['elapsed_seconds'], 3))
+    if 'out_bb' in event:
+        event['out_bb'] = _frame_rows(event['out_bb'], truncate_money=True)
+    return event
 
-@app.route('/health', methods=['GET'])
+
+@api.route('/api/optimize/stream', methods=['POST'])
+@api.route('/optimize/stream', methods=['POST'])
+# @require_auth  # Uncomment to require authentication for optimization
+def optimize_stream():
+    """
+    Run an optimization and stream its progress as server-sent events.
+
+    Same payload and query parameters as /api/optimize. Events: "job" (the job id,
+    also pollable under /api/optimize/jobs), one "stage" per finished optimizer
+    stage (load, req_demand, optimize_buy, optimize_harvest, scrap_pro, bb_recom
+    with the out_bb rows) with elapsed seconds and row counts, plus "write" with the
+    sheets saved when USE_EXCEL_INPUTS writes MasterDB.xlsx (in-memory runs write
+    no sheet), then "result" with the /api/optimize response or "error". A result
+    served from the result cache has no stage events. Comment lines keep the
+    connection alive while a stage runs. Closing the stream cancels the run.
+    """
+    data = request.get_json(silent=True) or {}
+    args = request.args.to_dict()
+    headers = {'Cache-Control': request.headers.get('Cache-Control', '')}
+    events = queue.Queue()
+
+    def run(cancel):
+        try:
+            payload, status, cache_status = run_optimization(
+                data, args, headers, cancel=cancel, progress=lambda event: events.put(('stage', _stage_event(event))))
+        except optimizer_pool.OptimizerCancelled:
+            events.put(('error', {'status': 'error', 'message': 'Optimization cancelled'}))
+            raise
+        except Exception as e:
+            events.put(('error', {'status': 'error', 'message': str(e)}))
+            raise
+        events.put(('result' if status < 400 else 'error', dict(payload, cache=cache_status)))
+        return payload, status
+
+    try:
+        job = optimize_jobs.jobs.submit(run)
+    except optimize_jobs.JobQueueFull as e:
+        return jsonify({'status': 'error', 'message': f'Too many pending optimizations: {e}'}), 503
+    logger.info(f"Streaming optimization job {job.id}")
+
+    def stream():
+        try:
+            yield _sse('job', job.to_dict())
+            while True:
+                try:
+                    event, payload = events.get(timeout=STREAM_KEEPALIVE)
+                except queue.Empty:
+                    if job.state in optimize_jobs.FINISHED and events.empty():
+                        # Cancelled before it started: no events will come
+                        yield _sse('error', job.result)
+                        return
+                    yield ': keep-alive\n\n'
+                    continue
+                yield _sse(event, payload)
+                if event != 'stage':
+                    return
+        finally:
+            # Client gone (or done): stop a run nobody is listening to
+            optimize_jobs.jobs.cancel(job.id)
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@api.route('/api/optimize/jobs/<job_id>', methods=['GET'])
+@api.route('/optimize/jobs/<job_id>', methods=['GET'])
+def optimize_job_status(job_id):
+    """State of an optimization job, plus its result once finished"""
+    job = optimize_jobs.jobs.get(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': 'Unknown or expired job'}), 404
+    return _job_response(job)
+
+
+@api.route('/api/optimize/jobs/<job_id>', methods=['DELETE'])
+@api.route('/optimize/jobs/<job_id>', methods=['DELETE'])
+def optimize_job_cancel(job_id):
+    """Cancel a queued or running optimization job"""
+    job = optimize_jobs.jobs.get(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': 'Unknown or expired job'}), 404
+    if job.state in optimize_jobs.FINISHED:
+        return jsonify({'status': 'error', 'message': f'Job already {job.state}', 'job': job.to_dict()}), 409
+    optimize_jobs.jobs.cancel(job_id)
+    logger.info(f"Cancelling optimization job {job_id}")
+    return _job_response(job)
+
+@api.route('/api/optimize/batch', methods=['POST'])
+@api.route('/optimize/batch', methods=['POST'])
+# @require_auth  # Uncomment to require authentication for optimization
+def optimize_batch():
+    """
+    Run many scenario variants of a deal in one request.
+
+    Body: {"scenarios": [{"id": ..., <optimize payload>}, ...], "engine": ...}
+    (or "scenarios" as {id: payload}). Every scenario is a /api/optimize payload;
+    "engine" and "sensitivity" are defaults for scenarios that do not set their
+    own. Cached results are reused (see result_cache); the rest are spread over
+    the optimizer worker pool, whose workers already hold the parsed Base.xlsx
+    reference data. The response has one entry per scenario id: the usual result
+    fields, or status "error" with a message. ?format=columnar is supported (see
+    response_format).
+    """
+    try:
+        response_format.negotiate(request, arrow=False)
+    except response_format.FormatError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), e.status
+    data = request.get_json(silent=True) or {}
+    scenarios = data.get('scenarios')
+    if isinstance(scenarios, dict):
+        scenarios = [dict(payload, id=key) for key, payload in scenarios.items()]
+    if not isinstance(scenarios, list) or not scenarios:
+        return jsonify({'status': 'error', 'message': 'Missing scenarios list in request'}), 400
+    if len(scenarios) > BATCH_MAX_SCENARIOS:
+        return jsonify({
+            'status': 'error',
+            'message': f'Too many scenarios ({len(scenarios)}); the limit is {BATCH_MAX_SCENARIOS}'
+        }), 400
+
+    default_engine = request.args.get('engine') or data.get('engine') or 'greedy'
+    results, jobs, ids, keys = {}, [], [], []
+    for i, payload in enumerate(scenarios):
+        scenario_id = str(payload.get('id', i)) if isinstance(payload, dict) else str(i)
+        if scenario_id in results or scenario_id in ids:
+            return jsonify({'status': 'error', 'message': f"Duplicate scenario id '{scenario_id}'"}), 400
+        if not isinstance(payload, dict) or 'systemRecommendation' not in payload:
+            results[scenario_id] = {'status': 'error', 'message': 'Missing systemRecommendation data in scenario'}
+            continue
+        engine = payload.get('engine') or default_engine
+        if engine not in ENGINES:
+            results[scenario_id] = {
+                'status': 'error',
+                'message': f"Unknown engine '{engine}' (expected one of: {', '.join(ENGINES)})"
+            }
+            continue
+        try:
+            margins = _margin_grid(payload.get('sensitivity', data.get('sensitivity')))
+            frames = _payload_frames(payload)
+        except payload_schema.PayloadError as e:
+            results[scenario_id] = {'status': 'error', 'message': f'Invalid scenario: {e}', 'errors': e.errors}
+            continue
+        except Exception as e:
+            results[scenario_id] = {'status': 'error', 'message': f'Invalid scenario: {e}'}
+            continue
+        key = _cache_key(frames, engine, margins) if result_cache.cache.enabled else None
+        body = result_cache.cache.get(key) if key is not None else None
+        if body is not None:
+            results[scenario_id] = {'status': 'success', **body}
+            continue
+        ids.append(scenario_id)
+        keys.append(key)
+        jobs.append(((frames, str(BASE_PATH)), {'engine': engine, 'margins': margins}))
+
+    logger.info(f"Running {len(jobs)} scenario(s) on {optimizer_pool.pool.size} optimizer worker(s)...")
+    started = time.perf_counter()
+    outcomes = optimizer_pool.pool.run_many(optimizer_pool.run_frames, jobs)
+    elapsed = time.perf_counter() - started
+    logger.info(f"Batch of {len(jobs)} scenario(s) finished in {elapsed:.2f}s")
+
+    for scenario_id, key, ((frames, _), options), outcome in zip(ids, keys, jobs, outcomes):
+        if isinstance(outcome, optimizer_pool.OptimizerError):
+            logger.error(f"Scenario {scenario_id} failed: {outcome}\n{outcome.worker_traceback}")
+            results[scenario_id] = {'status': 'error', 'message': f'Optimizer failed: {outcome}'}
+        elif isinstance(outcome, Exception):
+            logger.error(f"Scenario {scenario_id} failed: {outcome}")
+            results[scenario_id] = {'status': 'error', 'message': str(outcome)}
+        else:
+            body = _result_body(outcome)
+            if key is not None:
+                result_cache.cache.put(_cache_key(frames, options['engine'], options['margins'],
+                                                  outcome['reference_version']), body)
+            results[scenario_id] = {'status': 'success', **body}
+
+    failed = sum(1 for r in results.values() if r['status'] != 'success')
+    return response_format.respond({
+        'status': 'success' if not failed else 'partial' if failed < len(results) else 'error',
+        'message': f'{len(results) - failed} of {len(results)} scenario(s) completed',
+        'elapsed_seconds': round(elapsed, 3),
+        'results': results,
+    }, 200, request, arrow=False)
+
+@api.app_errorhandler(413)
+def payload_too_large(e):
+    """JSON body for requests over payload_schema.MAX_BODY_BYTES"""
+    return jsonify({
+        'status': 'error',
+        'message': f'Request body too large; the limit is {payload_schema.MAX_BODY_BYTES} bytes'
+    }), 413
+
+@api.route('/api/optimize/cache', methods=['GET'])
+@require_admin
+def optimize_cache_stats():
+    """Result cache counters: entries, bytes, hits, misses, evictions, expirations"""
+    return jsonify({'status': 'success', 'cache': result_cache.cache.stats()})
+
+@api.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
     return jsonify({'status': 'healthy'})
 
-@app.route('/', methods=['GET'])
+@api.route('/ready', methods=['GET'])
+def ready():
+    """Readiness: 200 once warm-up (imports, Base.xlsx, auth DB, optimizer pool) is done, else 503"""
+    return jsonify(warmup.readiness.to_dict()), 200 if warmup.readiness.ready else 503
+
+@api.route('/', methods=['GET'])
 def home():
     """Root endpoint"""
     return jsonify({
@@ -630,12 +823,55 @@ def home():
         'service': 'ASML Buy Back Optimiser Backend',
         'endpoints': {
             'health': '/health',
-            'optimize': '/api/optimize (POST)'
+            'ready': '/ready',
+            'optimize': '/api/optimize (POST)',
+            'optimize_batch': '/api/optimize/batch (POST)',
+            'optimize_cache': '/api/optimize/cache (GET)',
+            'auth_cache': '/api/auth/cache (GET)',
+            'auth_sweeper': '/api/auth/sweeper (GET)',
+            'optimize_jobs': '/api/optimize/jobs (POST), /api/optimize/jobs/<id> (GET, DELETE)',
+            'optimize_stream': '/api/optimize/stream (POST, text/event-stream)'
         }
     })
 
+def auth_engine():
+    """SQLAlchemy engine of the auth database (None without auth)"""
+    return auth_service.engine if AUTH_ENABLED else None
+
+
+def start_session_sweeper():
+    """Start this process's expired session sweeper (after forking: threads do not survive it)"""
+    if AUTH_ENABLED:
+        auth_service.sweeper.start()
+
+
+def create_app(warm_up=True):
+    """
+    Application factory.
+
+    With warm_up the heavy libraries are imported, Base.xlsx is loaded and
+    validated and the auth database is opened before the app is returned; a
+    pre-forking server should call this once in its master (see wsgi.py and
+    gunicorn.conf.py). The optimizer pool is per process and is warmed separately
+    (warmup.after_fork, or warmup.warm_pool for a single-process server).
+    """
+    app = Flask(__name__)
+    # Larger bodies are refused with 413 before they are parsed
+    app.config['MAX_CONTENT_LENGTH'] = payload_schema.MAX_BODY_BYTES
+    CORS(app, supports_credentials=True)
+    app.register_blueprint(api)
+    if warm_up:
+        logger.info(f"Warming up, Excel file: {BASE_PATH}")
+        warmup.warm_up(BASE_PATH, auth_engine())
+    return app
+
+
 if __name__ == '__main__':
-    logger.info(f"Starting optimizer server, Excel file: {BASE_PATH}")
+    # Development server; production runs gunicorn -c gunicorn.conf.py wsgi:app
+    app = create_app()
+    logger.info(f"Warming up {optimizer_pool.pool.size} optimizer worker(s)...")
+    warmup.warm_pool(optimizer_pool.pool, optimizer_pool.load_reference, str(BASE_PATH), base_path=BASE_PATH)
+    start_session_sweeper()
     # Use 0.0.0.0 to accept connections from Docker network
     # Use port 5001 to match docker-compose configuration
     port = int(os.environ.get('PORT', 5001))
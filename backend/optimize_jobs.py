@@ -0,0 +1,164 @@
+"""
+Asynchronous Optimization Jobs
+Runs optimizations on a bounded background executor so a request returns a job
+id at once instead of holding a web worker for the whole run. Clients poll the
+job for its state and result, or cancel it; a running job is cancelled by
+killing its optimizer worker process (see OptimizerPool.run).
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import optimizer_pool
+
+# Concurrent jobs, queued jobs beyond those, and seconds a finished job is kept
+MAX_WORKERS = int(os.environ.get('OPTIMIZE_JOB_WORKERS', optimizer_pool.POOL_SIZE))
+MAX_PENDING = int(os.environ.get('OPTIMIZE_JOB_QUEUE', 32))
+RETENTION = float(os.environ.get('OPTIMIZE_JOB_RETENTION', 600))
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = 'queued', 'running', 'succeeded', 'failed', 'cancelled'
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class JobQueueFull(Exception):
+    """Raised when MAX_PENDING jobs are already waiting"""
+
+
+def _timestamp(moment):
+    """ISO 8601 form of an aware UTC datetime with a Z suffix (None stays None)"""
+    return moment.isoformat().replace('+00:00', 'Z') if moment else None
+
+
+class Job:
+    """One submitted optimization: its state, timestamps and (once finished) result"""
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.state = QUEUED
+        self.created_at = datetime.now(timezone.utc)
+        self.started_at = None
+        self.finished_at = None
+        self.result = None        # response payload of the run
+        self.http_status = None   # status the synchronous endpoint would have returned
+        self.cancel_event = threading.Event()
+        self.future = None
+        self._finished_clock = None
+
+    def to_dict(self):
+        end = self.finished_at or datetime.now(timezone.utc)
+        return {
+            'id': self.id,
+            'state': self.state,
+            'created_at': _timestamp(self.created_at),
+            'started_at': _timestamp(self.started_at),
+            'finished_at': _timestamp(self.finished_at),
+            'elapsed_seconds': round((end - (self.started_at or end)).total_seconds(), 3),
+        }
+
+
+class JobManager:
+    """
+    Bounded executor plus a registry of jobs.
+
+    submit(fn, *args) runs fn(*args, cancel=event), which returns (payload, http
+    status), on one of max_workers threads; at most max_pending jobs may wait.
+    Finished jobs are dropped retention seconds after they end.
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS, max_pending=MAX_PENDING, retention=RETENTION):
+        self.max_workers = max(1, max_workers)
+        self.max_pending = max_pending
+        self.retention = retention
+        self._executor = None
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='optimize-job')
+        return self._executor
+
+    def submit(self, fn, *args):
+        job = Job()
+        with self._lock:
+            self._prune()
+            pending = sum(1 for j in self._jobs.values() if j.state == QUEUED)
+            if pending >= self.max_pending:
+                raise JobQueueFull(f'{pending} optimization jobs are already queued')
+            self._jobs[job.id] = job
+            job.future = self._pool().submit(self._run, job, fn, args)
+        return job
+
+    def _run(self, job, fn, args):
+        with self._lock:
+            if job.cancel_event.is_set():
+                return
+            job.state = RUNNING
+            job.started_at = datetime.now(timezone.utc)
+        try:
+            payload, status = fn(*args, cancel=job.cancel_event)
+            state = SUCCEEDED if status < 400 else FAILED
+        except optimizer_pool.OptimizerCancelled:
+            payload, status, state = {'status': 'error', 'message': 'Optimization cancelled'}, 409, CANCELLED
+        except Exception as e:
+            payload, status, state = {'status': 'error', 'message': str(e)}, 500, FAILED
+        self._finish(job, state, payload, status)
+
+    def _finish(self, job, state, payload, status):
+        with self._lock:
+            if job.state in FINISHED:
+                return
+            job.state = state
+            job.result = payload
+            job.http_status = status
+            job.finished_at = datetime.now(timezone.utc)
+            job._finished_clock = time.monotonic()
+
+    def get(self, job_id):
+        with self._lock:
+            self._prune()
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job; returns the job (None if unknown)"""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job.cancel_event.set()
+        if job.future is not None:
+            job.future.cancel()
+        with self._lock:
+            queued = job.state == QUEUED
+        if queued:
+            # Not started: a thread that picks it up now sees the event and skips it.
+            # A running job stops in OptimizerPool.run and finishes as cancelled.
+            self._finish(job, CANCELLED, {'status': 'error', 'message': 'Optimization cancelled'}, 409)
+        return job
+
+    def _prune(self):
+        cutoff = time.monotonic() - self.retention
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job._finished_clock is not None and job._finished_clock < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def stats(self):
+        with self._lock:
+            counts = {state: 0 for state in (QUEUED, RUNNING) + FINISHED}
+            for job in self._jobs.values():
+                counts[job.state] += 1
+            return counts
+
+    def shutdown(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            job.cancel_event.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+jobs = JobManager()
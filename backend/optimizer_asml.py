@@ -1,24 +1,85 @@
 
 import numpy as np
+import os
+import time
+
 import pandas as pd
 
+from flow_engine import FlowTooLarge
 from toolBox import tools
 
-class optimizer:
+# Buy allocation engines: 'greedy' (tools.optimize_buy) or 'flow' (tools.optimize_buy_flow)
+ENGINES = ('greedy', 'flow')
 
-    def version1(self):
+# Harvest candidates when the workbook has no "Harvest Candidates" sheet, in priority
+# order: HARVEST_CANDIDATES="PAS5500/22/60/80,PAS5500/5x0:/5x0" (machine[:platform])
+DEFAULT_HARVEST = [
+    (machine.strip(), platform.strip() or None)
+    for machine, _, platform in (item.partition(':') for item in
+                                 os.environ.get('HARVEST_CANDIDATES', 'PAS5500/22/60/80').split(','))
+    if machine.strip()
+]
+# Threads for harvest candidates that do not compete for the same demand
+HARVEST_WORKERS = int(os.environ.get('HARVEST_WORKERS', 4))
 
-        tool = tools()
+class optimizer:
 
-        df_systems, df_modules, df_parts, df_qtc, df_qtc_modules, df_qtc_parts, df_core_inv, df_model_table, df_scrap = tool.read_data()
+    def version1(self, source="MasterDB.xlsx", reference=None, engine='greedy', margins=None, progress=None):
+        """
+        Run the buy-back optimization.
+
+        source is a workbook path or an in-memory data source (see data_source);
+        reference optionally supplies cached, pre-normalized Base.xlsx sheets
+        (see reference_data) for every sheet the source does not have.
+        engine selects the buy allocation (see ENGINES); with 'flow' the greedy
+        allocation is also computed to report the profit gap, and used instead when
+        the flow graph is above flow_engine.MAX_ARCS (engine 'fallback' says why).
+        The engine 'objective' is the allocation's Delta plus the scrap value of the
+        bundle units it leaves (tools.allocation_value).
+        Harvested machine types come from tools.harvest_candidates (DEFAULT_HARVEST
+        unless the workbook lists them). With margins (a grid of required margins in
+        percent) the result also carries the 'sensitivity' curves of
+        tools.margin_curves.
+        progress, if given, is called with one event dict per finished stage (load,
+        req_demand, optimize_buy, optimize_harvest, scrap_pro, bb_recom): 'stage',
+        'elapsed_seconds' since the start, row counts and the stage's partial
+        results (bb_recom carries out_bb before the totals are returned).
+        Returns a dict with 'out_bb' and 'out_tot' DataFrames, the 'warnings'
+        rows, the 'engine' summary and per-candidate 'harvest' timings; use
+        write_results to persist them into a workbook.
+        """
+
+        started = time.perf_counter()
+
+        def report(stage, **info):
+            if progress is not None:
+                progress({'stage': stage, 'elapsed_seconds': time.perf_counter() - started, **info})
+
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine '{engine}' (expected one of: {', '.join(ENGINES)})")
+
+        tool = tools(source, reference)
+
+        df_systems, df_modules, df_parts, df_qtc, df_qtc_modules, df_qtc_parts, df_core_inv, df_scrap = tool.read_data()
 
         # If essential sheets missing, early warning (still proceed with empty frames)
         critical = ["Systems","QTC","QTC Modules","QTC Parts","CoreQInventory","Scrap","User Input1","User Input2"]
         missing_critical = [s for s in critical if s in tool.warnings.get('missing_sheets', [])]
 
         df_input1, df_input2 = tool.user_input()
+        report('load', rows={'Systems': len(df_systems), 'Modules': len(df_modules), 'Parts': len(df_parts),
+                             'QTC': len(df_qtc), 'QTC Modules': len(df_qtc_modules), 'QTC Parts': len(df_qtc_parts),
+                             'CoreQInventory': len(df_core_inv), 'Scrap': len(df_scrap),
+                             'User Input1': len(df_input1), 'User Input2': len(df_input2)})
 
         df_req_demand = tool.req_demand(df_systems,'12', 'A')
+        module_req_demand = tool.req_demand(df_modules,'12', 'B')
+        part_req_demand = tool.req_demand(df_parts,'12', 'C')
+        report('req_demand', rows={'Systems': len(df_req_demand), 'Modules': len(module_req_demand),
+                                   'Parts': len(part_req_demand)},
+               open_demand={'Systems': float(df_req_demand['req_demand'].clip(lower=0).sum()),
+                            'Modules': float(module_req_demand['req_demand'].clip(lower=0).sum()),
+                            'Parts': float(part_req_demand['req_demand'].clip(lower=0).sum())})
 
         df_input1['Machine type'] = df_input1['Machine type'].str.lstrip('/')
         df_input1['Machine type'] = df_input1['Machine type'].str.strip()
@@ -32,21 +93,40 @@ class optimizer:
 
         df_bundle['Pipeline'] = df_bundle['Pipe_units']
 
-        df_deltas_inventory = tool.deltas_refurbish(df_qtc, 'Inventory')
-        df_deltas_bundle = tool.deltas_refurbish(df_qtc, 'Bundle')
-
-        df_result = tool.optimize_buy(df_req_demand, df_bundle, df_deltas_bundle, df_deltas_inventory, df_core_inv)
-
-        base_harvest = 'PAS5500/22/60/80'
+        df_deltas_inventory, df_deltas_bundle, df_deltas_bundle_sorted = tool.refurbish_deltas(df_qtc)
+
+        # Leftover bundle units are scrapped: both engines are valued with that
+        scrap_values = tool.scrap_values(df_bundle['Machine'], df_scrap, df_qtc)
+        fallback = None
+        if engine == 'flow':
+            # Greedy on copies, only to measure the gap
+            greedy_result = tool.optimize_buy(df_req_demand.copy(), df_bundle, df_deltas_bundle, df_deltas_inventory, df_core_inv.copy(), df_deltas_bundle_sorted)
+            greedy_value = tool.allocation_value(greedy_result, scrap_values)
+            try:
+                df_result = tool.optimize_buy_flow(df_req_demand, df_bundle, df_deltas_bundle, df_deltas_inventory, df_core_inv,
+                                                   scrap_values=scrap_values)
+            except FlowTooLarge as e:
+                # Too big to solve within the request: use the greedy allocation
+                fallback = str(e)
+        if engine != 'flow' or fallback:
+            df_result = tool.optimize_buy(df_req_demand, df_bundle, df_deltas_bundle, df_deltas_inventory, df_core_inv, df_deltas_bundle_sorted)
+
+        engine_info = {'name': 'greedy' if fallback else engine, 'objective': tool.allocation_value(df_result, scrap_values)}
+        if fallback:
+            engine_info.update(requested=engine, fallback=fallback)
+        elif engine == 'flow':
+            engine_info['greedy_objective'] = greedy_value
+            engine_info['profit_gap'] = round(engine_info['objective'] - greedy_value, 2)
+        report('optimize_buy', rows=len(df_result), engine=engine_info,
+               allocated_units=float(sum(k for _, _, _, k, _ in tool.allocations)))
+
+        candidates = tool.harvest_candidates(DEFAULT_HARVEST)
         #print(df_result)
 
-        sel_harvest = df_result.loc[df_result['Machine'] == base_harvest, 'Bundle']
-        if not sel_harvest.empty and sel_harvest.iloc[0] > 0:
-
-            module_req_demand = tool.req_demand(df_modules,'12', 'B')
-            part_req_demand = tool.req_demand(df_parts,'12', 'C')
-
-            df_result = tool.optimize_harvest(module_req_demand, part_req_demand, df_result, df_qtc_modules, df_qtc_parts, base_harvest, df_scrap)
+        df_result, harvest_timings = tool.optimize_harvest_candidates(
+            candidates, module_req_demand, part_req_demand, df_result, df_qtc_modules, df_qtc_parts, df_scrap,
+            mod_systems=df_modules.get('System'), part_systems=df_parts.get('System'), workers=HARVEST_WORKERS)
+        report('optimize_harvest', rows=len(df_result), harvest=harvest_timings)
 
         # pd.set_option('display.max_columns', None)
         # print(df_result)
@@ -55,6 +135,7 @@ class optimizer:
             df_result_scrap = tool.scrap_pro(df_result, df_scrap, df_qtc)
         else:
             df_result_scrap = df_result
+        report('scrap_pro', rows=len(df_result_scrap), remaining_units=float(df_result_scrap['Bundle'].sum()))
 
         df_bb = df_result_scrap.merge(
             df_input1[['Machine type','Required margin (%)']],  
@@ -64,19 +145,30 @@ class optimizer:
         )
 
         output1, output2 = tool.bb_recom(df_bb, df_input2)
-
-        with pd.ExcelWriter('MasterDB.xlsx', engine='openpyxl', mode='a', if_sheet_exists='replace') as writer:
-            output1.to_excel(writer, sheet_name='out_bb', index=False)
-            output2.to_excel(writer, sheet_name='out_tot', index=False)
+        report('bb_recom', rows=len(output1), out_bb=output1)
+        sensitivity = tool.margin_curves(df_bb, df_input2, margins) if margins is not None else None
+
+        warn_rows = []
+        for ms in tool.warnings.get('missing_sheets', []):
+            warn_rows.append({'category': 'missing_sheet', 'detail': ms})
+        for sheet, cols in tool.warnings.get('missing_columns', {}).items():
+            warn_rows.append({'category': 'missing_columns', 'detail': f"{sheet}: {', '.join(cols)}"})
+        for table, keys in tool.warnings.get('missing_keys', {}).items():
+            warn_rows.append({'category': 'missing_keys', 'detail': f"{table}: {', '.join(str(k) for k in keys)}"})
+        if missing_critical:
+            warn_rows.append({'category': 'critical_missing', 'detail': ', '.join(missing_critical)})
+
+        return {'out_bb': output1, 'out_tot': output2, 'warnings': warn_rows, 'engine': engine_info,
+                'harvest': harvest_timings, 'sensitivity': sensitivity}
+
+    def write_results(self, workbook, result):
+        """Write a version1 result into the workbook as out_bb / out_tot (and warnings) sheets"""
+
+        with pd.ExcelWriter(workbook, engine='openpyxl', mode='a', if_sheet_exists='replace') as writer:
+            result['out_bb'].to_excel(writer, sheet_name='out_bb', index=False)
+            result['out_tot'].to_excel(writer, sheet_name='out_tot', index=False)
             # Persist warnings if any
-            warn_rows = []
-            for ms in tool.warnings.get('missing_sheets', []):
-                warn_rows.append({'category': 'missing_sheet', 'detail': ms})
-            for sheet, cols in tool.warnings.get('missing_columns', {}).items():
-                warn_rows.append({'category': 'missing_columns', 'detail': f"{sheet}: {', '.join(cols)}"})
-            if missing_critical:
-                warn_rows.append({'category': 'critical_missing', 'detail': ', '.join(missing_critical)})
-            if warn_rows:
-                pd.DataFrame(warn_rows).to_excel(writer, sheet_name='warnings', index=False)
+            if result['warnings']:
+                pd.DataFrame(result['warnings']).to_excel(writer, sheet_name='warnings', index=False)
 
         return 1
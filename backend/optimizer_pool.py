@@ -0,0 +1,355 @@
+"""
+Optimizer Worker Pool
+Keeps a set of pre-warmed optimizer processes so a request does not pay for a
+fresh interpreter and a pandas/numpy import on every run.
+"""
+import logging
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = Path(__file__).parent
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+# Pool configuration (overridable via environment)
+POOL_SIZE = max(1, _env_int('OPTIMIZER_POOL_SIZE', min(4, os.cpu_count() or 1)))
+MAX_TASKS_PER_WORKER = _env_int('OPTIMIZER_MAX_TASKS_PER_WORKER', 100)  # 0 = never recycle
+JOB_TIMEOUT = _env_float('OPTIMIZER_JOB_TIMEOUT', 60.0)
+START_METHOD = os.environ.get('OPTIMIZER_START_METHOD', 'spawn')
+# With the 'forkserver' start method these are imported once in the fork server,
+# so each new (or recycled) worker forks with them already loaded (reference_data
+# also loads the workbook given to OptimizerPool.preload_reference)
+FORKSERVER_PRELOAD = ['numpy', 'pandas', 'openpyxl', 'data_source', 'optimizer_asml', 'reference_data']
+# Seconds between checks of a job's cancel event while waiting for its result
+CANCEL_POLL_INTERVAL = 0.1
+
+
+class OptimizerTimeout(Exception):
+    """Raised when a job does not finish within its timeout"""
+
+
+class OptimizerCancelled(Exception):
+    """Raised when a job's cancel event is set before it finishes"""
+
+
+class OptimizerError(Exception):
+    """Raised when a job fails inside a worker"""
+
+    def __init__(self, message, worker_traceback=''):
+        super().__init__(message)
+        self.worker_traceback = worker_traceback
+
+
+def _warm_up(workdir):
+    """Import the heavy libraries once so jobs start hot"""
+    os.chdir(workdir)
+    if workdir not in sys.path:
+        sys.path.insert(0, workdir)
+    import numpy  # noqa: F401
+    import pandas  # noqa: F401
+    import openpyxl  # noqa: F401
+    import data_source  # noqa: F401
+    import optimizer_asml  # noqa: F401
+    import reference_data  # noqa: F401
+
+
+# Pipe of the job running in this worker process, for emit()
+_job_conn = None
+
+
+def emit(event):
+    """From inside a job: send a progress event to the caller (see OptimizerPool.run on_event)"""
+    if _job_conn is not None:
+        _job_conn.send(('event', event))
+
+
+def _worker_main(conn, workdir):
+    """
+    Worker loop: receive (fn, args, kwargs), reply ('result', value) or ('error',
+    message, traceback); the job may send ('event', ...) messages before that.
+    """
+    global _job_conn
+    _warm_up(workdir)
+    _job_conn = conn
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            break
+        if job is None:
+            break
+        fn, args, kwargs = job
+        try:
+            value = fn(*args, **kwargs)
+            conn.send(('result', value))
+        except Exception as e:
+            conn.send(('error', f'{type(e).__name__}: {e}', traceback.format_exc()))
+    conn.close()
+
+
+def run_workbook(workbook='MasterDB.xlsx', engine='greedy', margins=None, progress=False):
+    """Job: optimize the given workbook in place and return the result objects (progress: emit stage events)"""
+    from optimizer_asml import optimizer
+    started = time.perf_counter()
+    opt = optimizer()
+    result = opt.version1(str(workbook), engine=engine, margins=margins, progress=emit if progress else None)
+    opt.write_results(str(workbook), result)
+    if progress:
+        emit({'stage': 'write', 'elapsed_seconds': time.perf_counter() - started,
+              'sheets': ['out_bb', 'out_tot'] + (['warnings'] if result['warnings'] else [])})
+    return result
+
+
+def run_frames(frames, base_path, engine='greedy', margins=None, progress=False):
+    """
+    Job: optimize in-memory sheets; every other sheet comes from the cached Base.xlsx
+    reference data (progress: emit stage events). The result's 'reference_version'
+    is the version of the reference data this worker actually used.
+    """
+    import reference_data
+    from data_source import FrameSource
+    from optimizer_asml import optimizer
+    reference = reference_data.get_reference(base_path)
+    result = optimizer().version1(FrameSource(frames), reference,
+                                  engine=engine, margins=margins, progress=emit if progress else None)
+    result['reference_version'] = reference.version
+    return result
+
+
+def load_reference(base_path):
+    """Warm-up job: parse Base.xlsx into this worker's reference cache (inherited from a preloaded fork server)"""
+    import reference_data
+    return reference_data.get_reference(base_path).version
+
+
+class _Worker:
+    """One pre-warmed optimizer process and its pipe"""
+
+    def __init__(self, ctx, workdir):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn, workdir), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.tasks_done = 0
+
+    def stop(self, kill=False):
+        try:
+            if kill:
+                self.process.terminate()
+            else:
+                self.conn.send(None)
+        except (OSError, BrokenPipeError):
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join(timeout=5)
+        self.conn.close()
+
+
+class OptimizerPool:
+    """
+    Fixed-size pool of optimizer processes.
+
+    - Workers are started lazily (or eagerly via warm_up) and reused across jobs
+    - A worker is recycled after max_tasks_per_worker jobs to bound memory growth
+    - A job that exceeds its timeout kills only its own worker; a fresh one replaces it
+    """
+
+    def __init__(self, size=POOL_SIZE, max_tasks_per_worker=MAX_TASKS_PER_WORKER,
+                 timeout=JOB_TIMEOUT, start_method=START_METHOD, workdir=BACKEND_DIR):
+        self.size = size
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.timeout = timeout
+        self.workdir = str(workdir)
+        self.start_method = start_method
+        self._ctx = multiprocessing.get_context(start_method)
+        if start_method == 'forkserver':
+            self._ctx.set_forkserver_preload(FORKSERVER_PRELOAD)
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._workers = set()
+        self._closed = False
+
+    def preload_reference(self, base_path):
+        """
+        With the 'forkserver' start method, have the fork server load the reference
+        data of base_path once, so every worker forks with it (shared copy-on-write)
+        instead of parsing Base.xlsx itself. Only takes effect before the fork
+        server starts, i.e. before this process's first forkserver worker.
+        """
+        if self.start_method == 'forkserver':
+            # The fork server is a fresh interpreter: the path reaches it through its environment
+            os.environ['REFERENCE_PRELOAD_PATH'] = str(Path(base_path).resolve())  # reference_data.PRELOAD_ENV
+
+    def _spawn(self):
+        worker = _Worker(self._ctx, self.workdir)
+        with self._lock:
+            self._workers.add(worker)
+        return worker
+
+    def _retire(self, worker, kill=False):
+        with self._lock:
+            self._workers.discard(worker)
+        worker.stop(kill=kill)
+
+    def _acquire(self, cancel=None):
+        if cancel is None:
+            self._slots.acquire()
+        else:
+            while not self._slots.acquire(timeout=CANCEL_POLL_INTERVAL):
+                if cancel.is_set():
+                    raise OptimizerCancelled('Optimization cancelled')
+        try:
+            while True:
+                try:
+                    worker = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._spawn()
+                if worker.process.is_alive():
+                    return worker
+                self._retire(worker, kill=True)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _release(self, worker):
+        recycle = self.max_tasks_per_worker and worker.tasks_done >= self.max_tasks_per_worker
+        if recycle or self._closed:
+            self._retire(worker)
+        else:
+            self._idle.put(worker)
+        self._slots.release()
+
+    def warm_up(self, fn=None, *args):
+        """Start every worker now instead of on first use, optionally running fn(*args) on each"""
+        started = []
+        try:
+            for _ in range(self.size):
+                started.append(self._acquire())
+            if fn is not None:
+                for worker in started:
+                    worker.conn.send((fn, args, {}))
+                for worker in list(started):
+                    if not worker.conn.poll(self.timeout):
+                        # A late reply would be read by the next job: replace the worker
+                        logger.warning("Optimizer worker warm-up timed out")
+                        started.remove(worker)
+                        self._retire(worker, kill=True)
+                        self._slots.release()
+                        continue
+                    message = worker.conn.recv()
+                    if message[0] == 'error':
+                        logger.warning(f"Optimizer worker warm-up failed: {message[1]}")
+        finally:
+            for worker in started:
+                self._release(worker)
+
+    def _wait(self, worker, timeout, cancel):
+        """True once the worker has replied, False on timeout; OptimizerCancelled if cancel is set first"""
+        if cancel is None:
+            return worker.conn.poll(timeout)
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if worker.conn.poll(max(0.0, min(CANCEL_POLL_INTERVAL, remaining))):
+                return True
+            if cancel.is_set():
+                raise OptimizerCancelled('Optimization cancelled')
+            if remaining <= 0:
+                return False
+
+    def run(self, fn, *args, timeout=None, cancel=None, on_event=None, **kwargs):
+        """
+        Run fn(*args, **kwargs) on a pooled worker and return its result.
+
+        cancel is an optional threading.Event: once set, waiting for a worker or for
+        the result stops with OptimizerCancelled and a running job's worker is killed.
+        on_event is called with every progress event the job emits (see emit).
+        """
+        if self._closed:
+            raise RuntimeError('Optimizer pool is shut down')
+        timeout = self.timeout if timeout is None else timeout
+        worker = self._acquire(cancel)
+        try:
+            worker.conn.send((fn, args, kwargs))
+            deadline = time.monotonic() + timeout
+            while True:
+                if not self._wait(worker, max(0.0, deadline - time.monotonic()), cancel):
+                    self._retire(worker, kill=True)
+                    worker = None
+                    raise OptimizerTimeout(f'Optimization timed out after {timeout:g} seconds')
+                try:
+                    message = worker.conn.recv()
+                except (EOFError, OSError):
+                    self._retire(worker, kill=True)
+                    worker = None
+                    raise OptimizerError('Optimizer worker exited unexpectedly')
+                if message[0] != 'event':
+                    break
+                if on_event is not None:
+                    on_event(message[1])
+            worker.tasks_done += 1
+        except BaseException:
+            if worker is not None:
+                self._retire(worker, kill=True)
+            self._slots.release()
+            raise
+        self._release(worker)
+
+        if message[0] == 'error':
+            raise OptimizerError(message[1], message[2])
+        return message[1]
+
+    def run_many(self, fn, jobs, timeout=None):
+        """
+        Run fn(*args, **kwargs) for every (args, kwargs) in jobs, up to size at a time.
+
+        Returns the results in job order; a job that failed or timed out has its
+        exception in place of the result instead of aborting the others.
+        """
+        def run_one(job):
+            args, kwargs = job
+            try:
+                return self.run(fn, *args, timeout=timeout, **kwargs)
+            except Exception as e:
+                return e
+
+        jobs = list(jobs)
+        if len(jobs) <= 1:
+            return [run_one(job) for job in jobs]
+        with ThreadPoolExecutor(max_workers=min(self.size, len(jobs)), thread_name_prefix='optimizer-batch') as executor:
+            return list(executor.map(run_one, jobs))
+
+    def shutdown(self):
+        self._closed = True
+        with self._lock:
+            workers = list(self._workers)
+        for worker in workers:
+            self._retire(worker)
+
+
+pool = OptimizerPool()
@@ -0,0 +1,197 @@
+"""
+Optimize Payload Schema
+Declares the tables of an /api/optimize payload (systemRecommendation,
+maxBuyback, systems, modules, parts): for each field its JSON key, the sheet
+column it becomes, its type and its default. parse() turns every table into a
+typed DataFrame column by column, and collects all invalid values in one pass
+so the client gets them together as a 400 instead of a 500 on the first one.
+"""
+import math
+import os
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+import money
+
+# Field types: text (str of the value), whole number (truncated toward zero like
+# int(float(v))), money (truncated to cents, see money.truncate) and percent (a
+# fraction <= 1 is scaled to percent). A null, empty or absent value takes the default.
+TEXT, INT, MONEY, PERCENT = 'text', 'int', 'money', 'percent'
+
+Field = namedtuple('Field', ['key', 'column', 'type', 'default'])
+
+DEMAND_FIELDS = [
+    Field('demand_12m', 'Demand_12M', INT, 0),
+    Field('demand_24m', 'Demand_24M', INT, 0),
+    Field('finished_12m', 'Qinventory_12M', INT, 0),
+    Field('finished_24m', 'Qinventory_24M', INT, 0),
+]
+
+# Payload key -> (sheet, fields)
+TABLES = {
+    'systemRecommendation': ('User Input1', [
+        Field('machine_type', 'Machine type', TEXT, ''),
+        Field('offered_bundle', 'Offered Bundle', INT, 0),
+        Field('qtc_avg_bb_price', 'QTC average BB price', MONEY, 0),
+        Field('units_in_sales_pipeline', 'Units in sales pipeline', INT, 0),
+        Field('deal_outcome_probability', 'Deal outcome probability', PERCENT, 0),
+        Field('expected_pipeline_units', 'Expected pipeline units', INT, 0),
+        Field('units_in_qualified_inventory', 'Units in qualified inventory', INT, 0),
+        Field('recommended_from_other_inventory', 'Recommended from other inventory', INT, 0),
+        Field('recommended_buy_12m', 'Recommended Buy for 12 M', INT, 0),
+        Field('required_margin', 'Required margin (%)', INT, 0),
+        Field('recommended_bb_price_on_bundle', 'Recommended BB Price on Bundle (K)', MONEY, 0),
+    ]),
+    'maxBuyback': ('User Input2', [
+        Field('metric', 'Metric', TEXT, ''),
+        Field('valuation', 'Max_BBB_Valuation', INT, 0),
+        Field('required_margin', 'Required Margin', INT, 0),
+    ]),
+    'systems': ('Systems', [Field('item', 'System', TEXT, '')] + DEMAND_FIELDS),
+    'modules': ('Modules', [Field('item', 'Module', TEXT, '')] + DEMAND_FIELDS),
+    'parts': ('Parts', [Field('item', 'Module', TEXT, '')] + DEMAND_FIELDS),
+}
+
+# Tables a payload must carry
+REQUIRED = ('systemRecommendation',)
+
+# Top-level required margins (percent) used for User Input2 metrics the payload omits
+MARGIN_DEFAULTS = {
+    'Refurbishment': 'refurbishmentMargin',
+    'Harvesting - Module': 'harvestingModuleMargin',
+    'Harvesting - Parts': 'harvestingPartsMargin',
+    'EOL': 'eolMargin',
+    'Total Without Scrap': 'totalWithoutScrapMargin',
+    'Total With Scrap': 'totalWithScrapMargin',
+}
+
+# Size limits (overridable via environment)
+MAX_ROWS = int(os.environ.get('PAYLOAD_MAX_ROWS', 10000))              # per table
+MAX_BODY_BYTES = int(os.environ.get('PAYLOAD_MAX_BYTES', 16 * 1024 * 1024))
+MAX_ERRORS = 100                                                        # reported per request
+
+INT_LIMIT = float(2 ** 63)
+
+
+class PayloadError(ValueError):
+    """Raised by parse with every invalid field: errors is a list of {'field', 'message'}"""
+
+    def __init__(self, errors, total=None):
+        total = len(errors) if total is None else total
+        super().__init__(f"Invalid request payload: {total} invalid field(s), first: "
+                         f"{errors[0]['field']}: {errors[0]['message']}")
+        self.errors = errors
+        self.total = total
+
+
+def _missing(series):
+    """Null (None, NaN), empty or absent values"""
+    missing = series.isna().to_numpy()
+    if series.dtype == object:
+        missing |= (series == '').to_numpy()
+    return missing
+
+
+def _column(field, series, report):
+    """Typed column for one field; invalid values are passed to report(index, message)"""
+    missing = _missing(series)
+    if field.type == TEXT:
+        return series.where(~missing, field.default).astype(str)
+
+    if series.dtype.kind in 'iuf':
+        numbers = series.to_numpy(dtype=float)
+    else:
+        numbers = pd.to_numeric(series, errors='coerce').to_numpy(dtype=float)
+    invalid = ~missing & ~np.isfinite(numbers)
+    if field.type == INT:
+        invalid |= ~missing & ~invalid & (np.abs(numbers) >= INT_LIMIT)
+    for i in np.flatnonzero(invalid):
+        report(i, f'expected a finite number, got {_preview(series.iat[i])}')
+
+    if field.type == MONEY:
+        if series.dtype.kind in 'iuf':
+            return money.truncate(np.where(missing, field.default, numbers))
+        # Numeric strings are truncated from their own digits
+        return money.truncate(series.where(~(missing | invalid), field.default).tolist())
+    numbers[missing | invalid] = field.default
+    if field.type == INT:
+        return np.trunc(numbers).astype(np.int64)
+    # PERCENT
+    return np.where(numbers <= 1, numbers * 100, numbers)
+
+
+def _preview(value, limit=40):
+    text = repr(value)
+    return text if len(text) <= limit else text[:limit - 3] + '...'
+
+
+def _table(key, rows, errors):
+    """DataFrame (sheet columns) for one payload table, appending its errors"""
+    _, fields = TABLES[key]
+    if not isinstance(rows, list):
+        errors.append({'field': key, 'message': 'expected a list of rows'})
+        return None
+    if len(rows) > MAX_ROWS:
+        errors.append({'field': key, 'message': f'too many rows ({len(rows)}); the limit is {MAX_ROWS}'})
+        return None
+
+    not_objects = [i for i, row in enumerate(rows) if type(row) is not dict]
+    for i in not_objects:
+        errors.append({'field': f'{key}[{i}]', 'message': 'expected an object'})
+    if not_objects:
+        rows = [row if type(row) is dict else {} for row in rows]
+
+    # One pass over the rows builds every column; types are then fixed per column
+    raw = pd.DataFrame.from_records(rows, columns=[f.key for f in fields]) if rows else \
+        pd.DataFrame({f.key: pd.Series(dtype=object) for f in fields})
+    columns = {}
+    for field in fields:
+        def report(i, message, field=field):
+            errors.append({'field': f'{key}[{i}].{field.key}', 'message': message})
+        # Text keeps the sent values (ids such as 350 must not turn into 350.0)
+        series = pd.Series([row.get(field.key) for row in rows], dtype=object) if field.type == TEXT and rows \
+            else raw[field.key]
+        columns[field.column] = _column(field, series, report)
+    return pd.DataFrame(columns, columns=[f.column for f in fields])
+
+
+def _margin(data, key, default, errors):
+    """A top-level whole-number margin (e.g. refurbishmentMargin), default when absent"""
+    value = data.get(key, default)
+    if value is None or value == '':
+        return default
+    try:
+        number = float(value)
+        if isinstance(value, (list, dict)) or not math.isfinite(number):
+            raise ValueError
+    except (TypeError, ValueError):
+        errors.append({'field': key, 'message': f'expected a finite number, got {_preview(value)}'})
+        return default
+    return int(number)
+
+
+def parse(data):
+    """
+    Validate and convert the payload's tables in one pass.
+
+    Returns ({payload key: DataFrame with sheet columns} for every table present,
+    {metric: default required margin} from the top-level margins). Raises
+    PayloadError listing every invalid field (at most MAX_ERRORS of them).
+    """
+    if not isinstance(data, dict):
+        raise PayloadError([{'field': '', 'message': 'expected a JSON object'}])
+    errors = []
+    tables = {}
+    for key in TABLES:
+        if data.get(key) is None and key in REQUIRED:
+            errors.append({'field': key, 'message': 'required'})
+        elif data.get(key) is not None:
+            frame = _table(key, data[key], errors)
+            if frame is not None:
+                tables[key] = frame
+    margins = {metric: _margin(data, key, 40, errors) for metric, key in MARGIN_DEFAULTS.items()}
+    if errors:
+        raise PayloadError(errors[:MAX_ERRORS], total=len(errors))
+    return tables, margins
@@ -0,0 +1,251 @@
+"""
+Reference Data Cache
+Base.xlsx reference sheets (QTC, QTC Modules, QTC Parts, Scrap, CoreQInventory, ...)
+change rarely, so each process parses and normalizes them once and keeps the
+result, keyed by the workbook's content hash. A background thread watches the
+file and swaps in a freshly built snapshot when it changes.
+
+When a compiled columnar snapshot (see base_snapshot.py) matching the workbook's
+hash exists, it is loaded instead of parsing the xlsx.
+
+Forked processes inherit the parent's snapshots. An optimizer pool's fork server
+is a fresh interpreter, though, so it preloads the workbook named by PRELOAD_ENV
+when it imports this module (see OptimizerPool.preload_reference): every
+optimizer process it forks then starts with the snapshot already in memory.
+"""
+import hashlib
+import logging
+import os
+import threading
+from pathlib import Path
+
+import base_snapshot
+from data_source import ExcelSource
+from toolBox import SHEET_COLUMNS, tools
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks of Base.xlsx for changes
+RELOAD_INTERVAL = float(os.environ.get('REFERENCE_RELOAD_INTERVAL', 30))
+# Workbook path a process loads when it imports this module (set for fork servers)
+PRELOAD_ENV = 'REFERENCE_PRELOAD_PATH'
+
+
+def file_hash(path):
+    """sha256 of the file's content"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _stat_key(path):
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+_versions = {}
+_versions_lock = threading.Lock()
+
+
+def workbook_version(path):
+    """file_hash of the workbook, recomputed only when its mtime or size changes"""
+    path = str(path)
+    stat_key = _stat_key(path)
+    with _versions_lock:
+        cached = _versions.get(path)
+    if cached is not None and cached[0] == stat_key:
+        return cached[1]
+    version = file_hash(path)
+    with _versions_lock:
+        _versions[path] = (stat_key, version)
+    return version
+
+
+class ReferenceData:
+    """
+    Immutable snapshot of one version of the reference workbook.
+
+    - frames: sheet name -> DataFrame as tools._read_sheet returns it (aliases
+      mapped, missing columns added, numerics coerced, ids stripped)
+    - missing_columns: sheet name -> required columns the sheet lacked
+    - deltas_inventory / deltas_bundle: tools.deltas_refurbish of QTC
+    - deltas_bundle_sorted: deltas_bundle in the Delta order optimize_buy scans
+    - sheet_names: every sheet in the workbook
+    - origin: 'snapshot' or 'xlsx', where the frames were loaded from
+
+    Consumers must treat the frames as read-only (tools hands out copies).
+    Sheets that are not cached (e.g. Matrix Model) are parsed lazily on read().
+    """
+
+    def __init__(self, path, version, stat_key):
+        self.path = str(path)
+        self.version = version
+        self.stat_key = stat_key
+        self._source = ExcelSource(path)
+        self.frames = {}
+        self.missing_columns = {}
+        self.deltas_inventory = None
+        self.deltas_bundle = None
+        self.deltas_bundle_sorted = None
+        self.sheet_names = []
+        self.origin = 'xlsx'
+
+    @classmethod
+    def build(cls, path, use_snapshot=True):
+        stat_key = _stat_key(path)
+        snapshot = cls(path, file_hash(path), stat_key)
+
+        compiled = base_snapshot.load_snapshot(path, snapshot.version) if use_snapshot else None
+        if compiled is not None:
+            manifest, snapshot.frames = compiled
+            snapshot.sheet_names = list(manifest['sheet_names'])
+            snapshot.missing_columns = {k: list(v) for k, v in manifest['missing_columns'].items()}
+            snapshot.origin = 'snapshot'
+        else:
+            source = ExcelSource(path)
+            source.load(list(SHEET_COLUMNS))
+            tool = tools(source)
+            for sheet_name in SHEET_COLUMNS:
+                if source.has_sheet(sheet_name):
+                    snapshot.frames[sheet_name] = tool._read_sheet(sheet_name)
+            snapshot.missing_columns = {k: list(v) for k, v in tool.warnings.get('missing_columns', {}).items()}
+            snapshot.sheet_names = source.sheet_names()
+
+        if "QTC" in snapshot.frames:
+            tool = tools(snapshot)
+            inv, bundle, bundle_sorted = tool.refurbish_deltas(snapshot.frames["QTC"])
+            snapshot.deltas_inventory = inv
+            snapshot.deltas_bundle = bundle
+            snapshot.deltas_bundle_sorted = bundle_sorted
+        return snapshot
+
+    # Data-source interface for sheets read raw (not in frames)
+    def has_sheet(self, sheet_name):
+        return sheet_name in self.sheet_names
+
+    def read(self, sheet_name):
+        return self._source.read(sheet_name)
+
+
+class ReferenceCache:
+    """Holds the current ReferenceData for one workbook path and reloads it when the file changes"""
+
+    def __init__(self, path, interval=RELOAD_INTERVAL):
+        self.path = str(path)
+        self.interval = interval
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._watcher = None
+        self._stop = threading.Event()
+        # Set in a forked child: its inherited snapshot may be older than its watcher's first poll
+        self._inherited = False
+        self.reloads = 0
+
+    def get(self):
+        """Current snapshot; loads synchronously on first use, or if stale and no watcher (yet) checked"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            return self.refresh()
+        if self._watcher is None or self._inherited:
+            self._inherited = False
+            if _stat_key(self.path) != snapshot.stat_key:
+                return self.refresh()
+        return snapshot
+
+    def refresh(self):
+        """Rebuild the snapshot if the file content changed; returns the current snapshot"""
+        with self._lock:
+            current = self._snapshot
+            stat_key = _stat_key(self.path)
+            if current is not None and current.stat_key == stat_key:
+                return current
+            if current is not None and file_hash(self.path) == current.version:
+                current.stat_key = stat_key
+                return current
+            snapshot = ReferenceData.build(self.path)
+            # Single reference assignment: readers see the old or the new snapshot, never a mix
+            self._snapshot = snapshot
+            self.reloads += 1
+            logger.info(f"Loaded reference data {snapshot.version[:12]} from {self.path} ({snapshot.origin})")
+            return snapshot
+
+    def start_watcher(self):
+        """Poll the workbook in a daemon thread and swap in new snapshots in the background"""
+        if self._watcher is not None or self.interval <= 0:
+            return
+        self._watcher = threading.Thread(target=self._watch, name='reference-watcher', daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self):
+        self._stop.set()
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                # Keep serving the previous snapshot (e.g. file mid-write)
+                logger.warning(f"Reference data reload failed for {self.path}: {e}")
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(path):
+    """Process-wide ReferenceCache for the workbook path"""
+    key = str(Path(path).resolve())
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = _caches[key] = ReferenceCache(key)
+        if cache._watcher is None:
+            cache.start_watcher()
+    return cache
+
+
+def _after_fork_in_child():
+    """
+    A forked child (e.g. a pre-forking server's web worker) keeps the parent's
+    snapshots, shared copy-on-write, but not its threads: renew the locks, which
+    another thread may have held at fork time, and let get_cache restart the watchers
+    """
+    global _caches_lock, _versions_lock
+    _caches_lock = threading.Lock()
+    _versions_lock = threading.Lock()
+    for cache in _caches.values():
+        cache._lock = threading.Lock()
+        cache._stop = threading.Event()
+        cache._watcher = None
+        cache._inherited = True
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def _preload():
+    """
+    Load the workbook named by PRELOAD_ENV into this process's cache, without a
+    watcher: run on import in an optimizer pool's fork server, whose children
+    start their own. Failures are logged; the children then load it themselves.
+    """
+    path = os.environ.get(PRELOAD_ENV)
+    if not path:
+        return
+    try:
+        key = str(Path(path).resolve())
+        with _caches_lock:
+            cache = _caches.setdefault(key, ReferenceCache(key))
+        cache.get()
+    except Exception as e:
+        logger.warning(f"Reference data preload failed for {path}: {e}")
+
+
+_preload()
+
+
+def get_reference(path):
+    """Current ReferenceData for the workbook path"""
+    return get_cache(path).get()
@@ -0,0 +1,165 @@
+"""
+Optimize Response Formats
+Result tables (out_bb, out_tot and the echoed inputs) are sent as lists of row
+objects by default. Clients can opt in to a more compact encoding:
+
+- columnar: ?format=columnar or Accept: application/vnd.bb+columnar - each table
+  as {column: [values...]}, encoded with orjson when it is installed
+- arrow: ?format=arrow or Accept: application/vnd.apache.arrow.stream - one
+  table (?table=, default outbase_data) as an Arrow IPC stream, the other response
+  fields as JSON in the schema metadata under b'bb' (needs pyarrow)
+
+Any format is compressed with brotli (when installed) or gzip if the client's
+Accept-Encoding allows it and the body is at least MIN_COMPRESS_BYTES.
+"""
+import gzip
+import json
+import os
+
+from flask import Response, jsonify
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import pyarrow
+    import pyarrow.ipc  # noqa: F401
+except ImportError:
+    pyarrow = None
+
+ROWS, COLUMNAR, ARROW = 'rows', 'columnar', 'arrow'
+FORMATS = (ROWS, COLUMNAR, ARROW)
+
+COLUMNAR_MIMETYPE = 'application/vnd.bb+columnar'
+ARROW_MIMETYPE = 'application/vnd.apache.arrow.stream'
+MIMETYPES = {COLUMNAR_MIMETYPE: COLUMNAR, ARROW_MIMETYPE: ARROW}
+
+# Response fields holding row tables
+TABLE_KEYS = ('outbase_data', 'outprofit_data', 'user_input1_data', 'user_input2_data')
+
+# Bodies smaller than this are sent uncompressed
+MIN_COMPRESS_BYTES = int(os.environ.get('RESPONSE_MIN_COMPRESS_BYTES', 1024))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+class FormatError(ValueError):
+    """Raised for a format the request asks for but cannot get; status is the HTTP status"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def negotiate(request, arrow=True):
+    """Response format for the request: ?format= first, then the Accept header"""
+    requested = request.args.get('format')
+    if requested:
+        if requested not in FORMATS:
+            raise FormatError(f"Unknown format '{requested}' (expected one of: {', '.join(FORMATS)})")
+        fmt = requested
+    else:
+        best = request.accept_mimetypes.best_match(['application/json'] + list(MIMETYPES))
+        fmt = MIMETYPES.get(best, ROWS)
+    if fmt == ARROW and not arrow:
+        raise FormatError('The arrow format is available for single optimization results only', 406)
+    if fmt == ARROW and pyarrow is None:
+        raise FormatError('The arrow format needs pyarrow, which is not installed on the server', 406)
+    return fmt
+
+
+def _columns(rows):
+    """Row objects -> {column: [values]} (columns in the first row's order)"""
+    if not rows:
+        return {}
+    return {key: [row.get(key) for row in rows] for key in rows[0]}
+
+
+def columnar(payload):
+    """The payload with every result table as column arrays, also inside 'result' and 'results'"""
+    out = {}
+    for key, value in payload.items():
+        if key in TABLE_KEYS and isinstance(value, list):
+            value = _columns(value)
+        elif key == 'result' and isinstance(value, dict):
+            value = columnar(value)
+        elif key == 'results' and isinstance(value, dict):
+            value = {k: columnar(v) if isinstance(v, dict) else v for k, v in value.items()}
+        out[key] = value
+    return out
+
+
+def dumps(payload):
+    """Compact JSON bytes (orjson when available)"""
+    if orjson is not None:
+        return orjson.dumps(payload, default=str, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, separators=(',', ':'), default=str).encode('utf-8')
+
+
+def arrow_stream(payload, table='outbase_data'):
+    """One result table as Arrow IPC stream bytes; the other fields go into the schema metadata"""
+    rows = payload.get(table) or []
+    arrow_table = pyarrow.table(_columns(rows))
+    meta = {k: v for k, v in payload.items() if k not in TABLE_KEYS}
+    meta['table'] = table
+    arrow_table = arrow_table.replace_schema_metadata({'bb': dumps(meta)})
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, arrow_table.schema) as writer:
+        writer.write_table(arrow_table)
+    return sink.getvalue().to_pybytes()
+
+
+def compress(response, request):
+    """Encode the response body with br or gzip when the client accepts it"""
+    response.vary.add('Accept-Encoding')
+    if response.direct_passthrough or 'Content-Encoding' in response.headers:
+        return response
+    data = response.get_data()
+    if len(data) < MIN_COMPRESS_BYTES:
+        return response
+    offered = ['br', 'gzip'] if brotli is not None else ['gzip']
+    encoding = request.accept_encodings.best_match(offered)
+    if encoding is None or not request.accept_encodings[encoding]:
+        return response
+    if encoding == 'br':
+        data = brotli.compress(data, quality=BROTLI_QUALITY)
+    else:
+        data = gzip.compress(data, compresslevel=GZIP_LEVEL)
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def respond(payload, status, request, arrow=True):
+    """
+    Response for an optimize payload in the negotiated format, compressed as
+    negotiated. Error payloads (status >= 400) are always plain JSON.
+    """
+    try:
+        fmt = negotiate(request, arrow) if status < 400 else ROWS
+    except FormatError as e:
+        payload, status, fmt = {'status': 'error', 'message': str(e)}, e.status, ROWS
+
+    table = request.args.get('table', 'outbase_data')
+    if fmt == ARROW and table not in TABLE_KEYS:
+        payload, status, fmt = {
+            'status': 'error',
+            'message': f"Unknown table '{table}' (expected one of: {', '.join(TABLE_KEYS)})"
+        }, 400, ROWS
+
+    if fmt == ARROW:
+        response = Response(arrow_stream(payload, table), status, mimetype=ARROW_MIMETYPE)
+    elif fmt == COLUMNAR:
+        response = Response(dumps(columnar(payload)), status, mimetype=COLUMNAR_MIMETYPE)
+    else:
+        response = jsonify(payload)
+        response.status_code = status
+    response.vary.add('Accept')
+    return compress(response, request)
@@ -0,0 +1,121 @@
+"""
+Optimization Result Cache
+Users re-run /api/optimize with unchanged tables, so finished results are kept
+in memory, keyed by a content hash of the normalized request (the input sheets
+the payload was turned into, the engine and the sensitivity grid) plus the
+version of the Base.xlsx reference data. Bounded by entry count and approximate
+size with LRU eviction; entries also expire after a TTL.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Bounds (overridable via environment); a size or TTL of 0 disables the cache
+MAX_ENTRIES = int(os.environ.get('RESULT_CACHE_SIZE', 256))
+MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+TTL = float(os.environ.get('RESULT_CACHE_TTL', 600))
+
+
+def request_key(frames, reference_version, **options):
+    """
+    sha256 over the input sheets, the reference version and the run options.
+
+    Sheets are hashed by name, columns and values in a canonical JSON form, so
+    payloads that normalize to the same sheets (e.g. "5" and 5) share a key.
+    """
+    h = hashlib.sha256()
+    h.update(json.dumps({'reference': reference_version, 'options': options},
+                        sort_keys=True, default=str).encode('utf-8'))
+    for name in sorted(frames):
+        df = frames[name]
+        h.update(json.dumps([name, [str(c) for c in df.columns], df.to_numpy().tolist()],
+                            default=str).encode('utf-8'))
+    return h.hexdigest()
+
+
+class ResultCache:
+    """
+    Thread-safe LRU + TTL cache of JSON-serializable results.
+
+    - get(key) returns the value or None and counts a hit, miss or expiry
+    - put(key, value) stores it, evicting least recently used entries beyond
+      max_entries / max_bytes (size = length of the value's JSON)
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES, ttl=TTL, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.ttl > 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] <= self._clock():
+                self._drop(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        size = len(json.dumps(value, default=str))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (self._clock() + self.ttl, size, value)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _drop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+
+cache = ResultCache()
@@ -0,0 +1,131 @@
+"""
+Session Validation Cache
+Every protected request validates its session token, which costs a session and
+a user query against the auth database. Valid tokens are remembered in memory
+(token -> user dict) for at most TTL seconds - the maximum staleness - and never
+past the session's own expiry. Logout and user deactivation invalidate the
+entries at once in this process; other server processes keep theirs for at most
+TTL seconds, so keep it short.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+# Bounds (overridable via environment); a size or TTL of 0 disables the cache
+MAX_ENTRIES = int(os.environ.get('SESSION_CACHE_SIZE', 10000))
+TTL = float(os.environ.get('SESSION_CACHE_TTL', 30))
+
+
+class SessionCache:
+    """
+    Thread-safe LRU + TTL cache of validated sessions.
+
+    - get(token) returns the user dict or None and counts a hit, miss or expiry
+    - put(token, user, expires_at) stores it until min(now + ttl, expires_at)
+    - invalidate(token) / invalidate_user(user_id) drop entries immediately
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()  # token -> (deadline, user dict)
+        self._tokens = {}              # user id -> tokens cached for the user
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        # Bumped by every invalidation: a put for a lookup that started before one is skipped
+        self.generation = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.ttl > 0
+
+    def get(self, token):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] <= self._clock():
+                self._drop(token)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return dict(entry[1])
+
+    def put(self, token, user, expires_at=None, generation=None):
+        """
+        Remember a valid session; expires_at is the session's expiry (naive UTC
+        datetime). generation is self.generation from before the database lookup:
+        if a logout or deactivation happened since, the result may be stale and is
+        not stored.
+        """
+        if not self.enabled:
+            return
+        lifetime = self.ttl
+        if expires_at is not None:
+            lifetime = min(lifetime, (expires_at - datetime.utcnow()).total_seconds())
+        if lifetime <= 0:
+            return
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            if token in self._entries:
+                self._drop(token)
+            self._entries[token] = (self._clock() + lifetime, dict(user))
+            self._tokens.setdefault(user.get('id'), set()).add(token)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _drop(self, token):
+        _, user = self._entries.pop(token)
+        tokens = self._tokens.get(user.get('id'))
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens[user.get('id')]
+
+    def invalidate(self, token):
+        with self._lock:
+            self.generation += 1
+            if token in self._entries:
+                self._drop(token)
+                self.invalidations += 1
+
+    def invalidate_user(self, user_id):
+        """Drop every cached session of the user (e.g. on deactivation)"""
+        with self._lock:
+            self.generation += 1
+            for token in list(self._tokens.get(user_id, ())):
+                self._drop(token)
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._tokens.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
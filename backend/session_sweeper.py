@@ -0,0 +1,144 @@
+"""
+Expired Session Sweeper
+Expired sessions were only deleted when their token was presented again, so the
+sessions table grew without bound. A background thread per server process
+deletes them every SESSION_SWEEP_INTERVAL seconds in batches of
+SESSION_SWEEP_BATCH rows (found through the expires_at index), each batch its
+own short transaction with a pause in between, so on SQLite the write lock is
+never held for long and logins get in between batches.
+"""
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import delete, func, select
+
+from auth_models import Session, get_db_session
+
+logger = logging.getLogger(__name__)
+
+# Settings (overridable via environment); an interval of 0 disables the thread
+INTERVAL = float(os.environ.get('SESSION_SWEEP_INTERVAL', 300))
+BATCH_SIZE = int(os.environ.get('SESSION_SWEEP_BATCH', 500))
+MAX_BATCHES = int(os.environ.get('SESSION_SWEEP_MAX_BATCHES', 100))   # per sweep, the rest waits
+BATCH_PAUSE = 0.05                                                     # seconds between batches
+
+
+class SessionSweeper:
+    """
+    Deletes expired sessions in bounded batches.
+
+    - sweep() runs one sweep now and returns its numbers
+    - start() runs sweeps in a daemon thread (once per process), stop() ends it
+    - stats() gives the table size and the rows purged per sweep
+    """
+
+    def __init__(self, engine, interval=INTERVAL, batch_size=BATCH_SIZE, max_batches=MAX_BATCHES):
+        self.engine = engine
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self._lock = threading.Lock()          # counters
+        self._sweep_lock = threading.Lock()    # one sweep at a time
+        self._stop = threading.Event()
+        self._pid = None
+        self.sweeps = 0
+        self.total_purged = 0
+        self.failures = 0
+        self.last_sweep = None
+
+    def _delete_batch(self, now):
+        db = get_db_session(self.engine)
+        try:
+            ids = db.execute(
+                select(Session.id).where(Session.expires_at < now).limit(self.batch_size)
+            ).scalars().all()
+            if ids:
+                db.execute(delete(Session).where(Session.id.in_(ids)))
+                db.commit()
+            return len(ids)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _count(self):
+        db = get_db_session(self.engine)
+        try:
+            return db.execute(select(func.count()).select_from(Session)).scalar_one()
+        finally:
+            db.close()
+
+    def sweep(self):
+        """Delete up to max_batches batches of sessions expired now"""
+        with self._sweep_lock:
+            started = time.perf_counter()
+            now = datetime.utcnow()
+            purged = batches = 0
+            try:
+                while batches < self.max_batches:
+                    deleted = self._delete_batch(now)
+                    purged += deleted
+                    batches += 1
+                    if deleted < self.batch_size:
+                        break
+                    time.sleep(BATCH_PAUSE)
+                table_rows = self._count()
+                failed = False
+            except Exception as e:
+                logger.warning(f"Session sweep failed after {purged} row(s): {e}")
+                table_rows, failed = None, True
+            sweep = {
+                'at': now.isoformat(),
+                'purged': purged,
+                'batches': batches,
+                'seconds': round(time.perf_counter() - started, 4),
+                'table_rows': table_rows,
+                # False when the batch limit was hit: the rest waits for the next sweep
+                'complete': not failed and batches < self.max_batches,
+            }
+        with self._lock:
+            self.sweeps += 1
+            self.failures += failed
+            self.total_purged += purged
+            self.last_sweep = sweep
+        return dict(sweep)
+
+    def start(self):
+        """Start the sweep thread in this process (a no-op if running or disabled)"""
+        if self.interval <= 0 or self._pid == os.getpid():
+            return False
+        self._pid = os.getpid()
+        self._stop.clear()
+        threading.Thread(target=self._run, name='session-sweeper', daemon=True).start()
+        return True
+
+    def _run(self):
+        # Spread the first sweep so that the workers of one server do not sweep together
+        if self._stop.wait(random.uniform(0, min(self.interval, 60))):
+            return
+        while True:
+            self.sweep()
+            if self._stop.wait(self.interval):
+                return
+
+    def stop(self):
+        self._stop.set()
+        self._pid = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'running': self._pid == os.getpid(),
+                'interval_seconds': self.interval,
+                'batch_size': self.batch_size,
+                'max_batches': self.max_batches,
+                'sweeps': self.sweeps,
+                'failures': self.failures,
+                'total_purged': self.total_purged,
+                'last_sweep': self.last_sweep,
+            }
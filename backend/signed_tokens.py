@@ -0,0 +1,238 @@
+"""
+Signed Session Tokens
+Alternative to database sessions for horizontally scaled deployments: the token
+is an HMAC-SHA256 signed payload (user id, user dict, issue and expiry time,
+token id, key id), so any server verifies it without touching the database.
+
+    v1.<base64url(JSON claims)>.<base64url(HMAC of "v1.<claims>")>
+
+Enabled with SESSION_TOKEN_MODE=signed and keys in SESSION_SIGNING_KEYS as
+"kid:secret,kid:secret": the first key signs, the others are only accepted.
+To rotate, put the new key first and drop the old one once tokens signed with
+it have expired (SESSION_LIFETIME).
+
+The embedded user dict is the one at login: a role change (is_admin) takes
+effect at the user's next login, while deactivating a user ends its tokens at
+once. Logout revokes a token by id and deactivating a user revokes all its
+tokens issued so far (iat carries microseconds, so a login right after the
+user is reactivated, even within the same second, is not caught by it). Revocations live in a small in-memory set that a background
+thread syncs with the revocations table every REVOCATION_SYNC_INTERVAL seconds
+(pushing local ones, pulling the other servers'), so a revocation reaches the
+other servers within about that interval.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta
+
+from auth_models import Revocation, get_db_session
+
+logger = logging.getLogger(__name__)
+
+TOKEN_VERSION = 'v1'
+# 'db' (opaque tokens in the sessions table) or 'signed'
+MODE = os.environ.get('SESSION_TOKEN_MODE', 'db')
+SYNC_INTERVAL = float(os.environ.get('REVOCATION_SYNC_INTERVAL', 10))
+# Revocations created this long before the last pull are pulled again (clock skew between servers)
+SYNC_OVERLAP = timedelta(seconds=60)
+MIN_SECRET_LENGTH = 32
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def is_signed(token):
+    """True for a token in the signed format (opaque database tokens never contain a '.')"""
+    return isinstance(token, str) and token.startswith(TOKEN_VERSION + '.')
+
+
+def parse_keys(spec):
+    """'kid:secret,kid:secret' -> {kid: secret bytes} in order (the first key signs)"""
+    keys = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        kid, sep, secret = item.partition(':')
+        if not sep or not kid or not secret:
+            raise ValueError("SESSION_SIGNING_KEYS entries must look like 'kid:secret'")
+        if len(secret) < MIN_SECRET_LENGTH:
+            raise ValueError(f"Signing key '{kid}' is shorter than {MIN_SECRET_LENGTH} characters")
+        keys[kid] = secret.encode('utf-8')
+    return keys
+
+
+class TokenSigner:
+    """Issues and verifies signed tokens with a set of keys; the first one signs"""
+
+    def __init__(self, keys):
+        if not keys:
+            raise ValueError('Signed session tokens need at least one key in SESSION_SIGNING_KEYS')
+        self.keys = dict(keys)
+        self.active_kid = next(iter(self.keys))
+
+    @classmethod
+    def from_env(cls):
+        return cls(parse_keys(os.environ.get('SESSION_SIGNING_KEYS', '')))
+
+    def _signature(self, kid, signing_input):
+        return hmac.new(self.keys[kid], signing_input.encode('ascii'), hashlib.sha256).digest()
+
+    def issue(self, user, lifetime):
+        """(token, claims) for the user dict, valid for lifetime (a timedelta)"""
+        now = time.time()
+        claims = {
+            'sub': user['id'],
+            'usr': user,
+            # Sub-second: compared with the user's revocation cutoff (RevocationSet.revoke_user)
+            'iat': round(now, 6),
+            'exp': int(now) + int(lifetime.total_seconds()),
+            'jti': secrets.token_urlsafe(12),
+            'kid': self.active_kid,
+        }
+        payload = _b64encode(json.dumps(claims, separators=(',', ':'), sort_keys=True).encode('utf-8'))
+        signing_input = f'{TOKEN_VERSION}.{payload}'
+        return f'{signing_input}.{_b64encode(self._signature(self.active_kid, signing_input))}', claims
+
+    def verify(self, token, now=None):
+        """The token's claims if its signature is valid and it has not expired, else None"""
+        try:
+            version, payload, signature = token.split('.')
+            if version != TOKEN_VERSION:
+                return None
+            claims = json.loads(_b64decode(payload))
+            kid = claims.get('kid')
+            if kid not in self.keys:
+                return None
+            expected = self._signature(kid, f'{version}.{payload}')
+            if not hmac.compare_digest(expected, _b64decode(signature)):
+                return None
+        except (ValueError, TypeError, AttributeError):
+            return None
+        if claims.get('exp', 0) <= (time.time() if now is None else now):
+            return None
+        return claims
+
+
+class RevocationSet:
+    """
+    In-memory revocations, synced with the revocations table.
+
+    - revoke(jti, exp) / revoke_user(user_id, lifetime) record a revocation
+    - is_revoked(claims) checks a verified token against the set
+    The first use in a process loads the table and starts the sync thread.
+    """
+
+    def __init__(self, engine, interval=SYNC_INTERVAL):
+        self.engine = engine
+        self.interval = interval
+        self._entries = {}   # key -> (issued_before epoch or None, expires epoch)
+        self._pending = {}   # key -> entry not yet written to the table
+        self._last_pull = None
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._pid = None
+        self._stop = threading.Event()
+
+    def _ensure_started(self):
+        # Per process: a forked server worker does not inherit the parent's thread
+        if self._pid == os.getpid():
+            return
+        with self._sync_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        self.sync()
+        if self.interval > 0:
+            threading.Thread(target=self._run, name='revocation-sync', daemon=True).start()
+
+    def _add(self, key, issued_before, expires):
+        with self._lock:
+            current = self._entries.get(key)
+            if current is not None and current[0] is not None and issued_before is not None:
+                issued_before = max(issued_before, current[0])
+            self._entries[key] = self._pending[key] = (issued_before, expires)
+
+    def revoke(self, jti, expires):
+        """Revoke one token until its expiry (epoch seconds)"""
+        self._ensure_started()
+        self._add(f'token:{jti}', None, expires)
+
+    def revoke_user(self, user_id, lifetime):
+        """Revoke every token of the user issued until now (lifetime: longest token lifetime)"""
+        self._ensure_started()
+        now = time.time()
+        self._add(f'user:{user_id}', now, now + lifetime.total_seconds())
+
+    def is_revoked(self, claims):
+        self._ensure_started()
+        with self._lock:
+            if f"token:{claims.get('jti')}" in self._entries:
+                return True
+            cutoff = self._entries.get(f"user:{claims.get('sub')}")
+        return cutoff is not None and claims.get('iat', 0) <= cutoff[0]
+
+    def sync(self):
+        """Push local revocations, pull the other servers' and drop expired ones"""
+        with self._lock:
+            pending = dict(self._pending)
+        started = datetime.utcnow()
+        db = get_db_session(self.engine)
+        try:
+            for key, (issued_before, expires) in pending.items():
+                db.merge(Revocation(
+                    key=key,
+                    issued_before=datetime.utcfromtimestamp(issued_before) if issued_before is not None else None,
+                    expires_at=datetime.utcfromtimestamp(expires),
+                    created_at=started,
+                ))
+            db.query(Revocation).filter(Revocation.expires_at < started).delete()
+            db.commit()
+
+            query = db.query(Revocation)
+            if self._last_pull is not None:
+                query = query.filter(Revocation.created_at >= self._last_pull - SYNC_OVERLAP)
+            rows = query.all()
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"Revocation sync failed: {e}")
+            return False
+        finally:
+            db.close()
+
+        epoch = datetime(1970, 1, 1)
+        pulled = {row.key: ((row.issued_before - epoch).total_seconds() if row.issued_before else None,
+                            (row.expires_at - epoch).total_seconds()) for row in rows}
+        now = time.time()
+        with self._lock:
+            for key in pending:
+                if self._pending.get(key) == pending[key]:
+                    del self._pending[key]
+            for key, (issued_before, expires) in pulled.items():
+                current = self._entries.get(key)
+                if current is not None and current[0] is not None and issued_before is not None:
+                    issued_before = max(issued_before, current[0])
+                self._entries[key] = (issued_before, expires)
+            for key in [k for k, (_, expires) in self._entries.items() if expires < now and k not in self._pending]:
+                del self._entries[key]
+        self._last_pull = started
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sync()
+
+    def stop(self):
+        self._stop.set()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
@@ -1,3 +1,3 @@
 #!/bin/bash
 cd "$(dirname "$0")"
-exec ../.venv/bin/python optimize_excel.py
+exec ../.venv/bin/gunicorn -c gunicorn.conf.py wsgi:app
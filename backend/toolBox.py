@@ -1,10 +1,157 @@
 
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 import pandas as pd
 
+from data_source import as_source
+from flow_engine import min_cost_flow
+
+# Sheets read by tools.read_data / tools.user_input and the columns each must provide
+SHEET_COLUMNS = {
+    "Systems": ["System","Demand_12M","Qinventory_12M"],
+    "Modules": ["Module","Demand_12M","Qinventory_12M"],
+    "Parts": ["Part","Demand_12M","Qinventory_12M"],
+    "QTC": ["Output_type","Input_type","Buy_source_system","Audit_De_install","Freight_inbound","Total_refurbishment_cost","Total_cost","Sales_price_ASP","Net_Sales"],
+    "QTC Modules": ["Module","Delta_Cost","275_SCP","Total_Cost"],
+    "QTC Parts": ["Part","Delta_Cost","275_SCP","Total_Cost"],
+    "CoreQInventory": ["System","CoreInventory"],
+    "Scrap": ["Type","id_component","scrap_value","residual_value"],
+    "User Input1": ["Machine type","Offered Bundle","Units in sales pipeline","Deal outcome probability","Required margin (%)"],
+    "User Input2": ["Metric","Required Margin","Max_BBB_Valuation"],
+}
+
+# Optional sheet listing the harvest-eligible machine types (see tools.harvest_candidates)
+HARVEST_SHEET = "Harvest Candidates"
+HARVEST_COLUMNS = ["Machine type", "Priority"]
+
+
+class KeyIndex:
+    """
+    Natural-key index over a table, built once per run.
+
+    Maps each key (one column, or a tuple of columns) to the positions of the rows
+    holding it and keeps the requested fields as arrays, so get(key) returns every
+    field of the first matching row in one dict lookup. NaN keys match nothing, as
+    with ==. Positions stay valid while the table's rows are not reordered; the
+    field arrays are a snapshot taken at build time.
+    """
+
+    def __init__(self, df, keys, fields=()):
+        self.frame = df
+        self.keys = keys
+        self.fields = list(fields)
+        self.columns = {f: df[f].to_numpy() for f in self.fields}
+        self._rows = {}
+        if isinstance(keys, str):
+            values = df[keys].tolist()
+            for pos, key in enumerate(values):
+                if not pd.isna(key):
+                    self._rows.setdefault(key, []).append(pos)
+        else:
+            for pos, key in enumerate(zip(*(df[k].tolist() for k in keys))):
+                if not any(pd.isna(k) for k in key):
+                    self._rows.setdefault(key, []).append(pos)
+
+    def __contains__(self, key):
+        return self.first(key) is not None
+
+    def distinct(self):
+        """Every key, in order of first appearance"""
+        return list(self._rows)
+
+    def rows(self, key):
+        """Positions of every row holding key (empty if none)"""
+        try:
+            return self._rows.get(key, [])
+        except TypeError:
+            return []
+
+    def first(self, key):
+        """Position of the first row holding key, or None"""
+        rows = self.rows(key)
+        return rows[0] if rows else None
+
+    def get(self, key):
+        """Tuple of the fields of the first row holding key, or None"""
+        pos = self.first(key)
+        if pos is None:
+            return None
+        return tuple(self.columns[f][pos] for f in self.fields)
+
+
+def _whole_numbers(values):
+    """True if every value is a finite whole number (so x - k equals k unit decrements)"""
+    if values.dtype.kind in 'iu':
+        return True
+    if values.dtype.kind != 'f':
+        return False
+    return bool(np.all(np.isfinite(values)) and np.all(values == np.floor(values)))
+
+
+def _steps_while_positive(total, step):
+    """How many times total -= step can run under 'while total > 0' (whole-number total)"""
+    return -(-int(total) // step)
+
+
+# Units added per np.add.accumulate call in _add_repeated (bounds its scratch array)
+ACCUMULATE_CHUNK = 1 << 20
+
+
+def _add_repeated(start, value, k):
+    """
+    start with value added k times, rounded exactly like the per-unit loop it
+    replaces (start += value, k times).
+
+    Results are truncated to cents, so the closed form start + k * value is not
+    good enough: its last-bit difference can flip a cent. np.add.accumulate adds
+    strictly left to right, so it repeats the loop's roundings in C. Whole-number
+    values and totals below 2**53 are exact either way and take the closed form.
+    """
+    k = int(k)
+    if k <= 0:
+        return start
+    if float(start).is_integer() and float(value).is_integer() and abs(start) + k * abs(value) < 2 ** 53:
+        return start + k * value
+    total = float(start)
+    while k > 0:
+        n = min(k, ACCUMULATE_CHUNK)
+        steps = np.full(n + 1, value)
+        steps[0] = total
+        total = float(np.add.accumulate(steps)[-1])
+        k -= n
+    return total
+
+
+def _add_repeated_each(starts, values, counts):
+    """Per row: starts[j] with values[j] added counts[j] times (see _add_repeated)"""
+    starts = np.array(starts, dtype=float)
+    values = np.broadcast_to(np.asarray(values, dtype=float), starts.shape)
+    counts = np.broadcast_to(np.asarray(counts), starts.shape)
+    for j in np.flatnonzero(counts > 0):
+        starts[j] = _add_repeated(starts[j], values[j], counts[j])
+    return starts
+
 
 class tools:
 
-    def __init__(self):
+    def __init__(self, source="MasterDB.xlsx", reference=None):
+        # Where every sheet is read from: a workbook path or an in-memory source (see data_source)
+        self.source = as_source(source)
+        # Optional reference_data.ReferenceData: pre-normalized Base.xlsx sheets used for
+        # any sheet the source does not provide itself
+        self.reference = reference
+        self._from_reference = set()
+        self._preloaded = False
+        self._model_table = None
+        # KeyIndex per lookup table, built on first use in this run (see index())
+        self._indexes = {}
+        # Guards warnings updated from the harvest threads
+        self._lock = threading.Lock()
+        # (source, base, output, units, value per unit) of the last buy allocation
+        self.allocations = []
         # Collect warnings about missing sheets/columns so optimizer can surface them
         self.warnings = {
             'missing_sheets': [],
@@ -18,7 +165,7 @@ class tools:
         - If required columns are missing, add them (filled with 0/empty) and warn.
         """
         try:
-            df = pd.read_excel("MasterDB.xlsx", sheet_name=sheet_name)
+            df = self._read_raw(sheet_name)
         except Exception:
             # Missing sheet: create empty with required columns and warn
             self.warnings.setdefault('missing_sheets', []).append(sheet_name)
@@ -69,40 +216,132 @@ class tools:
                     df[c] = 0
         # Coerce numeric-looking columns (exclude obvious id columns)
         for col in df.columns:
-            if col.lower() not in {"output_type","input_type","system","module","part","type","id_component","machine type","metric"}:
+            if col.lower() not in {"output_type","input_type","system","module","part","type","id_component","machine type","metric","platform"}:
                 df[col] = pd.to_numeric(df[col], errors='coerce')
                 df[col] = df[col].fillna(0)
         return df
 
+    def _preload(self):
+        """Parse every sheet read_data/user_input need in a single pass over the source"""
+        if not self._preloaded and hasattr(self.source, 'load'):
+            self.source.load(list(SHEET_COLUMNS))
+        self._preloaded = True
+
     def read_data(self):
 
-        df_systems = self._safe_read("Systems", ["System","Demand_12M","Qinventory_12M"])        
-        df_modules = self._safe_read("Modules", ["Module","Demand_12M","Qinventory_12M"])        
-        df_parts = self._safe_read("Parts", ["Part","Demand_12M","Qinventory_12M"])        
-        df_qtc = self._safe_read("QTC", ["Output_type","Input_type","Buy_source_system","Audit_De_install","Freight_inbound","Total_refurbishment_cost","Total_cost","Sales_price_ASP","Net_Sales"])        
-        if 'Input_type' in df_qtc.columns:
-            df_qtc['Input_type'] = df_qtc['Input_type'].astype(str).str.lstrip('/').str.strip()
+        self._preload()
 
-        df_qtc_modules = self._safe_read("QTC Modules", ["Module","Delta_Cost","275_SCP","Total_Cost"])        
-        df_qtc_parts = self._safe_read("QTC Parts", ["Part","Delta_Cost","275_SCP","Total_Cost"])        
-        df_core_inv = self._safe_read("CoreQInventory", ["System","CoreInventory"])        
-        if 'System' in df_core_inv.columns:
-            df_core_inv['System'] = df_core_inv['System'].astype(str).str.lstrip('/').str.strip()
+        df_systems = self._read_sheet("Systems")
+        df_modules = self._read_sheet("Modules")
+        df_parts = self._read_sheet("Parts")
+        df_qtc = self._read_sheet("QTC")
+        df_qtc_modules = self._read_sheet("QTC Modules")
+        df_qtc_parts = self._read_sheet("QTC Parts")
+        df_core_inv = self._read_sheet("CoreQInventory")
 
-        # Matrix Model is optional in current logic; if missing, continue with empty
-        try:
-            df_model_table = self._safe_read("Matrix Model", [])
-        except RuntimeError:
-            self.warnings.setdefault('optional_missing', []).append('Matrix Model')
-            df_model_table = pd.DataFrame()
-        df_scrap = self._safe_read("Scrap", ["Type","id_component","scrap_value","residual_value"])        
+        # Matrix Model is optional and not used by the current stages: only check that it
+        # exists (same warning as before) and parse it lazily via model_table()
+        if not self._has_sheet("Matrix Model"):
+            self.warnings.setdefault('missing_sheets', []).append("Matrix Model")
+        df_scrap = self._read_sheet("Scrap")
+
+        return df_systems, df_modules, df_parts, df_qtc, df_qtc_modules, df_qtc_parts, df_core_inv, df_scrap
+
+    def _read_sheet(self, sheet_name):
+        """_safe_read with the sheet's required columns plus id clean-up.
+
+        Sheets the source does not provide come pre-normalized from the reference
+        cache when one is attached; their warnings are replayed as if read here.
+        """
+        ref = self.reference
+        if ref is not None and sheet_name in ref.frames and not self._source_has(sheet_name):
+            missing = ref.missing_columns.get(sheet_name)
+            if missing:
+                self.warnings.setdefault('missing_columns', {})[sheet_name] = list(missing)
+            self._from_reference.add(sheet_name)
+            return ref.frames[sheet_name].copy()
+
+        df = self._safe_read(sheet_name, SHEET_COLUMNS[sheet_name])
+        if sheet_name == "QTC" and 'Input_type' in df.columns:
+            df['Input_type'] = df['Input_type'].astype(str).str.lstrip('/').str.strip()
+        if sheet_name == "CoreQInventory" and 'System' in df.columns:
+            df['System'] = df['System'].astype(str).str.lstrip('/').str.strip()
+        return df
+
+    def model_table(self):
+        """Optional "Matrix Model" sheet, parsed on first use (empty if missing)"""
+        if self._model_table is None:
+            if self._has_sheet("Matrix Model"):
+                self._model_table = self._safe_read("Matrix Model", [])
+            else:
+                self._model_table = pd.DataFrame()
+        return self._model_table
+
+    def harvest_candidates(self, default):
+        """
+        Machine types to harvest as (machine, platform) pairs in priority order.
 
-        return df_systems, df_modules, df_parts, df_qtc, df_qtc_modules, df_qtc_parts, df_core_inv, df_model_table, df_scrap
+        Read from the optional "Harvest Candidates" sheet (Machine type, Priority and
+        an optional Platform column; lower Priority first) when the source or
+        reference provides it, otherwise default. Platform names the System value of
+        the Modules/Parts rows the machine yields; a blank Platform yields every row.
+        """
+        if not self._has_sheet(HARVEST_SHEET):
+            return list(default)
+        df = self._safe_read(HARVEST_SHEET, HARVEST_COLUMNS)
+        df = df[df['Machine type'].astype(str).str.strip().ne('') & df['Machine type'].notna()]
+        df = df.sort_values('Priority', kind='stable')
+        candidates, seen = [], set()
+        platforms = df['Platform'] if 'Platform' in df.columns else [None] * len(df)
+        for machine, platform in zip(df['Machine type'], platforms):
+            machine = str(machine).lstrip('/').strip()
+            platform = str(platform).strip() if isinstance(platform, str) and platform.strip() else None
+            if machine not in seen:
+                seen.add(machine)
+                candidates.append((machine, platform))
+        return candidates
+
+    def _source_has(self, sheet_name):
+        if hasattr(self.source, 'has_sheet'):
+            return self.source.has_sheet(sheet_name)
+        try:
+            self.source.read(sheet_name)
+            return True
+        except Exception:
+            return False
+
+    def _has_sheet(self, sheet_name):
+        if self._source_has(sheet_name):
+            return True
+        return self.reference is not None and self.reference.has_sheet(sheet_name)
+
+    def _read_raw(self, sheet_name):
+        if self.reference is not None and not self._source_has(sheet_name):
+            return self.reference.read(sheet_name)
+        return self.source.read(sheet_name)
+
+    def index(self, name, df, keys, fields=()):
+        """KeyIndex over df under name; built once per run and reused by every stage"""
+        idx = self._indexes.get(name)
+        if idx is None or idx.frame is not df:
+            idx = self._indexes[name] = KeyIndex(df, keys, fields)
+        return idx
+
+    def _missing_key(self, table, key):
+        """Record a lookup key with no row in table (surfaced as a 'missing_keys' warning)"""
+        if isinstance(key, tuple):
+            key = '(' + ', '.join(str(k) for k in key) + ')'
+        with self._lock:
+            keys = self.warnings.setdefault('missing_keys', {}).setdefault(table, [])
+            if key not in keys:
+                keys.append(key)
 
     def user_input(self):
 
-        df_input1 = self._safe_read("User Input1", ["Machine type","Offered Bundle","Units in sales pipeline","Deal outcome probability","Required margin (%)"])        
-        df_input2 = self._safe_read("User Input2", ["Metric","Required Margin","Max_BBB_Valuation"])        
+        self._preload()
+
+        df_input1 = self._read_sheet("User Input1")
+        df_input2 = self._read_sheet("User Input2")
 
         return df_input1, df_input2
 
@@ -162,7 +401,20 @@ class tools:
 
         return df_deltas
 
-    def optimize_buy(self, demanda, bundle, bundle_delta, inv_delta, inventario):
+    def refurbish_deltas(self, df_qtc):
+        """Inventory and Bundle deltas plus the Bundle deltas in Delta order (cached with the reference data)"""
+
+        if "QTC" in self._from_reference:
+            ref = self.reference
+            return ref.deltas_inventory.copy(), ref.deltas_bundle.copy(), ref.deltas_bundle_sorted.copy()
+
+        df_deltas_inventory = self.deltas_refurbish(df_qtc, 'Inventory')
+        df_deltas_bundle = self.deltas_refurbish(df_qtc, 'Bundle')
+
+        return df_deltas_inventory, df_deltas_bundle, df_deltas_bundle.sort_values(by='Delta', ascending=False)
+
+    def _recommend_frame(self, bundle):
+        """Copy of the bundle table with the recommendation columns the stages fill in"""
 
         recommend = bundle.copy()
 
@@ -180,196 +432,287 @@ class tools:
         recommend['cost_scrap'] = 0.0
         recommend['price_scrap'] = 0.0
 
-        counter = 0
-
-        bundle_delta_sorted = bundle_delta.sort_values(by='Delta', ascending=False)
-
-        #print(demanda)
-
-        while demanda['req_demand'].sum() > 0 and recommend['Bundle'].sum() > 0 and counter < len(bundle_delta_sorted):
-
-            base = bundle_delta_sorted['base'].iloc[counter]
-            output = bundle_delta_sorted['output'].iloc[counter]
-
-            sel_bundle = recommend.loc[recommend['Machine'] == base, 'Bundle']
-            if sel_bundle.empty or sel_bundle.iloc[0] <= 0:
-                counter += 1
-                continue
+        return recommend
 
-            if not demanda.loc[demanda['System'] == output].empty and demanda.loc[demanda['System'] == output, 'req_demand'].iloc[0] > 0:
+    def optimize_buy(self, demanda, bundle, bundle_delta, inv_delta, inventario, bundle_delta_sorted=None):
+        """
+        Allocate the offered bundle (and the core inventory / sales pipeline) to the
+        systems' required demand, visiting (base, output) pairs in descending Delta order.
+
+        Same allocation as taking one unit per step, but each step moves as many units
+        as the current pair can take at once: the minimum of the remaining demand, the
+        remaining bundle/inventory/pipeline of the base, and what keeps the total demand
+        and total bundle positive. Lookups read the first matching row and updates apply
+        to every matching row, as the per-unit .loc version did. demanda and inventario
+        are updated in place.
+
+        A base with no CoreQInventory row counts as having no inventory, and a pair with
+        no QTC rate is skipped; both are recorded as missing keys. Every step is logged
+        in self.allocations (see allocation_value).
+        """
 
-                    #print(bundle_delta)
-                    delta_bundle = bundle_delta.loc[(bundle_delta['base'] == base) & (bundle_delta['output'] == output), 'Delta'].iloc[0]
-                    price = bundle_delta.loc[(bundle_delta['base'] == base) & (bundle_delta['output'] == output), 'Sales_price'].iloc[0]
-                    cost = bundle_delta.loc[(bundle_delta['base'] == base) & (bundle_delta['output'] == output), 'Tot_cost'].iloc[0]
-                    bb_price = bundle_delta.loc[(bundle_delta['base'] == base) & (bundle_delta['output'] == output), 'Buy'].iloc[0]
+        recommend = self._recommend_frame(bundle)
+        self.allocations = []
 
-                    if inventario.loc[inventario['System'] == base, 'CoreInventory'].iloc[0] > 0 :
+        if bundle_delta_sorted is None:
+            bundle_delta_sorted = bundle_delta.sort_values(by='Delta', ascending=False)
 
-                        delta_inv = inv_delta.loc[(inv_delta['base'] == base) & (inv_delta['output'] == output), 'Delta'].iloc[0]
-                      
-                        if  delta_bundle > delta_inv :
+        # Working columns as arrays, written back at the end
+        req = demanda['req_demand'].to_numpy(copy=True)
+        core = inventario['CoreInventory'].to_numpy(copy=True)
+        cols = {c: recommend[c].to_numpy(copy=True)
+                for c in ['Bundle', 'Pipeline', 'bb', 'inv_use', 'to_ref', 'delta', 'price', 'cost']}
+        units, pipeline = cols['Bundle'], cols['Pipeline']
 
-                            recommend.loc[recommend['Machine'] == base, 'bb'] += 1
-                            recommend.loc[recommend['Machine'] == base, 'Bundle'] -= 1
-                            demanda.loc[demanda['System'] == output, 'req_demand'] -= 1
-                            recommend.loc[recommend['Machine'] == base, 'to_ref'] += 1
-                            recommend.loc[recommend['Machine'] == base, 'delta'] += delta_bundle
-                            recommend.loc[recommend['Machine'] == base, 'price'] += price
-                            recommend.loc[recommend['Machine'] == base, 'cost'] += cost - bb_price
+        machine_rows = KeyIndex(recommend, 'Machine')
+        demand_rows = KeyIndex(demanda, 'System')
+        inv_rows = self.index('CoreQInventory', inventario, 'System')
+        bundle_rates = self.index('QTC Bundle', bundle_delta, ['base', 'output'], ['Delta', 'Sales_price', 'Tot_cost', 'Buy'])
+        inv_rates = self.index('QTC Inventory', inv_delta, ['base', 'output'], ['Delta'])
 
-                        else :
+        # With whole-number quantities k unit steps equal one step of k; otherwise move one unit at a time
+        batch = all(_whole_numbers(a) for a in (req, units, pipeline, core))
 
-                            inventario.loc[inventario['System'] == base, 'CoreInventory'] -= 1
-                            demanda.loc[demanda['System'] == output, 'req_demand'] -= 1
-                            recommend.loc[recommend['Machine'] == base, 'inv_use'] += 1
+        total_demand = pd.Series(req).sum()
+        total_bundle = pd.Series(units).sum()
 
-                    elif recommend.loc[recommend['Machine'] == base, 'Pipeline'].iloc[0] > 0:
+        bases = bundle_delta_sorted['base'].tolist()
+        outputs = bundle_delta_sorted['output'].tolist()
+        counter = 0
 
-                        recommend.loc[recommend['Machine'] == base, 'Pipeline'] -= 1
-                        demanda.loc[demanda['System'] == output, 'req_demand'] -= 1
-                        recommend.loc[recommend['Machine'] == base, 'inv_use'] += 1
+        while total_demand > 0 and total_bundle > 0 and counter < len(bases):
 
-                    else :
-                       
-                        recommend.loc[recommend['Machine'] == base, 'bb'] += 1
-                        recommend.loc[recommend['Machine'] == base, 'Bundle'] -= 1
-                        demanda.loc[demanda['System'] == output, 'req_demand'] -= 1
-                        recommend.loc[recommend['Machine'] == base, 'to_ref'] += 1
-                        recommend.loc[recommend['Machine'] == base, 'delta'] += delta_bundle
-                        recommend.loc[recommend['Machine'] == base, 'price'] += price
-                        recommend.loc[recommend['Machine'] == base, 'cost'] += cost - bb_price
+            base = bases[counter]
+            output = outputs[counter]
 
-            else:
+            rows_b = machine_rows.rows(base)
+            if not rows_b or units[rows_b[0]] <= 0:
                 counter += 1
+                continue
 
-            #print(demanda)
-            #print(recommend)
-
-        return recommend
-
-
-    def optimize_harvest(self, demanda_mod, demanda_parts, bundle, delta_mod, delta_parts, harv_system, scrap):
-
-        quant_harvest = bundle.loc[bundle['Machine'] == harv_system, 'Bundle'].iloc[0]
-
-        demanda_mod['Delta'] = 0.0
-        demanda_parts['Delta'] = 0.0
-        demanda_mod['price'] = 0.0
-        demanda_parts['price'] = 0.0
-        demanda_mod['cost'] = 0.0
-        demanda_parts['cost'] = 0.0
-        demanda_mod['cost_scrap'] = 0.0
-        demanda_parts['cost_scrap'] = 0.0
-        demanda_mod['price_scrap'] = 0.0
-        demanda_parts['price_scrap'] = 0.0
-
-        pd.set_option('display.max_columns', None)
-        print(bundle)
-
-        while quant_harvest > 0:
-
-            flag_buy = 0
+            rows_o = demand_rows.rows(output)
+            if not rows_o or not req[rows_o[0]] > 0:
+                counter += 1
+                continue
 
-            if demanda_mod['req_demand'].sum() > 0 :
+            rates = bundle_rates.get((base, output))
+            if rates is None:
+                self._missing_key('QTC', (base, output))
+                counter += 1
+                continue
+            delta_bundle, price, cost, bb_price = rates
+
+            rows_i = inv_rows.rows(base)
+            if not rows_i:
+                self._missing_key('CoreQInventory', base)
+
+            if rows_i and core[rows_i[0]] > 0:
+                inv_rate = inv_rates.get((base, output))
+                if inv_rate is None:
+                    # Inventory use cannot be valued for this pair: buy from the bundle
+                    self._missing_key('QTC', (base, output))
+                    source = 'bundle'
+                else:
+                    source = 'bundle' if delta_bundle > inv_rate[0] else 'inventory'
+            elif pipeline[rows_b[0]] > 0:
+                source = 'pipeline'
+            else:
+                source = 'bundle'
+
+            k = 1
+            if batch:
+                k = min(int(req[rows_o[0]]), _steps_while_positive(total_demand, len(rows_o)))
+                if source == 'bundle':
+                    k = min(k, int(units[rows_b[0]]), _steps_while_positive(total_bundle, len(rows_b)))
+                elif source == 'inventory':
+                    k = min(k, int(core[rows_i[0]]))
+                else:
+                    k = min(k, int(pipeline[rows_b[0]]))
 
-                int_count = 0
-            
-                while int_count < len(demanda_mod):
-                
-                    if demanda_mod.loc[int_count, 'req_demand'] > 0 :
+            if source == 'bundle':
+                value = delta_bundle
+            else:
+                inv_rate = inv_rates.get((base, output))
+                value = inv_rate[0] if inv_rate is not None else delta_bundle
+            self.allocations.append((source, base, output, k, value))
+
+            req[rows_o] -= k
+
+            if source == 'bundle':
+                units[rows_b] -= k
+                cols['bb'][rows_b] += k
+                cols['to_ref'][rows_b] += k
+                for r in rows_b:
+                    cols['delta'][r] = _add_repeated(cols['delta'][r], delta_bundle, k)
+                    cols['price'][r] = _add_repeated(cols['price'][r], price, k)
+                    cols['cost'][r] = _add_repeated(cols['cost'][r], cost - bb_price, k)
+                total_bundle = pd.Series(units).sum()
+            elif source == 'inventory':
+                core[rows_i] -= k
+                cols['inv_use'][rows_b] += k
+            else:
+                pipeline[rows_b] -= k
+                cols['inv_use'][rows_b] += k
 
-                        module = demanda_mod.loc[int_count, 'Module']
-                        delta = delta_mod.loc[delta_mod['Module'] == module, 'Delta_Cost'].iloc[0]
-                        price = delta_mod.loc[delta_mod['Module'] == module, '275_SCP'].iloc[0]
-                        cost = delta_mod.loc[delta_mod['Module'] == module, 'Total_Cost'].iloc[0]
+            total_demand = pd.Series(req).sum()
 
-                        demanda_mod.loc[int_count, 'Delta'] += delta
-                        demanda_mod.loc[int_count, 'price'] += price
-                        demanda_mod.loc[int_count, 'cost'] += cost
-                        demanda_mod.loc[demanda_mod['Module'] == module, 'req_demand'] -= 1
+        demanda['req_demand'] = req
+        inventario['CoreInventory'] = core
+        for c, values in cols.items():
+            recommend[c] = values
 
-                    else :
+        return recommend
 
-                        module = demanda_mod.loc[int_count, 'Module']
-                        # Scrap handling for modules: separate price_scrap (residual_value) and cost_scrap (scrap_value)
-                        sel = scrap.loc[(scrap['Type'] == 'Module') & (scrap['id_component'] == module)]
-                        if not sel.empty:
-                            demanda_mod.loc[int_count, 'price_scrap'] += sel['residual_value'].iloc[0]
-                            demanda_mod.loc[int_count, 'cost_scrap'] += sel['scrap_value'].iloc[0]
+    def optimize_buy_flow(self, demanda, bundle, bundle_delta, inv_delta, inventario, bundle_delta_sorted=None,
+                          scrap_values=None):
+        """
+        Global-optimum alternative to optimize_buy (engine 'flow'); same inputs and output.
+
+        Supply: each offered machine's bundle, core inventory and sales pipeline units.
+        Demand: each system's positive req_demand. Every QTC (base, output) pair links
+        the base's supplies to the output, bundle units valued at the bundle Delta,
+        inventory and pipeline units at the inventory Delta (pipeline falls back to the
+        bundle Delta when the pair has no inventory rate). Solved as a min-cost flow in
+        cents (see flow_engine) that stops where the next unit would not add Delta:
+        the allocation of the highest total Delta, so demand that can only be filled
+        at a loss stays open (greedy fills it). Bundle units left over are scrapped
+        (scrap_pro), so with scrap_values (see scrap_values) a bundle unit is valued
+        at its Delta minus what scrapping it would net: the allocation of the
+        highest allocation_value with scrap. Quantities count whole units. Raises
+        flow_engine.FlowTooLarge for a graph too big to solve in time. demanda and
+        inventario are updated in place and the allocation is logged in self.allocations.
+        """
 
+        recommend = self._recommend_frame(bundle)
+        self.allocations = []
+
+        req = demanda['req_demand'].to_numpy(copy=True)
+        core = inventario['CoreInventory'].to_numpy(copy=True)
+        cols = {c: recommend[c].to_numpy(copy=True)
+                for c in ['Bundle', 'Pipeline', 'bb', 'inv_use', 'to_ref', 'delta', 'price', 'cost']}
+        units, pipeline = cols['Bundle'], cols['Pipeline']
+
+        machine_rows = KeyIndex(recommend, 'Machine')
+        demand_rows = KeyIndex(demanda, 'System')
+        inv_rows = self.index('CoreQInventory', inventario, 'System')
+        bundle_rates = self.index('QTC Bundle', bundle_delta, ['base', 'output'], ['Delta', 'Sales_price', 'Tot_cost', 'Buy'])
+        inv_rates = self.index('QTC Inventory', inv_delta, ['base', 'output'], ['Delta'])
+
+        def whole(x):
+            return int(np.floor(x)) if x > 0 else 0
+
+        # Nodes: 0 source, 1 sink, three supply nodes per machine (bundle, inventory,
+        # pipeline), then one demand node per system
+        machines = {m: i for i, m in enumerate(machine_rows.distinct())}
+        systems = {o: 2 + 3 * len(machines) + j for j, o in enumerate(demand_rows.distinct())}
+        tail, head, capacity, cost, arcs = [], [], [], [], []
+
+        for m, i in machines.items():
+            rows_b = machine_rows.rows(m)
+            rows_i = inv_rows.rows(m)
+            supply = (whole(units[rows_b[0]]), whole(core[rows_i[0]]) if rows_i else 0, whole(pipeline[rows_b[0]]))
+            if not rows_i and (supply[0] or supply[2]):
+                self._missing_key('CoreQInventory', m)
+            for kind, n in enumerate(supply):
+                tail.append(0); head.append(2 + 3 * i + kind); capacity.append(n); cost.append(0)
+        for o, node in systems.items():
+            tail.append(node); head.append(1); capacity.append(whole(req[demand_rows.first(o)])); cost.append(0)
+
+        unbounded = sum(capacity[:3 * len(machines)])
+        first_arc = len(tail)
+        for base, output in bundle_rates.distinct():
+            if base not in machines or output not in systems:
+                continue
+            delta_bundle, price, tot_cost, bb_price = bundle_rates.get((base, output))
+            inv_rate = inv_rates.get((base, output))
+            options = [('bundle', 0, delta_bundle), ('pipeline', 2, inv_rate[0] if inv_rate is not None else delta_bundle)]
+            if inv_rate is not None:
+                options.append(('inventory', 1, inv_rate[0]))
+            scrapped = (scrap_values or {}).get(base, 0.0)
+            for source, kind, value in options:
+                # A bundle unit sent to demand is one not scrapped
+                gain = value - scrapped if source == 'bundle' else value
+                tail.append(2 + 3 * machines[base] + kind); head.append(systems[output])
+                capacity.append(unbounded); cost.append(-int(round(gain * 100)))
+                arcs.append((source, base, output, value, price, tot_cost - bb_price))
+
+        flow, _ = min_cost_flow(2 + 3 * len(machines) + len(systems), np.array(tail, dtype=np.int64),
+                                np.array(head, dtype=np.int64), np.array(capacity, dtype=np.int64),
+                                np.array(cost, dtype=np.int64), 0, 1, max_flow=False)
+
+        for (source, base, output, value, price, net_cost), k in zip(arcs, flow[first_arc:].tolist()):
+            if k <= 0:
+                continue
+            rows_b = machine_rows.rows(base)
+            req[demand_rows.rows(output)] -= k
+            if source == 'bundle':
+                units[rows_b] -= k
+                cols['bb'][rows_b] += k
+                cols['to_ref'][rows_b] += k
+                cols['delta'][rows_b] += k * value
+                cols['price'][rows_b] += k * price
+                cols['cost'][rows_b] += k * net_cost
+            elif source == 'inventory':
+                core[inv_rows.rows(base)] -= k
+                cols['inv_use'][rows_b] += k
+            else:
+                pipeline[rows_b] -= k
+                cols['inv_use'][rows_b] += k
+            self.allocations.append((source, base, output, k, value))
 
-                    int_count += 1     
+        demanda['req_demand'] = req
+        inventario['CoreInventory'] = core
+        for c, values in cols.items():
+            recommend[c] = values
 
-                flag_buy = 1
+        return recommend
 
-            else:
+    def allocation_value(self, recommend=None, scrap_values=None):
+        """
+        Total Delta of the last buy allocation (units x Delta per unit, see
+        self.allocations). With its result frame and scrap_values (see scrap_values)
+        the bundle units it left are added at what scrapping them nets, since
+        scrap_pro scraps them: how both engines are compared. Units of harvest
+        candidates that optimize_harvest takes first are still counted as scrapped.
+        """
+        value = float(sum(k * value for _, _, _, k, value in self.allocations))
+        if recommend is not None and scrap_values:
+            left = recommend.drop_duplicates('Machine')
+            value += float(sum(scrap_values.get(m, 0.0) * units
+                               for m, units in zip(left['Machine'], left['Bundle'].clip(lower=0))))
+        return value
 
-                int_count = 0
-            
-                while int_count < len(demanda_mod):
-                
-                    module = demanda_mod.loc[int_count, 'Module']
-                    sel = scrap.loc[(scrap['Type'] == 'Module') & (scrap['id_component'] == module)]
-                    if not sel.empty:
-                        demanda_mod.loc[int_count, 'price_scrap'] += sel['residual_value'].iloc[0]
-                        demanda_mod.loc[int_count, 'cost_scrap'] += sel['scrap_value'].iloc[0]
+    def optimize_harvest(self, demanda_mod, demanda_parts, bundle, delta_mod, delta_parts, harv_system, scrap):
+        """
+        Harvest the offered harv_system machines for modules and parts.
+
+        Each machine yields one of every module and part: a component with remaining
+        demand is sold (Delta/price/cost), otherwise it is scrapped (price_scrap /
+        cost_scrap). A machine is bought while module or part demand remains. The
+        totals are computed per component in one step (see _harvest_components)
+        instead of machine by machine; demanda_mod, demanda_parts and bundle are
+        updated in place.
+        """
 
-                    int_count += 1 
+        quant_harvest = bundle.loc[bundle['Machine'] == harv_system, 'Bundle'].iloc[0]
+        machines = int(np.ceil(quant_harvest)) if quant_harvest > 0 else 0
 
-            if demanda_parts['req_demand'].sum() > 0 :
+        mod_rates = self.index('QTC Modules', delta_mod, 'Module', ['Delta_Cost', '275_SCP', 'Total_Cost'])
+        part_rates = self.index('QTC Parts', delta_parts, 'Part', ['Delta_Cost', '275_SCP', 'Total_Cost'])
+        scrap_rates = self.index('Scrap', scrap, ['Type', 'id_component'], ['residual_value', 'scrap_value'])
 
-                int_count = 0
-            
-                while int_count < len(demanda_parts):
-                
-                    if demanda_parts.loc[int_count, 'req_demand'] > 0 :
-
-                        module = demanda_parts.loc[int_count, 'Part']
-                        delta = delta_parts.loc[delta_parts['Part'] == module, 'Delta_Cost'].iloc[0]
-                        price = delta_parts.loc[delta_parts['Part'] == module, '275_SCP'].iloc[0]
-                        cost = delta_parts.loc[delta_parts['Part'] == module, 'Total_Cost'].iloc[0]
-
-                        demanda_parts.loc[int_count, 'Delta'] += delta
-                        demanda_parts.loc[int_count, 'price'] += price
-                        demanda_parts.loc[int_count, 'cost'] += cost
-                        demanda_parts.loc[demanda_parts['Part'] == module, 'req_demand'] -= 1
-                    
-                    else :
-
-                        module = demanda_parts.loc[int_count, 'Part']
-                        sel = scrap.loc[(scrap['Type'] == 'Part') & (scrap['id_component'] == module)]
-                        if not sel.empty:
-                            demanda_parts.loc[int_count, 'price_scrap'] += sel['residual_value'].iloc[0]
-                            demanda_parts.loc[int_count, 'cost_scrap'] += sel['scrap_value'].iloc[0]
-
-                    int_count += 1     
-
-                flag_buy = 1
-            
-            else:
+        bought_mod = self._harvest_components(demanda_mod, 'Module', 'Module', 'QTC Modules', mod_rates, scrap_rates, machines)
+        bought_parts = self._harvest_components(demanda_parts, 'Part', 'Part', 'QTC Parts', part_rates, scrap_rates, machines)
 
-                int_count = 0
-            
-                while int_count < len(demanda_parts):
-                
-                    module = demanda_parts.loc[int_count, 'Part']
-                    sel = scrap.loc[(scrap['Type'] == 'Part') & (scrap['id_component'] == module)]
-                    if not sel.empty:
-                        demanda_parts.loc[int_count, 'price_scrap'] += sel['residual_value'].iloc[0]
-                        demanda_parts.loc[int_count, 'cost_scrap'] += sel['scrap_value'].iloc[0]
-
-                    int_count += 1 
-
-            if flag_buy == 1:
-                
-                bundle.loc[bundle['Machine'] == harv_system, 'bb'] += 1
-                bundle.loc[bundle['Machine'] == harv_system, 'Bundle'] -= 1
-                bundle.loc[bundle['Machine'] == harv_system, 'to_harv'] += 1
-            
-            quant_harvest -= 1
+        # A machine is bought while either module or part demand remains
+        bought = max(bought_mod, bought_parts)
+        if bought:
+            rows = KeyIndex(bundle, 'Machine').rows(harv_system)
+            for c, step in (('bb', 1), ('Bundle', -1), ('to_harv', 1)):
+                col = bundle.columns.get_loc(c)
+                for r in rows:
+                    bundle.iloc[r, col] = _add_repeated(bundle.iloc[r, col], step, bought)
 
-           
         bundle.loc[bundle['Machine'] == harv_system, 'delta'] += demanda_mod['Delta'].sum() / 1000.0
         bundle.loc[bundle['Machine'] == harv_system, 'delta'] += demanda_parts['Delta'].sum() / 1000.0
         bundle.loc[bundle['Machine'] == harv_system, 'price_mod'] += demanda_mod['price'].sum() / 1000.0
@@ -381,10 +724,226 @@ class tools:
         bundle.loc[bundle['Machine'] == harv_system, 'cost_scrap'] += demanda_mod['cost_scrap'].sum() + demanda_parts['cost_scrap'].sum()
         bundle.loc[bundle['Machine'] == harv_system, 'price_scrap'] += demanda_mod['price_scrap'].sum() + demanda_parts['price_scrap'].sum()
 
-        print(bundle)
-
         return bundle
 
+    def optimize_harvest_candidates(self, candidates, demanda_mod, demanda_parts, bundle, delta_mod, delta_parts, scrap,
+                                    mod_systems=None, part_systems=None, workers=1):
+        """
+        Run optimize_harvest for every (machine, platform) candidate with offered units.
+
+        A candidate harvests the Modules/Parts rows whose System (mod_systems /
+        part_systems, aligned with the demand frames) matches its platform, plus rows
+        with no System; without a platform or System column it harvests every row.
+        Candidates sharing a row compete for its demand and run in priority order
+        within one group; separate groups touch disjoint rows and run in parallel on
+        up to `workers` threads. Returns the updated bundle and one timing row per
+        candidate: machine, group, units harvested and seconds.
+        """
+
+        def yields(systems, n, platform):
+            if systems is None or platform is None:
+                return np.ones(n, dtype=bool)
+            systems = pd.Series(systems)
+            names = systems.astype(str).str.strip()
+            return ((names == platform) | (names == '') | systems.isna()).to_numpy()
+
+        active = []
+        for machine, platform in candidates:
+            offered = bundle.loc[bundle['Machine'] == machine, 'Bundle']
+            if not offered.empty and offered.iloc[0] > 0:
+                active.append((machine,
+                               yields(mod_systems, len(demanda_mod), platform),
+                               yields(part_systems, len(demanda_parts), platform)))
+
+        # Connected components of the "shares a demand row" relation, in priority order
+        groups = []
+        for cand in active:
+            joined = [g for g in groups
+                      if any((cand[1] & other[1]).any() or (cand[2] & other[2]).any() for other in g)]
+            merged = [c for g in joined for c in g] + [cand]
+            groups = [g for g in groups if not any(g is j for j in joined)] + [merged]
+        order = {machine: i for i, (machine, _) in enumerate(candidates)}
+        groups = [sorted(g, key=lambda c: order[c[0]]) for g in groups]
+
+        # Build the shared lookup indexes before any thread uses them
+        self.index('QTC Modules', delta_mod, 'Module', ['Delta_Cost', '275_SCP', 'Total_Cost'])
+        self.index('QTC Parts', delta_parts, 'Part', ['Delta_Cost', '275_SCP', 'Total_Cost'])
+        self.index('Scrap', scrap, ['Type', 'id_component'], ['residual_value', 'scrap_value'])
+
+        def run_group(number, group):
+            local = bundle.copy()
+            group_mod = demanda_mod.copy()
+            group_parts = demanda_parts.copy()
+            timings = []
+            for machine, mod_rows, part_rows in group:
+                start = time.perf_counter()
+                mod = group_mod[mod_rows].copy()
+                parts = group_parts[part_rows].copy()
+                before = local.loc[local['Machine'] == machine, 'to_harv'].iloc[0]
+                self.optimize_harvest(mod, parts, local, delta_mod, delta_parts, machine, scrap)
+                # Later candidates of the group see the demand this one filled
+                group_mod.loc[mod_rows, 'req_demand'] = mod['req_demand'].to_numpy()
+                group_parts.loc[part_rows, 'req_demand'] = parts['req_demand'].to_numpy()
+                timings.append({
+                    'machine': machine,
+                    'group': number,
+                    'harvested': float(local.loc[local['Machine'] == machine, 'to_harv'].iloc[0] - before),
+                    'seconds': time.perf_counter() - start,
+                })
+            return local, timings
+
+        if len(groups) > 1 and workers > 1:
+            with ThreadPoolExecutor(max_workers=min(workers, len(groups))) as pool:
+                results = list(pool.map(run_group, range(len(groups)), groups))
+        else:
+            results = [run_group(i, g) for i, g in enumerate(groups)]
+
+        timings = []
+        for group, (local, group_timings) in zip(groups, results):
+            for machine, _, _ in group:
+                rows = (bundle['Machine'] == machine).to_numpy()
+                bundle.loc[rows] = local.loc[rows]
+            timings += group_timings
+        return bundle, timings
+
+    def _harvest_components(self, demanda, key_col, kind, table, rates, scrap_rates, machines):
+        """
+        Harvest one component type (modules or parts) from `machines` machines.
+
+        Adds Delta/price/cost/price_scrap/cost_scrap columns to demanda and reduces
+        its req_demand. Returns how many machines were harvested while this type's
+        total demand was still positive (the machines that had to be bought for it).
+
+        Per machine, every row with req_demand > 0 sells one unit and every other row
+        scraps one, as long as the column total is positive. With unique keys and
+        whole-number demand this has a closed form: demand stays positive for the
+        first G machines, where G is the first machine count at which
+        sum(req_demand - min(G, max(req_demand, 0))) <= 0. A row then sells
+        min(G, max(d, 0)) units and scraps machines - sold. Otherwise (duplicate keys
+        share their demand, fractional demand) the machines are stepped through one
+        at a time.
+        """
+
+        keys = demanda[key_col].tolist()
+        req = demanda['req_demand'].to_numpy(copy=True)
+        n = len(keys)
+
+        rate = [rates.get(k) for k in keys]
+        priced = np.array([r is not None for r in rate], dtype=bool)
+        values = np.array([r if r is not None else (0.0, 0.0, 0.0) for r in rate], dtype=float).reshape(n, 3)
+        scrap_rate = [scrap_rates.get((kind, k)) for k in keys]
+        has_scrap = np.array([r is not None for r in scrap_rate], dtype=bool)
+        scrap_values = np.array([r if r is not None else (0.0, 0.0) for r in scrap_rate], dtype=float).reshape(n, 2)
+
+        key_rows = KeyIndex(demanda, key_col)
+        unique = all(len(key_rows.rows(k)) == 1 for k in keys if not pd.isna(k))
+
+        if unique and _whole_numbers(req):
+            positive = np.where(priced, np.maximum(req, 0), 0).astype(np.int64)
+            total = pd.Series(req).sum()
+            gated = 0
+            if machines and total > 0:
+                if np.minimum(machines, positive).sum() < total:
+                    gated = machines
+                else:
+                    # Smallest G with sum(min(G, positive)) >= total
+                    lo, hi = 1, machines
+                    while lo < hi:
+                        mid = (lo + hi) // 2
+                        if np.minimum(mid, positive).sum() >= total:
+                            hi = mid
+                        else:
+                            lo = mid + 1
+                    gated = lo
+            sold = np.minimum(gated, positive)
+            # Unpriced rows with demand neither sell nor scrap while demand remains
+            blocked = np.where(~priced & (req > 0), gated, 0)
+            scrapped = machines - sold - blocked
+            req = req - sold
+            for j in np.flatnonzero(~priced & (req > 0)):
+                if gated:
+                    self._missing_key(table, keys[j])
+        else:
+            sold = np.zeros(n, dtype=np.int64)
+            scrapped = np.zeros(n, dtype=np.int64)
+            gated = 0
+            for _ in range(machines):
+                if not pd.Series(req).sum() > 0:
+                    scrapped += 1
+                    continue
+                gated += 1
+                for j in range(n):
+                    if req[j] > 0:
+                        if not priced[j]:
+                            self._missing_key(table, keys[j])
+                            continue
+                        sold[j] += 1
+                        req[key_rows.rows(keys[j])] -= 1
+                    else:
+                        scrapped[j] += 1
+
+        scrapped = np.where(has_scrap, scrapped, 0)
+        demanda['req_demand'] = req
+        demanda['Delta'] = _add_repeated_each(np.zeros(n), values[:, 0], sold)
+        demanda['price'] = _add_repeated_each(np.zeros(n), values[:, 1], sold)
+        demanda['cost'] = _add_repeated_each(np.zeros(n), values[:, 2], sold)
+        demanda['cost_scrap'] = _add_repeated_each(np.zeros(n), scrap_values[:, 1], scrapped)
+        demanda['price_scrap'] = _add_repeated_each(np.zeros(n), scrap_values[:, 0], scrapped)
+
+        return gated
+
+    def metric_totals(self, df_bb):
+        """(price, cost) behind each User Input2 metric bb_recom values, from its df_bb"""
+
+        harvested = df_bb[df_bb['to_harv'] > 0]
+        bought = df_bb[df_bb['bb'] > 0]
+
+        price_tot = bought['price'].sum()
+        cost_wo_scrap = bought['cost'].sum()
+        price_scrap_tot = bought['price_scrap'].sum()
+        cost_scrap_tot = bought['cost_scrap'].sum()
+
+        return {
+            'Refurbishment': (df_bb['price'].sum() - harvested['price_mod'].sum() - harvested['price_part'].sum(),
+                              df_bb['cost'].sum() - harvested['cost_mod'].sum() - harvested['cost_part'].sum()),
+            'Harvesting - Module': (harvested['price_mod'].sum(), harvested['cost_mod'].sum()),
+            'Harvesting - Parts': (harvested['price_part'].sum(), harvested['cost_part'].sum()),
+            'Total Without Scrap': (price_tot, cost_wo_scrap),
+            'Scrap': (price_scrap_tot, cost_scrap_tot),
+            'Total With Scrap': (price_tot + price_scrap_tot, cost_wo_scrap + cost_scrap_tot),
+        }
+
+    def margin_curves(self, df_bb, df_input2, margins):
+        """
+        Valuations over a grid of required margins (percent) from one optimization run.
+
+        Recommended_BB_Price per machine and Max_BBB_Valuation per User Input2 metric
+        are linear in the margin once df_bb's price/cost totals are known, so the
+        whole grid is one broadcast: value = price * (1 - margin / 100) - cost. The
+        point at a row's own required margin equals what bb_recom reports.
+        """
+
+        grid = np.asarray(margins, dtype=float)
+        keep = 1 - grid / 100.0
+
+        price = (df_bb['price'] + df_bb['price_scrap']).to_numpy(dtype=float)
+        cost = (df_bb['cost'] + df_bb['cost_scrap']).to_numpy(dtype=float)
+        machine_curves = price[:, None] * keep[None, :] - cost[:, None]
+
+        totals = self.metric_totals(df_bb)
+        metrics = [m for m in df_input2['Metric'] if m in totals]
+        metric_price = np.array([totals[m][0] for m in metrics], dtype=float)
+        metric_cost = np.array([totals[m][1] for m in metrics], dtype=float)
+        metric_curves = metric_price[:, None] * keep[None, :] - metric_cost[:, None]
+
+        return {
+            'margins': grid.tolist(),
+            'machines': [{'Machine': '/' + machine, 'Recommended BB Price': curve}
+                         for machine, curve in zip(df_bb['Machine'], machine_curves.tolist())],
+            'metrics': [{'Metric': metric, 'Max_BBB_Valuation': curve}
+                        for metric, curve in zip(metrics, metric_curves.tolist())],
+        }
+
     def bb_recom(self, df_bb, df_input2) :
 
         df_input2['Profit'] = 0.0
@@ -404,60 +963,62 @@ class tools:
         def safe_margin(price, cost):
             return (price - cost) / price if price and price != 0 else 0.0
 
-        price_ref = df_bb['price'].sum() - df_bb[df_bb['to_harv'] > 0]['price_mod'].sum() - df_bb[df_bb['to_harv'] > 0]['price_part'].sum()
-        cost_ref = df_bb['cost'].sum() - df_bb[df_bb['to_harv'] > 0]['cost_mod'].sum() - df_bb[df_bb['to_harv'] > 0]['cost_part'].sum()
-        refurb_row = df_input2.loc[df_input2['Metric'] == 'Refurbishment', 'Required Margin']
-        margin_ref = refurb_row.iloc[0] / 100.0 if not refurb_row.empty else 0.0
-
-        df_input2.loc[df_input2['Metric'] == 'Refurbishment', 'Max_BBB_Valuation'] = price_ref * (1 - margin_ref) - cost_ref if price_ref else -cost_ref
-        df_input2.loc[df_input2['Metric'] == 'Refurbishment', 'Profit'] = price_ref - cost_ref
-        df_input2.loc[df_input2['Metric'] == 'Refurbishment', 'Margin_toGet'] = safe_margin(price_ref, cost_ref) * 100
-
-        price_mod = df_bb[df_bb['to_harv'] > 0]['price_mod'].sum()
-        cost_mod = df_bb[df_bb['to_harv'] > 0]['cost_mod'].sum()
-        module_row = df_input2.loc[df_input2['Metric'] == 'Harvesting - Module', 'Required Margin']
-        margin_mod = module_row.iloc[0] / 100.0 if not module_row.empty else 0.0
-
-        df_input2.loc[df_input2['Metric'] == 'Harvesting - Module', 'Max_BBB_Valuation'] = price_mod * (1 - margin_mod) - cost_mod if price_mod else -cost_mod
-        df_input2.loc[df_input2['Metric'] == 'Harvesting - Module', 'Profit'] = price_mod - cost_mod
-        df_input2.loc[df_input2['Metric'] == 'Harvesting - Module', 'Margin_toGet'] = safe_margin(price_mod, cost_mod) * 100
-
-        price_parts = df_bb[df_bb['to_harv'] > 0]['price_part'].sum()
-        cost_parts = df_bb[df_bb['to_harv'] > 0]['cost_part'].sum()
-        parts_row = df_input2.loc[df_input2['Metric'] == 'Harvesting - Parts', 'Required Margin']
-        margin_part = parts_row.iloc[0] / 100.0 if not parts_row.empty else 0.0
-
-        df_input2.loc[df_input2['Metric'] == 'Harvesting - Parts', 'Max_BBB_Valuation'] = price_parts * (1 - margin_part) - cost_parts if price_parts else -cost_parts
-        df_input2.loc[df_input2['Metric'] == 'Harvesting - Parts', 'Profit'] = price_parts - cost_parts
-        df_input2.loc[df_input2['Metric'] == 'Harvesting - Parts', 'Margin_toGet'] = safe_margin(price_parts, cost_parts) * 100
-
-        price_tot = df_bb[df_bb['bb'] > 0]['price'].sum()
-        cost_wo_scrap = df_bb[df_bb['bb'] > 0]['cost'].sum()
-        cost_scrap_tot = df_bb[df_bb['bb'] > 0]['cost_scrap'].sum()
-        price_scrap_tot = df_bb[df_bb['bb'] > 0]['price_scrap'].sum()
+        # User Input2 rows by Metric
+        metrics = self.index('User Input2', df_input2, 'Metric', ['Required Margin'])
+
+        def required_margin(metric):
+            row = metrics.get(metric)
+            return row[0] / 100.0 if row is not None else 0.0
+
+        def set_metric(metric, column, value):
+            rows = metrics.rows(metric)
+            if rows:
+                df_input2.iloc[rows, df_input2.columns.get_loc(column)] = value
+
+        totals = self.metric_totals(df_bb)
+
+        price_ref, cost_ref = totals['Refurbishment']
+        margin_ref = required_margin('Refurbishment')
+
+        set_metric('Refurbishment', 'Max_BBB_Valuation', price_ref * (1 - margin_ref) - cost_ref if price_ref else -cost_ref)
+        set_metric('Refurbishment', 'Profit', price_ref - cost_ref)
+        set_metric('Refurbishment', 'Margin_toGet', safe_margin(price_ref, cost_ref) * 100)
+
+        price_mod, cost_mod = totals['Harvesting - Module']
+        margin_mod = required_margin('Harvesting - Module')
+
+        set_metric('Harvesting - Module', 'Max_BBB_Valuation', price_mod * (1 - margin_mod) - cost_mod if price_mod else -cost_mod)
+        set_metric('Harvesting - Module', 'Profit', price_mod - cost_mod)
+        set_metric('Harvesting - Module', 'Margin_toGet', safe_margin(price_mod, cost_mod) * 100)
+
+        price_parts, cost_parts = totals['Harvesting - Parts']
+        margin_part = required_margin('Harvesting - Parts')
+
+        set_metric('Harvesting - Parts', 'Max_BBB_Valuation', price_parts * (1 - margin_part) - cost_parts if price_parts else -cost_parts)
+        set_metric('Harvesting - Parts', 'Profit', price_parts - cost_parts)
+        set_metric('Harvesting - Parts', 'Margin_toGet', safe_margin(price_parts, cost_parts) * 100)
+
+        price_tot, cost_wo_scrap = totals['Total Without Scrap']
+        price_scrap_tot, cost_scrap_tot = totals['Scrap']
  
         # Total Without Scrap
-        tot_wo_row = df_input2.loc[df_input2['Metric'] == 'Total Without Scrap', 'Required Margin']
-        margin_wo = tot_wo_row.iloc[0] / 100.0 if not tot_wo_row.empty else 0.0
-        df_input2.loc[df_input2['Metric'] == 'Total Without Scrap', 'Max_BBB_Valuation'] = price_tot * (1 - margin_wo) - cost_wo_scrap
-        df_input2.loc[df_input2['Metric'] == 'Total Without Scrap', 'Profit'] = price_tot - cost_wo_scrap
-        df_input2.loc[df_input2['Metric'] == 'Total Without Scrap', 'Margin_toGet'] = safe_margin(price_tot, cost_wo_scrap) * 100
+        margin_wo = required_margin('Total Without Scrap')
+        set_metric('Total Without Scrap', 'Max_BBB_Valuation', price_tot * (1 - margin_wo) - cost_wo_scrap)
+        set_metric('Total Without Scrap', 'Profit', price_tot - cost_wo_scrap)
+        set_metric('Total Without Scrap', 'Margin_toGet', safe_margin(price_tot, cost_wo_scrap) * 100)
 
         # Scrap only
-        scrap_row = df_input2.loc[df_input2['Metric'] == 'Scrap', 'Required Margin']
-        margin_scrap = scrap_row.iloc[0] / 100.0 if not scrap_row.empty else 0.0
-        df_input2.loc[df_input2['Metric'] == 'Scrap', 'Max_BBB_Valuation'] = price_scrap_tot * (1 - margin_scrap) - cost_scrap_tot
-        df_input2.loc[df_input2['Metric'] == 'Scrap', 'Profit'] = price_scrap_tot - cost_scrap_tot
-        df_input2.loc[df_input2['Metric'] == 'Scrap', 'Margin_toGet'] = 0
+        margin_scrap = required_margin('Scrap')
+        set_metric('Scrap', 'Max_BBB_Valuation', price_scrap_tot * (1 - margin_scrap) - cost_scrap_tot)
+        set_metric('Scrap', 'Profit', price_scrap_tot - cost_scrap_tot)
+        set_metric('Scrap', 'Margin_toGet', 0)
 
         # Total With Scrap
-        with_scrap_row = df_input2.loc[df_input2['Metric'] == 'Total With Scrap', 'Required Margin']
-        margin_with = with_scrap_row.iloc[0] / 100.0 if not with_scrap_row.empty else 0.0
-        price_with = price_tot + price_scrap_tot
-        cost_with = cost_wo_scrap + cost_scrap_tot
-        df_input2.loc[df_input2['Metric'] == 'Total With Scrap', 'Max_BBB_Valuation'] = price_with * (1 - margin_with) - cost_with
-        df_input2.loc[df_input2['Metric'] == 'Total With Scrap', 'Profit'] = price_with - cost_with
-        df_input2.loc[df_input2['Metric'] == 'Total With Scrap', 'Margin_toGet'] = safe_margin(price_with, cost_with) * 100
+        margin_with = required_margin('Total With Scrap')
+        price_with, cost_with = totals['Total With Scrap']
+        set_metric('Total With Scrap', 'Max_BBB_Valuation', price_with * (1 - margin_with) - cost_with)
+        set_metric('Total With Scrap', 'Profit', price_with - cost_with)
+        set_metric('Total With Scrap', 'Margin_toGet', safe_margin(price_with, cost_with) * 100)
 
         output1 = df_bb[['Machine', 'bb','inv_use','Required margin (%)','Recommended_BB_Price']].rename(columns={
             'bb': 'Recommended Buy',
@@ -469,44 +1030,98 @@ class tools:
 
         return output1, df_input2
 
-    def scrap_pro(self, bundle, scrap, qtc):
-        
-        counter = 0
-
-        while bundle['Bundle'].sum() > 0:
-           
-            if bundle['Bundle'].iloc[counter] > 0 :
-
-                scrap_cost = 0
-                scrap_price = 0
-
-                base = bundle['Machine'].iloc[counter]
-                bundle.loc[bundle['Machine'] == base, 'Bundle'] -= 1
-                bundle.loc[bundle['Machine'] == base, 'bb'] += 1
+    @staticmethod
+    def _unit_scrap(base, qtc_rates, scrap_rates):
+        """(price, cost) of scrapping one base machine: its residual value; de-install + freight + scrap value"""
+        scrap_cost = 0
+        scrap_price = 0
+        qtc_match = qtc_rates.get(base)
+        if qtc_match is not None:
+            scrap_cost += qtc_match[0] + qtc_match[1]
+        scrap_match = scrap_rates.get(('System', base))
+        if scrap_match is not None:
+            scrap_cost += scrap_match[1]
+            scrap_price += scrap_match[0]
+        return scrap_price, scrap_cost
+
+    def scrap_values(self, machines, scrap, qtc):
+        """{machine: what scrap_pro nets for one leftover unit of it (price - cost, see _unit_scrap)}"""
+        qtc_rates = self.index('QTC Input', qtc, 'Input_type', ['Audit_De_install', 'Freight_inbound'])
+        scrap_rates = self.index('Scrap', scrap, ['Type', 'id_component'], ['residual_value', 'scrap_value'])
+        values = {}
+        for machine in machines:
+            price, cost = self._unit_scrap(machine, qtc_rates, scrap_rates)
+            values[machine] = price - cost
+        return values
 
-                qtc_match = qtc.loc[qtc['Input_type'] == base]
-                if not qtc_match.empty:
-                    scrap_cost += qtc_match['Audit_De_install'].iloc[0] + qtc_match['Freight_inbound'].iloc[0]
-                else:
-                    self.warnings.setdefault('missing_qtc_rows', []).append(base)
+    def scrap_pro(self, bundle, scrap, qtc):
+        """
+        Scrap whatever is left of the offered bundle.
+
+        Each remaining machine costs its QTC de-install + freight plus its System
+        scrap value and returns its residual value. Machines are scrapped row by row
+        while the bundle total stays positive, so with unique machine keys and
+        whole-number counts a row scraps min(its count, what is left of the total)
+        units, from a cumulative sum over the rows, and every row is scrapped at once
+        (totals as in _add_repeated). Otherwise (duplicate machines
+        share their count) units are scrapped one at a time. Missing QTC/Scrap rows
+        are recorded once per machine as missing keys. bundle is updated in place.
+        """
 
-                scrap_match = scrap.loc[(scrap['Type'] == 'System') & (scrap['id_component'] == base)]
-                if not scrap_match.empty:
-                    scrap_cost += scrap_match['scrap_value'].iloc[0]
-                    scrap_price += scrap_match['residual_value'].iloc[0]
+        qtc_rates = self.index('QTC Input', qtc, 'Input_type', ['Audit_De_install', 'Freight_inbound'])
+        scrap_rates = self.index('Scrap', scrap, ['Type', 'id_component'], ['residual_value', 'scrap_value'])
+
+        machines = bundle['Machine'].tolist()
+        cols = {c: bundle[c].to_numpy(copy=True) for c in ['Bundle', 'bb', 'cost_scrap', 'price_scrap']}
+        units = cols['Bundle']
+        machine_rows = KeyIndex(bundle, 'Machine')
+
+        # Per-unit scrap cost and price of each row's machine
+        rates = [self._unit_scrap(base, qtc_rates, scrap_rates) for base in machines]
+        unit_price = [price for price, _ in rates]
+        unit_cost = [cost for _, cost in rates]
+
+        def check_rates(row):
+            base = machines[row]
+            if qtc_rates.get(base) is None:
+                self._missing_key('QTC', base)
+            if scrap_rates.get(('System', base)) is None:
+                self._missing_key('Scrap', ('System', base))
+
+        def scrap_units(rows, row, k):
+            check_rates(row)
+            for r in rows:
+                units[r] -= k
+                cols['bb'][r] += k
+                cols['cost_scrap'][r] = _add_repeated(cols['cost_scrap'][r], unit_cost[row], k)
+                cols['price_scrap'][r] = _add_repeated(cols['price_scrap'][r], unit_price[row], k)
+
+        unique = all(len(machine_rows.rows(m)) <= 1 for m in machines)
+
+        if unique and _whole_numbers(units):
+            total = int(pd.Series(units).sum())
+            if total > 0:
+                positive = np.maximum(units, 0).astype(np.int64)
+                before = np.cumsum(positive) - positive
+                taken = np.clip(np.minimum(positive, total - before), 0, None)
+                for row in np.flatnonzero(taken):
+                    check_rates(row)
+                # Every row's whole share at once
+                units -= taken
+                cols['bb'] += taken
+                for c, unit in (('cost_scrap', unit_cost), ('price_scrap', unit_price)):
+                    cols[c] = _add_repeated_each(cols[c], unit, taken)
+        else:
+            counter = 0
+            while pd.Series(units).sum() > 0:
+                if units[counter] > 0:
+                    scrap_units(machine_rows.rows(machines[counter]) or [counter], counter, 1)
+                elif counter < len(units) - 1:
+                    counter += 1
                 else:
-                    self.warnings.setdefault('missing_scrap_rows', []).append(base)
-
-                bundle.loc[bundle['Machine'] == base, 'cost_scrap'] += scrap_cost
-                bundle.loc[bundle['Machine'] == base, 'price_scrap'] += scrap_price
+                    counter = 0
 
-            elif counter < len(bundle) - 1:
-
-                counter += 1
-
-            else :
-
-                counter = 0
+        for c, values in cols.items():
+            bundle[c] = values
 
         return bundle
-
@@ -0,0 +1,151 @@
+"""
+Server Warm-up and Readiness
+Work done once per deployment before the server takes traffic. Under a
+pre-forking server (see gunicorn.conf.py) warm_up runs in the master with the
+app preloaded, so the web workers fork with the libraries imported and Base.xlsx
+already validated; after_fork then gives each worker its own database
+connections and optimizer pool.
+
+The master's parsed Base.xlsx reaches the web workers, which fork from it, but
+not the optimizer processes: those come from the pool's fork server, a fresh
+interpreter each web worker starts. With the 'forkserver' start method that
+server loads the reference data once (OptimizerPool.preload_reference) and the
+optimizer processes fork with it; with 'spawn' each loads its own
+(optimizer_pool.load_reference), from the columnar snapshot when there is one.
+
+/ready reports the readiness state kept here.
+"""
+import importlib
+import logging
+import threading
+import time
+
+import optimizer_pool
+import reference_data
+
+logger = logging.getLogger(__name__)
+
+# Imported up front so no request pays for them
+HEAVY_MODULES = ('numpy', 'pandas', 'openpyxl', 'sqlalchemy', 'data_source', 'toolBox',
+                 'flow_engine', 'optimizer_asml', 'base_snapshot')
+
+# Base.xlsx sheets every optimization reads from the reference data
+REFERENCE_SHEETS = ('QTC', 'QTC Modules', 'QTC Parts', 'CoreQInventory', 'Scrap')
+
+
+class Readiness:
+    """
+    Outcome of each warm-up step ('imports', 'reference', 'auth_db',
+    'optimizer_pool'): ok flag, seconds taken and detail. Ready once every
+    expected step has succeeded.
+    """
+
+    def __init__(self, expected=('imports', 'reference', 'auth_db', 'optimizer_pool')):
+        self.expected = tuple(expected)
+        self._checks = {}
+        self._lock = threading.Lock()
+
+    def mark(self, check, ok, seconds=0.0, **detail):
+        with self._lock:
+            self._checks[check] = {'ok': ok, 'seconds': round(seconds, 3), **detail}
+
+    def reset(self, check):
+        with self._lock:
+            self._checks.pop(check, None)
+
+    @property
+    def ready(self):
+        with self._lock:
+            return all(self._checks.get(c, {}).get('ok') for c in self.expected)
+
+    def to_dict(self):
+        with self._lock:
+            checks = {c: dict(self._checks[c]) if c in self._checks else {'ok': False, 'pending': True}
+                      for c in self.expected}
+        failed = [c for c, v in checks.items() if not v['ok'] and not v.get('pending')]
+        status = 'ready' if all(v['ok'] for v in checks.values()) else ('failed' if failed else 'starting')
+        return {'status': status, 'checks': checks}
+
+
+readiness = Readiness()
+
+
+def _step(check, fn):
+    """Run one warm-up step, recording its outcome; exceptions are logged, not raised"""
+    started = time.perf_counter()
+    try:
+        detail = fn() or {}
+    except Exception as e:
+        logger.error(f"Warm-up step '{check}' failed: {e}")
+        readiness.mark(check, False, time.perf_counter() - started, error=str(e))
+        return False
+    ok = detail.pop('ok', True)
+    readiness.mark(check, ok, time.perf_counter() - started, **detail)
+    return ok
+
+
+def _import_heavy():
+    for name in HEAVY_MODULES:
+        importlib.import_module(name)
+    return {'modules': len(HEAVY_MODULES)}
+
+
+def _load_reference(base_path):
+    ref = reference_data.get_reference(base_path)
+    missing_sheets = [s for s in REFERENCE_SHEETS if not ref.has_sheet(s)]
+    for sheet, cols in ref.missing_columns.items():
+        logger.warning(f"Base.xlsx sheet '{sheet}' lacks columns: {', '.join(cols)}")
+    if missing_sheets:
+        logger.error(f"Base.xlsx lacks reference sheets: {', '.join(missing_sheets)}")
+    # Memoized for the result cache key, so the first request does not hash the file
+    reference_data.workbook_version(base_path)
+    return {'ok': not missing_sheets, 'version': ref.version[:12], 'origin': ref.origin,
+            'missing_sheets': missing_sheets, 'missing_columns': ref.missing_columns}
+
+
+def _open_auth_db(engine):
+    if engine is None:
+        return {'enabled': False}
+    with engine.connect():
+        pass
+    # Connect once (dialect setup, create_all already ran) but hand no open
+    # connection to forked workers
+    engine.dispose()
+    return {'enabled': True, 'dialect': engine.dialect.name}
+
+
+def warm_up(base_path, auth_engine=None):
+    """Import heavy libraries, load and validate Base.xlsx and open the auth database once"""
+    started = time.perf_counter()
+    _step('imports', _import_heavy)
+    _step('reference', lambda: _load_reference(base_path))
+    _step('auth_db', lambda: _open_auth_db(auth_engine))
+    logger.info(f"Warm-up finished in {time.perf_counter() - started:.2f}s")
+    return readiness
+
+
+def warm_pool(pool, fn=None, *args, base_path=None):
+    """
+    Start the optimizer pool's workers (running fn(*args) on each) and record it;
+    base_path is preloaded in the pool's fork server, if it uses one
+    """
+    def start():
+        if base_path is not None:
+            pool.preload_reference(base_path)
+        pool.warm_up(fn, *args)
+        return {'workers': pool.size, 'start_method': pool.start_method}
+    return _step('optimizer_pool', start)
+
+
+def after_fork(pool, base_path, auth_engine=None):
+    """
+    In a freshly forked web worker: drop inherited database connections and warm
+    this worker's optimizer pool in the background (/ready answers 503 meanwhile)
+    """
+    if auth_engine is not None:
+        auth_engine.dispose(close=False)
+    readiness.reset('optimizer_pool')
+    thread = threading.Thread(target=warm_pool, args=(pool, optimizer_pool.load_reference, str(base_path)),
+                              kwargs={'base_path': base_path}, name='optimizer-warm-up', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,54 @@
+"""
+Per-request Workspaces
+Each optimization gets its own scratch directory so concurrent requests never
+read or overwrite each other's MasterDB.xlsx. Results are published to the
+shared location with an atomic rename.
+"""
+import os
+import shutil
+import tempfile
+import uuid
+from pathlib import Path
+
+# Root for scratch directories; defaults to the system temp dir
+WORKSPACE_ROOT = Path(os.environ.get('OPTIMIZER_WORKSPACE_DIR') or Path(tempfile.gettempdir()) / 'bb_optimizer')
+
+
+class Workspace:
+    """Scratch directory holding one request's working copy of MasterDB.xlsx"""
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.master_db = self.root / 'MasterDB.xlsx'
+
+    @classmethod
+    def create(cls, parent=None):
+        parent = Path(parent or WORKSPACE_ROOT)
+        parent.mkdir(parents=True, exist_ok=True)
+        return cls(tempfile.mkdtemp(prefix='run-', dir=parent))
+
+    def publish(self, target):
+        """
+        Atomically replace target with this workspace's MasterDB.xlsx
+
+        The file is first copied next to target and then renamed over it, so
+        readers of target always see either the previous or the new workbook.
+        """
+        target = Path(target)
+        tmp = target.with_name(f'.{target.name}.{uuid.uuid4().hex}.tmp')
+        try:
+            shutil.copy2(self.master_db, tmp)
+            os.replace(tmp, target)
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+
+    def cleanup(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cleanup()
+        return False
@@ -0,0 +1,8 @@
+"""
+WSGI entry point for production serving: gunicorn -c gunicorn.conf.py wsgi:app
+With preload_app the master imports this module, so the warm-up in create_app
+runs once before the web workers fork.
+"""
+from optimize_excel import create_app
+
+app = create_app()
@@ -0,0 +1,142 @@
+"""
+Benchmark: /api/auth/me requests/sec with the shared auth data layer vs the previous one.
+
+The previous layer is rebuilt here as the reference: a new sessionmaker for
+every database session, separate session and user queries, SQLite with its
+default rollback journal. Both run behind the Flask test client with the
+session validation cache disabled, so every request reaches the database:
+  1. one client thread;
+  2. THREADS client threads while a writer keeps logging users in and out
+     (session inserts and deletes), where the rollback journal makes readers
+     wait on the writer and WAL does not.
+
+Run: python scripts/bench_auth.py [seconds per run]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / 'backend'))
+os.chdir(ROOT / 'backend')
+TMP = tempfile.mkdtemp()
+# Keep the app's own auth database out of the benchmark
+os.environ['DATABASE_URL'] = f'sqlite:///{TMP}/app.db'
+
+import optimize_excel  # noqa: E402
+from auth_models import Base, Session, User  # noqa: E402
+from auth_service import AuthService  # noqa: E402
+from session_cache import SessionCache  # noqa: E402
+
+THREADS = 8
+USERS = 50
+
+
+class LegacyAuthService(AuthService):
+    """Previous data layer, kept as the reference"""
+
+    def __init__(self, db_url):
+        self.engine = create_engine(db_url, echo=False)
+        Base.metadata.create_all(self.engine)
+        self.session_cache = SessionCache(max_entries=0)
+        self.token_mode, self.signer, self.revocations = 'db', None, None
+
+    def _get_session(self):
+        return sessionmaker(bind=self.engine)()
+
+    def validate_session(self, session_token):
+        db = self._get_session()
+        try:
+            session = db.query(Session).filter(Session.session_token == session_token).first()
+            if not session:
+                return False, None
+            if session.expires_at < datetime.utcnow():
+                db.delete(session)
+                db.commit()
+                return False, None
+            user = db.query(User).filter(User.id == session.user_id).first()
+            if not user or not user.is_active:
+                return False, None
+            return True, user.to_dict()
+        except Exception:
+            return False, None
+        finally:
+            db.close()
+
+
+def seed(service):
+    """USERS users with one session each (no bcrypt: the benchmark is about the data layer)"""
+    db = service._get_session()
+    tokens = []
+    for i in range(USERS):
+        user = User(username=f'bench{i}', email=f'bench{i}@example.com', password_hash='-')
+        db.add(user)
+        db.flush()
+        token = Session.generate_token()
+        db.add(Session(user_id=user.id, session_token=token, expires_at=datetime.utcnow() + timedelta(days=1)))
+        tokens.append(token)
+    db.commit()
+    db.close()
+    return tokens
+
+
+def writer(service, stop):
+    """Logins and logouts: a session insert and a delete, each its own transaction"""
+    while not stop.is_set():
+        db = service._get_session()
+        token = Session.generate_token()
+        db.add(Session(user_id=1, session_token=token, expires_at=datetime.utcnow() + timedelta(days=1)))
+        db.commit()
+        db.query(Session).filter(Session.session_token == token).delete()
+        db.commit()
+        db.close()
+
+
+def run(service, tokens, seconds, threads, with_writer):
+    optimize_excel.auth_service = service
+    app = optimize_excel.create_app(warm_up=False)
+    stop = threading.Event()
+    counts = [[0, 0] for _ in range(threads)]   # [ok, failed] per thread
+
+    def client(n):
+        http = app.test_client()
+        i = n
+        while not stop.is_set():
+            response = http.get('/api/auth/me', headers={'Authorization': f'Bearer {tokens[i % len(tokens)]}'})
+            counts[n][response.status_code != 200] += 1
+            i += 1
+
+    workers = [threading.Thread(target=client, args=(n,)) for n in range(threads)]
+    if with_writer:
+        workers.append(threading.Thread(target=writer, args=(service, stop)))
+    for w in workers:
+        w.start()
+    time.sleep(seconds)
+    stop.set()
+    for w in workers:
+        w.join()
+    return sum(c[0] for c in counts) / seconds, sum(c[1] for c in counts)
+
+
+if __name__ == '__main__':
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 3
+    services = {
+        'before': LegacyAuthService(f'sqlite:///{TMP}/before.db'),
+        'after': AuthService(f'sqlite:///{TMP}/after.db', session_cache=SessionCache(max_entries=0)),
+    }
+    tokens = {name: seed(service) for name, service in services.items()}
+
+    print(f'{"scenario":>24} {"before":>12} {"after":>12} {"speedup":>8}')
+    for label, threads, with_writer in (('1 client', 1, False), (f'{THREADS} clients + writer', THREADS, True)):
+        results = {name: run(service, tokens[name], seconds, threads, with_writer)
+                   for name, service in services.items()}
+        (before, before_failed), (after, after_failed) = results['before'], results['after']
+        failed = f'  (failed requests: {before_failed} -> {after_failed})' if before_failed or after_failed else ''
+        print(f'{label:>24} {before:>8.0f} r/s {after:>8.0f} r/s {after / before:>7.2f}x{failed}')
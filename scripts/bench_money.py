@@ -0,0 +1,104 @@
+"""
+Benchmark: money.truncate (vectorized cents) vs the previous per-value Decimal truncation.
+
+Generates monetary columns - computed prices with float noise, values just off a
+cent boundary, whole numbers, 2-decimal inputs, zeros, negatives - and
+  1. checks the vectorized truncation returns exactly the previous results (same
+     floats, same sign of zero, NaN where Decimal gives NaN), both for result
+     cells (stored in the workbook at 16 significant digits and read back) and
+     payload values (str form);
+  2. times both as the column grows, for that mix (about half the values sit on a
+     cent boundary) and for computed prices alone, the bulk of real result cells.
+
+Run: python scripts/bench_money.py [rows]
+"""
+import math
+import sys
+import time
+from decimal import Decimal, ROUND_DOWN, InvalidOperation, localcontext
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / 'backend'))
+
+import money  # noqa: E402
+
+# Significant digits result cells were stored at (optimize_excel.RESULT_MONEY_DIGITS)
+RESULT_DIGITS = 16
+
+
+def legacy_to_money(v):
+    try:
+        with localcontext() as ctx:
+            ctx.prec = 28
+            d = Decimal(str(v))
+            return float(d.quantize(Decimal('0.01'), rounding=ROUND_DOWN))
+    except (InvalidOperation, Exception):
+        try:
+            # Fallback: truncate using math for non-decimal-friendly inputs
+            f = float(v)
+            return math.floor(f * 100.0) / 100.0
+        except Exception:
+            return 0.0
+
+
+def legacy_truncate_money(v):
+    """
+    How result cells used to be truncated: stored in MasterDB.xlsx (openpyxl writes
+    '%.16g'), read back as a float and truncated from its str() by legacy_to_money
+    """
+    return legacy_to_money(float('%.16g' % v))
+
+
+def column(rng, rows):
+    """Monetary values of every kind the optimizer and the UI produce"""
+    kind = rng.integers(0, 6, rows)
+    cents = rng.integers(-10**8, 10**8, rows)
+    values = np.select(
+        [kind == 0, kind == 1, kind == 2, kind == 3, kind == 4],
+        [rng.uniform(-1e6, 1e6, rows) * rng.uniform(0.6, 1.0, rows),   # computed prices
+         np.nextafter(cents / 100.0, np.where(rng.random(rows) < 0.5, -np.inf, np.inf)),  # cent +- 1 ulp
+         (cents // 100).astype(float),                                  # whole amounts
+         cents / 100.0,                                                 # 2-decimal inputs
+         np.zeros(rows)],
+        (cents / 100.0) * 3 * 0.1)                                      # float noise
+    # 8217.39 - 4.5e-13 prints as 8217.389999999999 at 16 digits, which reads back as 8217.39
+    return np.concatenate([values, [np.nan, np.inf, -np.inf, -0.0, 1e20, 1173.1899999999996,
+                                    8217.39, 8217.39 - 4.5e-13, -8217.39 + 4.5e-13]])
+
+
+def same(a, b):
+    return (math.isnan(a) and math.isnan(b)) or (a == b and math.copysign(1, a) == math.copysign(1, b))
+
+
+def check_identical(rng, rows=200_000):
+    values = column(rng, rows)
+    for digits, legacy in ((RESULT_DIGITS, legacy_truncate_money), (None, legacy_to_money)):
+        actual = money.truncate(values, digits)
+        bad = [v for v, a in zip(values, actual) if not same(a, legacy(v))]
+        assert not bad, f'mismatch for digits={digits}: {bad[:5]}'
+    mixed = [1, '12.345', None, True, 'abc', 12.349999999999, 10**30, '0.1299999999999999999']
+    assert all(same(a, legacy_to_money(v)) for v, a in zip(mixed, money.truncate(mixed)))
+    print(f'identical results on {len(values)} values')
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    rng = np.random.default_rng(7)
+    check_identical(rng)
+
+    print(f'{"values":>9} {"rows":>8} {"decimal":>10} {"vector":>10} {"speedup":>8}')
+    for label, make in (('mixed', column), ('computed', lambda rng, n: rng.uniform(-1e6, 1e6, n) * 0.7)):
+        for n in (100, 1_000, 10_000, rows):
+            values = make(rng, n)
+            before = timed(lambda: [legacy_truncate_money(v) for v in values])
+            after = timed(money.truncate, values, RESULT_DIGITS)
+            print(f'{label:>9} {len(values):>8} {before:>9.4f}s {after:>9.4f}s {before / after:>7.1f}x')
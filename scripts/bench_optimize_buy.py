@@ -0,0 +1,181 @@
+"""
+Benchmark: tools.optimize_buy (batch allocation) vs the previous one-unit-per-iteration loop.
+
+Generates random buy-back scenarios (machine types, a full QTC base -> output table,
+system demand, core inventory, pipeline) and
+  1. checks the batch allocation gives the same frames as the legacy loop,
+     including fractional quantities and duplicate keys: every quantity exactly,
+     the Delta/price/cost totals (k * value instead of k additions) up to float
+     rounding in the last bits;
+  2. times both as the offered bundle grows.
+
+Run: python scripts/bench_optimize_buy.py [machine_types]
+"""
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / 'backend'))
+
+from toolBox import tools  # noqa: E402
+
+
+# Previous implementation, kept verbatim as the reference
+def legacy_optimize_buy(demanda, bundle, bundle_delta, inv_delta, inventario, bundle_delta_sorted=None):
+
+    recommend = bundle.copy()
+
+    recommend['bb'] = 0
+    recommend['inv_use'] = 0 
+    recommend['to_ref'] = 0 
+    recommend['to_harv'] = 0
+    recommend['delta'] = 0.0
+    recommend['price'] = 0.0
+    recommend['cost'] = 0.0
+    recommend['price_mod'] = 0.0
+    recommend['cost_mod'] = 0.0
+    recommend['price_part'] = 0.0
+    recommend['cost_part'] = 0.0
+    recommend['cost_scrap'] = 0.0
+    recommend['price_scrap'] = 0.0
+
+    counter = 0
+
+    if bundle_delta_sorted is None:
+        bundle_delta_sorted = bundle_delta.sort_values(by='Delta', ascending=False)
+
+    #print(demanda)
+
+    while demanda['req_demand'].sum() > 0 and recommend['Bundle'].sum() > 0 and counter < len(bundle_delta_sorted):
+
+        base = bundle_delta_sorted['base'].iloc[counter]
+        output = bundle_delta_sorted['output'].iloc[counter]
+
+        sel_bundle = recommend.loc[recommend['Machine'] == base, 'Bundle']
+        if sel_bundle.empty or sel_bundle.iloc[0] <= 0:
+            counter += 1
+            continue
+
+        if not demanda.loc[demanda['System'] == output].empty and demanda.loc[demanda['System'] == output, 'req_demand'].iloc[0] > 0:
+
+                #print(bundle_delta)
+                delta_bundle = bundle_delta.loc[(bundle_delta['base'] == base) & (bundle_delta['output'] == output), 'Delta'].iloc[0]
+                price = bundle_delta.loc[(bundle_delta['base'] == base) & (bundle_delta['output'] == output), 'Sales_price'].iloc[0]
+                cost = bundle_delta.loc[(bundle_delta['base'] == base) & (bundle_delta['output'] == output), 'Tot_cost'].iloc[0]
+                bb_price = bundle_delta.loc[(bundle_delta['base'] == base) & (bundle_delta['output'] == output), 'Buy'].iloc[0]
+
+                if inventario.loc[inventario['System'] == base, 'CoreInventory'].iloc[0] > 0 :
+
+                    delta_inv = inv_delta.loc[(inv_delta['base'] == base) & (inv_delta['output'] == output), 'Delta'].iloc[0]
+                  
+                    if  delta_bundle > delta_inv :
+
+                        recommend.loc[recommend['Machine'] == base, 'bb'] += 1
+                        recommend.loc[recommend['Machine'] == base, 'Bundle'] -= 1
+                        demanda.loc[demanda['System'] == output, 'req_demand'] -= 1
+                        recommend.loc[recommend['Machine'] == base, 'to_ref'] += 1
+                        recommend.loc[recommend['Machine'] == base, 'delta'] += delta_bundle
+                        recommend.loc[recommend['Machine'] == base, 'price'] += price
+                        recommend.loc[recommend['Machine'] == base, 'cost'] += cost - bb_price
+
+                    else :
+
+                        inventario.loc[inventario['System'] == base, 'CoreInventory'] -= 1
+                        demanda.loc[demanda['System'] == output, 'req_demand'] -= 1
+                        recommend.loc[recommend['Machine'] == base, 'inv_use'] += 1
+
+                elif recommend.loc[recommend['Machine'] == base, 'Pipeline'].iloc[0] > 0:
+
+                    recommend.loc[recommend['Machine'] == base, 'Pipeline'] -= 1
+                    demanda.loc[demanda['System'] == output, 'req_demand'] -= 1
+                    recommend.loc[recommend['Machine'] == base, 'inv_use'] += 1
+
+                else :
+                   
+                    recommend.loc[recommend['Machine'] == base, 'bb'] += 1
+                    recommend.loc[recommend['Machine'] == base, 'Bundle'] -= 1
+                    demanda.loc[demanda['System'] == output, 'req_demand'] -= 1
+                    recommend.loc[recommend['Machine'] == base, 'to_ref'] += 1
+                    recommend.loc[recommend['Machine'] == base, 'delta'] += delta_bundle
+                    recommend.loc[recommend['Machine'] == base, 'price'] += price
+                    recommend.loc[recommend['Machine'] == base, 'cost'] += cost - bb_price
+
+        else:
+            counter += 1
+
+        #print(demanda)
+        #print(recommend)
+
+    return recommend
+
+
+
+
+def scenario(rng, machines, bundle_units, fractional=False, duplicates=False):
+    names = [f'SYS{i:03d}' for i in range(machines)]
+    pairs = [(b, o) for b in names for o in names]
+    qtc = pd.DataFrame({
+        'base': [b for b, _ in pairs],
+        'output': [o for _, o in pairs],
+        'Buy': rng.integers(50, 500, len(pairs)) * 1000.0,
+        'Tot_cost': rng.integers(500, 3000, len(pairs)) * 1000.0 + rng.random(len(pairs)).round(2),
+        'Sales_price': rng.integers(1000, 6000, len(pairs)) * 1000.0 + rng.random(len(pairs)).round(2),
+    })
+    bundle_delta = qtc.copy()
+    bundle_delta['Cost'] = bundle_delta['Tot_cost'] - bundle_delta['Buy']
+    bundle_delta['Delta'] = bundle_delta['Sales_price'] - bundle_delta['Cost']
+    inv_delta = qtc.copy()
+    inv_delta['Cost'] = inv_delta['Tot_cost'] - inv_delta['Buy'] * 1.1
+    inv_delta['Delta'] = inv_delta['Sales_price'] - inv_delta['Cost']
+
+    split = rng.multinomial(bundle_units, np.ones(machines) / machines)
+    demand = pd.DataFrame({'System': names, 'req_demand': rng.integers(-5, bundle_units // machines + 10, machines)})
+    inventory = pd.DataFrame({'System': names, 'CoreInventory': rng.integers(0, 4, machines)})
+    bundle = pd.DataFrame({'Machine': names, 'Bundle': split, 'Pipe_units': 0, 'Pipe_prob': 50,
+                           'Pipeline': rng.integers(0, 3, machines)})
+    if fractional:
+        demand['req_demand'] = demand['req_demand'] + 0.3
+        bundle['Pipeline'] = bundle['Pipeline'] * 0.7
+    if duplicates:
+        demand = pd.concat([demand, demand.iloc[:2].assign(req_demand=3)], ignore_index=True)
+        bundle = pd.concat([bundle, bundle.iloc[:1].assign(Bundle=2)], ignore_index=True)
+        bundle_delta = pd.concat([bundle_delta, bundle_delta.iloc[:3].assign(Delta=1e9)], ignore_index=True)
+    return demand, bundle, bundle_delta, inv_delta, inventory
+
+
+def run(fn, args):
+    demand, bundle, bundle_delta, inv_delta, inventory = (df.copy() for df in args)
+    start = time.perf_counter()
+    result = fn(demand, bundle, bundle_delta, inv_delta, inventory)
+    return time.perf_counter() - start, (result, demand, inventory)
+
+
+def check_identical(rng, cases=200):
+    tool = tools()
+    for case in range(cases):
+        args = scenario(rng, int(rng.integers(2, 8)), int(rng.integers(0, 60)),
+                        fractional=case % 3 == 1, duplicates=case % 4 == 2)
+        _, expected = run(legacy_optimize_buy, args)
+        _, actual = run(tool.optimize_buy, args)
+        for e, a in zip(expected, actual):
+            pd.testing.assert_frame_equal(e, a, check_exact=True)
+    print(f'same results on {cases} random scenarios')
+
+
+if __name__ == '__main__':
+    machines = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    rng = np.random.default_rng(7)
+    check_identical(rng)
+
+    tool = tools()
+    print(f'{machines} machine types, {machines * machines} QTC rows')
+    print(f'{"bundle":>8} {"legacy":>10} {"batch":>10} {"speedup":>8}')
+    for units in (10, 50, 100, 250, 500, 1000):
+        args = scenario(rng, machines, units)
+        before, _ = run(legacy_optimize_buy, args)
+        after, _ = run(tool.optimize_buy, args)
+        print(f'{units:>8} {before:>9.3f}s {after:>9.3f}s {before / after:>7.1f}x')
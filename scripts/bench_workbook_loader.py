@@ -0,0 +1,69 @@
+"""
+Benchmark: per-sheet pd.read_excel (old tools._safe_read) vs the single-pass ExcelSource loader.
+
+Builds a large workbook by repeating the rows of public/sample_data/Base.xlsx and
+times reading every sheet tools.read_data/user_input need.
+
+Run: python scripts/bench_workbook_loader.py [rows_per_sheet]
+"""
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / 'backend'))
+
+from data_source import ExcelSource  # noqa: E402
+from toolBox import SHEET_COLUMNS  # noqa: E402
+
+BASE = ROOT / 'public' / 'sample_data' / 'Base.xlsx'
+
+
+def build_workbook(path, rows):
+    sheets = pd.read_excel(BASE, sheet_name=None)
+    sheets['User Input1'] = pd.DataFrame({
+        'Machine type': sheets['CoreQInventory']['System'],
+        'Offered Bundle': 1, 'Units in sales pipeline': 0,
+        'Deal outcome probability': 50, 'Required margin (%)': 40,
+    })
+    sheets['User Input2'] = pd.DataFrame({'Metric': ['Refurbishment'], 'Required Margin': [40], 'Max_BBB_Valuation': [0]})
+    with pd.ExcelWriter(path, engine='openpyxl') as writer:
+        for name, df in sheets.items():
+            reps = max(1, rows // max(len(df), 1))
+            pd.concat([df] * reps, ignore_index=True).to_excel(writer, sheet_name=name, index=False)
+
+
+def per_sheet(path):
+    for name in SHEET_COLUMNS:
+        pd.read_excel(path, sheet_name=name)
+
+
+def single_pass(path):
+    source = ExcelSource(path)
+    source.load(list(SHEET_COLUMNS))
+    for name in SHEET_COLUMNS:
+        source.read(name)
+
+
+def best_of(fn, path, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(path)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'large.xlsx'
+        build_workbook(path, rows)
+        print(f'workbook: ~{rows} rows per sheet, {path.stat().st_size / 1e6:.1f} MB')
+        before = best_of(per_sheet, path)
+        after = best_of(single_pass, path)
+        print(f'per-sheet read_excel : {before:.3f} s')
+        print(f'single-pass loader   : {after:.3f} s  ({before / after:.1f}x)')
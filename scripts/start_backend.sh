@@ -15,9 +15,9 @@ source .venv/bin/activate
 
 # Install/update requirements
 echo "Installing dependencies..."
-pip install -q flask flask-cors pandas openpyxl
+pip install -q -r backend/requirements.txt
 
-# Start the Flask server
+# Start the backend with gunicorn (see backend/gunicorn.conf.py)
 cd backend
-echo "Backend running on http://127.0.0.1:8000"
-python optimize_excel.py
+echo "Backend running on http://127.0.0.1:${PORT:-5001} (ready once /ready answers 200)"
+exec gunicorn -c gunicorn.conf.py wsgi:app
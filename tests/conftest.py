@@ -0,0 +1,104 @@
+"""Shared test setup: the backend modules are imported the way the server runs them."""
+import itertools
+import os
+import random
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / 'backend'))
+
+BASE_XLSX = ROOT / 'public' / 'sample_data' / 'Base.xlsx'
+
+# The app's own auth database (users.db) stays untouched: importing optimize_excel
+# builds an AuthService on DATABASE_URL
+os.environ['DATABASE_URL'] = f"sqlite:///{tempfile.mkdtemp(prefix='bb-tests-')}/users.db"
+
+MACHINES = ['PAS5500/100A', 'PAS5500/200', 'PAS5500/250C', 'PAS5500/3x0', 'PAS5500/22/60/80',
+            'PAS5500/5x0', 'PAS5500/11x0']
+
+
+def make_payload(bundles, pipes, margin=40, with_demand=True, scale=1):
+    """An /api/optimize payload like the UI sends for the sample Base.xlsx"""
+    payload = {
+        'systemRecommendation': [
+            {'machine_type': m, 'offered_bundle': b * scale, 'qtc_avg_bb_price': 1234.5678,
+             'units_in_sales_pipeline': p, 'deal_outcome_probability': 0.5, 'required_margin': margin,
+             'recommended_bb_price_on_bundle': 0}
+            for m, b, p in zip(MACHINES, bundles, pipes)],
+        'maxBuyback': [{'metric': m, 'valuation': 0, 'required_margin': 35}
+                       for m in ['Refurbishment', 'Harvesting - Module', 'Harvesting - Parts',
+                                 'Total Without Scrap', 'Scrap', 'Total With Scrap']],
+    }
+    if with_demand:
+        payload['systems'] = [{'item': s, 'demand_12m': d * scale, 'demand_24m': d * 2, 'finished_12m': f,
+                               'finished_24m': f}
+                              for s, d, f in [('275D', 5, 1), ('350C', 3, 2), ('450F', 3, 0), ('850F', 4, 1),
+                                              ('1150C', 7, 2)]]
+        payload['modules'] = [{'item': s, 'demand_12m': d, 'demand_24m': d, 'finished_12m': 1, 'finished_24m': 1}
+                              for s, d in [('Wafer Transfer System (WTS)', 3), ('Wafer Stage (WS)', 4),
+                                           ('Operator Console Unit (OCU)', 2),
+                                           ('Wafer Prealignment System (WPS)', 5), ('Sensor Plate', 1)]]
+        payload['parts'] = [{'item': s, 'demand_12m': d, 'demand_24m': d, 'finished_12m': 1, 'finished_24m': 1}
+                            for s, d in [('4022.430.13133', 2), ('4022.435.24701', 3), ('4022.435.02062', 1),
+                                         ('4022.454.37512', 4), ('4022.454.11374', 2), ('4022.454.11394', 1),
+                                         ('4022.454.65221', 1)]]
+    return payload
+
+
+# Scenarios the equivalence tests replay (tests/data/baseline_optimize.json)
+SCENARIOS = {
+    'a': make_payload([2, 1, 0, 3, 4, 2, 1], [0, 1, 0, 0, 0, 2, 0]),
+    'b': make_payload([0, 0, 0, 0, 6, 0, 0], [0, 0, 0, 0, 0, 0, 0], margin=30),
+    'c': make_payload([3, 3, 3, 3, 3, 3, 3], [1, 1, 1, 1, 1, 1, 1], with_demand=False),
+    'd': make_payload([5, 2, 1, 8, 10, 4, 2], [2, 0, 1, 0, 3, 0, 0], scale=3),
+}
+
+
+def _large_scenarios(count=25, seed=11):
+    """Deal-sized payloads: bundles up to 40 units, pipelines up to 10, scaled 1, 4 or 9 times"""
+    rng = random.Random(seed)
+    return {f'large-{i:02d}': make_payload([rng.randint(0, 40) for _ in MACHINES],
+                                           [rng.randint(0, 10) for _ in MACHINES],
+                                           margin=rng.choice([30, 35, 40]), scale=rng.choice([1, 4, 9]))
+            for i in range(count)}
+
+
+# Scenarios the large equivalence test replays (tests/data/baseline_optimize_large.json)
+LARGE_SCENARIOS = _large_scenarios()
+
+
+_names = itertools.count()
+
+
+def register(client, admin=False):
+    """A new user (optionally an admin) and a session token for it"""
+    name = f'user{next(_names)}'
+    reply = client.post('/api/auth/register', json={'username': name, 'email': f'{name}@example.com',
+                                                    'password': 'secret-password'})
+    assert reply.status_code == 200
+    if admin:
+        import optimize_excel
+        from auth_models import User
+        db = optimize_excel.auth_service._get_session()
+        try:
+            db.query(User).filter(User.username == name).update({'is_admin': True})
+            db.commit()
+        finally:
+            db.close()
+    token = client.post('/api/auth/login', json={'username': name, 'password': 'secret-password'}).get_json()
+    return token['user'], token['session_token']
+
+
+@pytest.fixture(scope='session')
+def base_xlsx():
+    return BASE_XLSX
+
+
+@pytest.fixture(scope='session')
+def app():
+    import optimize_excel
+    return optimize_excel.create_app(warm_up=False)
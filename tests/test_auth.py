@@ -0,0 +1,47 @@
+"""Auth endpoints, the session validation cache and the admin-only stats routes."""
+import pytest
+
+import optimize_excel
+from conftest import register
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def test_login_validates_and_logout_invalidates(client):
+    user, token = register(client)
+    headers = {'Authorization': f'Bearer {token}'}
+    assert client.get('/api/auth/me', headers=headers).get_json()['user']['id'] == user['id']
+    assert client.get('/api/auth/me', headers=headers).status_code == 200  # from the session cache
+    assert client.post('/api/auth/logout', headers=headers).status_code == 200
+    assert client.get('/api/auth/me', headers=headers).status_code == 401
+
+
+def test_deactivation_ends_cached_sessions(client):
+    user, token = register(client)
+    headers = {'Authorization': f'Bearer {token}'}
+    assert client.get('/api/auth/me', headers=headers).status_code == 200
+    assert optimize_excel.auth_service.set_user_active(user['id'], False)
+    assert client.get('/api/auth/me', headers=headers).status_code == 401
+
+
+def test_session_cache_stats_are_admin_only(client):
+    assert client.get('/api/auth/cache').status_code == 401
+    _, token = register(client)
+    assert client.get('/api/auth/cache', headers={'Authorization': f'Bearer {token}'}).status_code == 403
+    _, token = register(client, admin=True)
+    reply = client.get('/api/auth/cache', headers={'Authorization': f'Bearer {token}'})
+    assert reply.status_code == 200
+    assert 'hits' in reply.get_json()['cache']
+
+
+def test_result_cache_stats_are_admin_only(client):
+    assert client.get('/api/optimize/cache').status_code == 401
+    _, token = register(client)
+    assert client.get('/api/optimize/cache', headers={'Authorization': f'Bearer {token}'}).status_code == 403
+    _, token = register(client, admin=True)
+    reply = client.get('/api/optimize/cache', headers={'Authorization': f'Bearer {token}'})
+    assert reply.status_code == 200
+    assert 'hits' in reply.get_json()['cache']
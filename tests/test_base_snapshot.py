@@ -0,0 +1,75 @@
+"""Columnar Base.xlsx snapshot: memory-mapped loading and use by the optimizer."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import base_snapshot
+import optimize_excel
+import reference_data
+from conftest import BASE_XLSX, SCENARIOS
+from data_source import FrameSource
+from optimizer_asml import optimizer
+
+
+@pytest.fixture(scope='module')
+def snapshot_dir(tmp_path_factory):
+    out_dir, _ = base_snapshot.compile_snapshot(BASE_XLSX, tmp_path_factory.mktemp('snap') / 'Base.snapshot')
+    return out_dir
+
+
+def test_numeric_columns_are_views_of_the_mapped_file(snapshot_dir):
+    manifest, frames = base_snapshot.load_snapshot(BASE_XLSX, reference_data.file_hash(BASE_XLSX), snapshot_dir)
+    numeric = 0
+    for name, info in manifest['sheets'].items():
+        arr = np.load(snapshot_dir / info['file'], mmap_mode='r')
+        df = base_snapshot.array_to_frame(arr, info['columns'])
+        for col in info['columns']:
+            if df[col].dtype != object:
+                numeric += 1
+                assert np.shares_memory(df[col].to_numpy(), arr), (name, col)
+                # Loaded frames map the file read-only rather than holding a copy
+                assert not frames[name][col].to_numpy().flags.writeable, (name, col)
+    assert numeric
+
+
+def test_optimizer_runs_on_the_read_only_snapshot(snapshot_dir, monkeypatch):
+    parsed = reference_data.ReferenceData.build(BASE_XLSX, use_snapshot=False)
+    monkeypatch.setenv('BASE_SNAPSHOT_DIR', str(snapshot_dir))
+    mapped = reference_data.ReferenceData.build(BASE_XLSX)
+    assert mapped.origin == 'snapshot'
+    for payload in SCENARIOS.values():
+        expected = optimizer().version1(FrameSource(optimize_excel._payload_frames(payload)), parsed)
+        result = optimizer().version1(FrameSource(optimize_excel._payload_frames(payload)), mapped)
+        for key in ('out_bb', 'out_tot'):
+            pd.testing.assert_frame_equal(result[key], expected[key])
+
+
+def test_round_trip_matches_the_parsed_workbook(snapshot_dir):
+    parsed = reference_data.ReferenceData.build(BASE_XLSX, use_snapshot=False)
+    manifest, frames = base_snapshot.load_snapshot(BASE_XLSX, parsed.version, snapshot_dir)
+    assert manifest['sheet_names'] == parsed.sheet_names
+    assert frames.keys() == parsed.frames.keys()
+    for name, df in parsed.frames.items():
+        pd.testing.assert_frame_equal(frames[name], df, obj=name)
+
+
+def test_object_values_keep_their_type():
+    df = pd.DataFrame({'id': ['a', 7, 2.5, True, None], 'n': [1.0, 2.0, 3.0, 4.0, 5.0]})
+    back = base_snapshot.array_to_frame(base_snapshot.frame_to_array(df), list(df.columns))
+    assert [type(v) for v in back['id'][:4]] == [str, int, float, bool]
+    assert back['id'].tolist()[:4] == ['a', 7, 2.5, True] and pd.isna(back['id'][4])
+
+
+def test_stale_snapshot_is_not_loaded(snapshot_dir, monkeypatch):
+    version = reference_data.file_hash(BASE_XLSX)
+    assert base_snapshot.load_snapshot(BASE_XLSX, version, snapshot_dir) is not None
+    # Workbook content changed since the snapshot was compiled
+    assert base_snapshot.load_snapshot(BASE_XLSX, 'other-content', snapshot_dir) is None
+    # Required columns changed
+    monkeypatch.setattr(base_snapshot, 'schema_hash', lambda: 'other-schema')
+    assert base_snapshot.load_snapshot(BASE_XLSX, version, snapshot_dir) is None
+
+
+def test_reference_data_falls_back_to_the_workbook(tmp_path, monkeypatch):
+    monkeypatch.setenv('BASE_SNAPSHOT_DIR', str(tmp_path / 'none'))
+    assert reference_data.ReferenceData.build(BASE_XLSX).origin == 'xlsx'
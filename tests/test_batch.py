@@ -0,0 +1,78 @@
+"""POST /api/optimize/batch: one entry per scenario, failures reported per item."""
+import pytest
+
+import optimize_excel
+import optimizer_pool
+import result_cache
+from conftest import SCENARIOS
+
+
+class BatchPool:
+    """Stands in for the optimizer pool: runs the jobs here; the jobs at fail_at fail in the 'worker'"""
+    size = 2
+
+    def __init__(self, fail_at=()):
+        self.fail_at = set(fail_at)
+        self.jobs = []
+
+    def run(self, fn, *args, cancel=None, on_event=None, **kwargs):
+        return fn(*args, **kwargs)
+
+    def run_many(self, fn, jobs):
+        outcomes = []
+        for i, (args, kwargs) in enumerate(jobs):
+            self.jobs.append(kwargs)
+            if i in self.fail_at:
+                outcomes.append(optimizer_pool.OptimizerError('ValueError: boom', 'Traceback ...'))
+            else:
+                outcomes.append(fn(*args, **kwargs))
+        return outcomes
+
+
+@pytest.fixture
+def client(app, monkeypatch):
+    monkeypatch.setattr(result_cache, 'cache', result_cache.ResultCache(max_entries=0))
+    return app.test_client()
+
+
+def test_failures_stay_with_their_scenario(client, monkeypatch):
+    pool = BatchPool(fail_at={1})
+    monkeypatch.setattr(optimizer_pool, 'pool', pool)
+    body = {'scenarios': [
+        {'id': 'ok', **SCENARIOS['a']},
+        {'id': 'no-recommendation', 'systems': []},
+        {'id': 'bad-engine', 'engine': 'simplex', **SCENARIOS['a']},
+        {'id': 'invalid', 'systemRecommendation': [{'offered_bundle': 'many'}]},
+        {'id': 'crash', **SCENARIOS['a']},
+        {'id': 'flow', 'engine': 'flow', **SCENARIOS['a']},
+    ]}
+    reply = client.post('/api/optimize/batch', json=body)
+    assert reply.status_code == 200
+    data = reply.get_json()
+    results = data['results']
+    assert data['status'] == 'partial' and data['message'] == '2 of 6 scenario(s) completed'
+    assert {k: v['status'] for k, v in results.items()} == {
+        'ok': 'success', 'no-recommendation': 'error', 'bad-engine': 'error', 'invalid': 'error',
+        'crash': 'error', 'flow': 'success'}
+    assert 'simplex' in results['bad-engine']['message']
+    assert results['invalid']['errors']
+    assert results['crash']['message'] == 'Optimizer failed: ValueError: boom'
+    # Only the valid scenarios reached the pool, each with its own engine
+    assert [job['engine'] for job in pool.jobs] == ['greedy', 'greedy', 'flow']
+
+    single = client.post('/api/optimize', json=SCENARIOS['a']).get_json()
+    assert results['ok']['outbase_data'] == single['outbase_data']
+
+
+def test_all_failed_is_an_error_status(client, monkeypatch):
+    monkeypatch.setattr(optimizer_pool, 'pool', BatchPool(fail_at={0}))
+    data = client.post('/api/optimize/batch', json={'scenarios': {'x': SCENARIOS['a']}}).get_json()
+    assert data['status'] == 'error' and data['results']['x']['status'] == 'error'
+
+
+def test_malformed_batches_are_rejected(client, monkeypatch):
+    monkeypatch.setattr(optimize_excel, 'BATCH_MAX_SCENARIOS', 2)
+    for body in [{}, {'scenarios': []},
+                 {'scenarios': [SCENARIOS['a']] * 3},
+                 {'scenarios': [{'id': 'x', **SCENARIOS['a']}, {'id': 'x', **SCENARIOS['a']}]}]:
+        assert client.post('/api/optimize/batch', json=body).status_code == 400
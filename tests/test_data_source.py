@@ -0,0 +1,68 @@
+"""Single-pass workbook loading (ExcelSource) and tools.read_data / model_table."""
+import pandas as pd
+import pytest
+
+import data_source
+from conftest import BASE_XLSX
+from toolBox import SHEET_COLUMNS, tools
+
+
+@pytest.fixture
+def opened(monkeypatch):
+    """Counts how often a workbook is opened"""
+    count = []
+    excel_file = pd.ExcelFile
+
+    def counting(*args, **kwargs):
+        count.append(args[0])
+        return excel_file(*args, **kwargs)
+
+    monkeypatch.setattr(data_source.pd, 'ExcelFile', counting)
+    return count
+
+
+def test_read_data_parses_the_workbook_once(opened):
+    tool = tools(BASE_XLSX)
+    frames = tool.read_data()
+    assert len(frames) == 8 and all(isinstance(df, pd.DataFrame) for df in frames)
+    assert len(opened) == 1
+    names = ['Systems', 'Modules', 'Parts', 'QTC', 'QTC Modules', 'QTC Parts', 'CoreQInventory', 'Scrap']
+    for name, df in zip(names, frames):
+        assert set(SHEET_COLUMNS[name]) <= set(df.columns), name
+
+
+def test_loaded_sheets_match_reading_them_one_by_one():
+    source = data_source.ExcelSource(BASE_XLSX)
+    source.load(['QTC', 'Scrap', 'Not a sheet'])
+    for name in ['QTC', 'Scrap']:
+        pd.testing.assert_frame_equal(source.read(name), pd.read_excel(BASE_XLSX, sheet_name=name))
+    with pytest.raises(KeyError):
+        source.read('Not a sheet')
+
+
+def test_other_sheets_are_parsed_on_first_read(opened):
+    source = data_source.ExcelSource(BASE_XLSX)
+    source.load(['QTC'])
+    assert 'OutBase' not in source._frames
+    pd.testing.assert_frame_equal(source.read('OutBase'), pd.read_excel(BASE_XLSX, sheet_name='OutBase'))
+    assert len(opened) == 2
+    source.read('OutBase')
+    assert len(opened) == 2
+
+
+def test_model_table_is_parsed_lazily(tmp_path, opened):
+    tool = tools(BASE_XLSX)
+    tool.read_data()
+    assert 'Matrix Model' in tool.warnings['missing_sheets']
+    assert tool.model_table().empty
+
+    book = tmp_path / 'MasterDB.xlsx'
+    with pd.ExcelWriter(book) as writer:
+        pd.DataFrame({'Model': [3], ' Value ': [1.5]}).to_excel(writer, sheet_name='Matrix Model', index=False)
+    tool = tools(book)
+    tool.read_data()
+    assert 'Matrix Model' not in tool.warnings['missing_sheets']
+    assert 'Matrix Model' not in tool.source._frames
+    table = tool.model_table()
+    assert table.columns.tolist() == ['Model', 'Value'] and table['Value'].tolist() == [1.5]
+    assert tool.model_table() is table
@@ -0,0 +1,173 @@
+"""Min-cost flow solver and the flow allocation engine."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import flow_engine
+import optimize_excel
+import optimizer_pool
+from conftest import BASE_XLSX, SCENARIOS
+from flow_engine import FlowTooLarge, min_cost_flow
+from toolBox import tools
+
+
+def reference_flow(n, tail, head, cap, cost, s, t, max_flow=True):
+    """Successive shortest paths, one Bellman-Ford path at a time: (flow value, cost)"""
+    m = len(tail)
+    U, V, C, R = [], [], [], []
+    for i in range(m):
+        U += [tail[i], head[i]]
+        V += [head[i], tail[i]]
+        C += [cost[i], -cost[i]]
+        R += [cap[i], 0]
+    total = flow = 0
+    while True:
+        d = [float('inf')] * n
+        d[s] = 0
+        parent = [-1] * n
+        for _ in range(n):
+            changed = False
+            for e in range(2 * m):
+                if R[e] > 0 and d[U[e]] + C[e] < d[V[e]]:
+                    d[V[e]] = d[U[e]] + C[e]
+                    parent[V[e]] = e
+                    changed = True
+            if not changed:
+                break
+        if d[t] == float('inf') or (not max_flow and d[t] >= 0):
+            return flow, total
+        f, x = float('inf'), t
+        while x != s:
+            f = min(f, R[parent[x]])
+            x = U[parent[x]]
+        x = t
+        while x != s:
+            R[parent[x]] -= f
+            R[parent[x] ^ 1] += f
+            x = U[parent[x]]
+        total += f * d[t]
+        flow += f
+
+
+def transport_problem(rng, trial):
+    ns, nd = int(rng.integers(1, 6)), int(rng.integers(1, 6))
+    n = 2 + ns + nd
+    tail, head, cap, cost = [], [], [], []
+    for i in range(ns):
+        tail.append(0); head.append(2 + i); cap.append(int(rng.integers(0, 8))); cost.append(0)
+    for j in range(nd):
+        tail.append(2 + ns + j); head.append(1); cap.append(int(rng.integers(0, 8))); cost.append(0)
+    for i in range(ns):
+        for j in range(nd):
+            if rng.random() < 0.7:
+                tail.append(2 + i); head.append(2 + ns + j)
+                cap.append(10 ** 6 if trial % 2 else int(rng.integers(0, 4)))
+                cost.append(int(rng.integers(-500, 500)) if trial % 3 else int(rng.integers(-2, 2)))
+    return n, ns, tail, head, cap, cost
+
+
+@pytest.mark.parametrize('max_flow', [True, False])
+def test_matches_successive_shortest_paths(max_flow):
+    rng = np.random.default_rng(0)
+    for trial in range(150):
+        n, ns, tail, head, cap, cost = transport_problem(rng, trial)
+        flow, total = min_cost_flow(n, np.array(tail), np.array(head), np.array(cap), np.array(cost), 0, 1,
+                                    max_flow=max_flow)
+        assert (flow[:ns].sum(), total) == reference_flow(n, tail, head, cap, cost, 0, 1, max_flow)
+        # Conservation and capacities
+        balance = np.zeros(n)
+        np.add.at(balance, np.array(head), flow)
+        np.add.at(balance, np.array(tail), -flow)
+        assert np.all(balance[2:] == 0) and np.all((0 <= flow) & (flow <= np.array(cap)))
+
+
+def test_min_cost_flow_of_any_amount_skips_loss_making_paths():
+    # source -> a -> sink twice: one unit earns 5 (cost -5), the other loses 3
+    tail, head = np.array([0, 2, 2, 0, 3]), np.array([2, 1, 1, 3, 1])
+    cap, cost = np.array([2, 1, 1, 1, 1]), np.array([0, -5, 3, 0, 7])
+    assert min_cost_flow(4, tail, head, cap, cost, 0, 1)[1] == 5.0
+    flow, total = min_cost_flow(4, tail, head, cap, cost, 0, 1, max_flow=False)
+    assert total == -5.0 and flow.tolist() == [1, 1, 0, 0, 0]
+
+
+def test_graph_above_the_limit_is_refused():
+    tail, head = np.array([0, 2]), np.array([2, 1])
+    with pytest.raises(FlowTooLarge) as e:
+        min_cost_flow(3, tail, head, np.array([1, 1]), np.array([0, -1]), 0, 1, max_arcs=1)
+    assert (e.value.arcs, e.value.limit) == (2, 1)
+
+
+def test_flow_engine_leaves_loss_making_demand_open():
+    qtc = pd.DataFrame({'base': ['A', 'A'], 'output': ['X', 'Y'], 'Buy': [100.0, 100.0],
+                        'Tot_cost': [500.0, 500.0], 'Sales_price': [900.0, 300.0]})
+    qtc['Cost'] = qtc['Tot_cost'] - qtc['Buy']
+    qtc['Delta'] = qtc['Sales_price'] - qtc['Cost']          # X earns 500, Y loses 100
+    inv_delta = qtc.assign(Delta=qtc['Delta'] - 50)
+
+    def inputs():
+        return (pd.DataFrame({'System': ['X', 'Y'], 'req_demand': [2, 3]}),
+                pd.DataFrame({'Machine': ['A'], 'Bundle': [10], 'Pipe_units': 0, 'Pipe_prob': 50, 'Pipeline': [0]}),
+                qtc, inv_delta, pd.DataFrame({'System': ['A'], 'CoreInventory': [0]}))
+
+    greedy, flow = tools(), tools()
+    greedy.optimize_buy(*inputs())
+    demand, *rest = inputs()
+    out = flow.optimize_buy_flow(demand, *rest)
+    assert greedy.allocation_value() == 2 * 500 - 3 * 100
+    assert flow.allocation_value() == 2 * 500
+    assert out.iloc[0]['bb'] == 2 and demand['req_demand'].tolist() == [0, 3]
+
+
+@pytest.mark.parametrize('y_delta, scrapped, y_units', [
+    (20.0, 100.0, 0),     # Y earns less than scrapping the unit would
+    (-50.0, -200.0, 3),   # Y loses less than scrapping the unit would cost
+])
+def test_flow_weighs_bundle_units_against_scrapping_them(y_delta, scrapped, y_units):
+    qtc = pd.DataFrame({'base': ['A', 'A'], 'output': ['X', 'Y'], 'Buy': [0.0, 0.0], 'Tot_cost': [100.0, 100.0],
+                        'Cost': [100.0, 100.0], 'Sales_price': [600.0, 100.0 + y_delta], 'Delta': [500.0, y_delta]})
+    scrap_values = {'A': scrapped}
+
+    def inputs():
+        return (pd.DataFrame({'System': ['X', 'Y'], 'req_demand': [2, 3]}),
+                pd.DataFrame({'Machine': ['A'], 'Bundle': [10], 'Pipe_units': 0, 'Pipe_prob': 50, 'Pipeline': [0]}),
+                qtc, qtc, pd.DataFrame({'System': ['A'], 'CoreInventory': [0]}))
+
+    flow = tools()
+    demand, *rest = inputs()
+    out = flow.optimize_buy_flow(demand, *rest, scrap_values=scrap_values)
+    assert demand['req_demand'].tolist() == [0, 3 - y_units]
+    assert out.iloc[0]['Bundle'] == 10 - 2 - y_units
+    # Both engines are valued with the leftover units scrapped
+    assert flow.allocation_value(out, scrap_values) == 2 * 500 + y_units * y_delta + (8 - y_units) * scrapped
+    # Greedy fills all demand: behind when Y is worth less than scrapping
+    greedy = tools()
+    greedy_out = greedy.optimize_buy(*inputs())
+    assert greedy.allocation_value(greedy_out, scrap_values) == 2 * 500 + 3 * y_delta + 5 * scrapped
+
+
+def test_scrap_values_net_what_scrap_pro_gets():
+    tool = tools()
+    bundle = pd.DataFrame({'Machine': ['A', 'B'], 'Bundle': [1, 1], 'bb': 0, 'cost_scrap': 0.0, 'price_scrap': 0.0})
+    scrap = pd.DataFrame({'Type': ['System'], 'id_component': ['A'], 'residual_value': [300.0], 'scrap_value': [40.0]})
+    qtc = pd.DataFrame({'Input_type': ['A'], 'Audit_De_install': [10.0], 'Freight_inbound': [5.0]})
+    assert tool.scrap_values(bundle['Machine'], scrap, qtc) == {'A': 300.0 - 55.0, 'B': 0}
+    out = tool.scrap_pro(bundle.copy(), scrap, qtc)
+    scrapped = out.set_index('Machine')
+    assert scrapped.loc['A', 'price_scrap'] - scrapped.loc['A', 'cost_scrap'] == 245.0
+
+
+def test_flow_never_reports_less_profit_than_greedy():
+    for name, payload in SCENARIOS.items():
+        frames = optimize_excel._payload_frames(payload)
+        engine = optimizer_pool.run_frames(frames, str(BASE_XLSX), engine='flow')['engine']
+        assert engine['profit_gap'] >= 0, name
+
+
+def test_too_large_flow_falls_back_to_greedy(monkeypatch):
+    monkeypatch.setattr(flow_engine, 'MAX_ARCS', 1)
+    frames = optimize_excel._payload_frames(SCENARIOS['a'])
+    result = optimizer_pool.run_frames(frames, str(BASE_XLSX), engine='flow')
+    greedy = optimizer_pool.run_frames(optimize_excel._payload_frames(SCENARIOS['a']), str(BASE_XLSX))
+    assert result['engine']['name'] == 'greedy' and result['engine']['requested'] == 'flow'
+    assert 'FLOW_MAX_ARCS' in result['engine']['fallback']
+    pd.testing.assert_frame_equal(result['out_bb'], greedy['out_bb'])
@@ -0,0 +1,99 @@
+"""Money truncation against the baseline: results written to MasterDB.xlsx and read back."""
+import io
+import math
+from decimal import Decimal, ROUND_DOWN, InvalidOperation, localcontext
+
+import numpy as np
+import openpyxl
+import pytest
+
+import money
+
+RESULT_DIGITS = 16   # optimize_excel.RESULT_MONEY_DIGITS
+
+
+def baseline_to_money(v):
+    # optimize_excel.to_money_outbase before the in-memory path, verbatim
+    try:
+        with localcontext() as ctx:
+            ctx.prec = 28
+            d = Decimal(str(v))
+            return float(d.quantize(Decimal('0.01'), rounding=ROUND_DOWN))
+    except (InvalidOperation, Exception):
+        try:
+            f = float(v)
+            return math.floor(f * 100.0) / 100.0
+        except Exception:
+            return 0.0
+
+
+def baseline_round_trip(values):
+    """Each value stored in a workbook cell, read back and truncated as the baseline did"""
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    for v in values:
+        ws.append([float(v)])
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    buffer.seek(0)
+    ws = openpyxl.load_workbook(buffer).active
+    read = [row[0] for row in ws.iter_rows(values_only=True)]
+    # Floats were truncated; whole numbers came back as ints and were kept
+    return [baseline_to_money(r) if isinstance(r, float) else r for r in read]
+
+
+def same(a, b):
+    return a == b or (isinstance(a, float) and isinstance(b, float) and math.isnan(a) and math.isnan(b))
+
+
+def noisy_amounts(rng, n):
+    """2-decimal amounts that went through arithmetic (as optimizer results do)"""
+    cents = rng.integers(-10**7, 10**7, n)
+    return np.concatenate([cents / 100.0 * 3 / 3, (cents / 100.0) * 0.1 * 10, cents * 0.01,
+                           rng.uniform(-1e6, 1e6, n)])
+
+
+def test_noise_below_the_16th_digit_is_not_floored_away():
+    v = 8217.39 - 1e-12 / 2   # '%.16g' gives 8217.389999999999, which reads back as 8217.39
+    assert float('%.16g' % v) == 8217.39
+    assert money.truncate_value(v, RESULT_DIGITS) == 8217.39
+    assert money.truncate_value(-v, RESULT_DIGITS) == -8217.39
+    assert money.truncate_value(1173.1899999999996, RESULT_DIGITS) == 1173.19
+    assert money.truncate_value(2705.64414, RESULT_DIGITS) == 2705.64
+
+
+def test_truncate_value_matches_workbook_round_trip():
+    values = noisy_amounts(np.random.default_rng(3), 5000)
+    values = np.concatenate([values, np.nextafter(values, np.inf), np.nextafter(values, -np.inf)])
+    expected = baseline_round_trip(values)
+    actual = [money.truncate_value(v, RESULT_DIGITS) for v in values]
+    assert [v for v, a, e in zip(values, actual, expected) if a != e] == []
+
+
+@pytest.mark.parametrize('value', [1, '12.345', None, True, 'abc', 12.349999999999, 10**30])
+def test_payload_values_truncate_from_their_str(value):
+    assert same(money.truncate_value(value), baseline_to_money(value))
+
+
+def test_vectorized_truncate_matches_workbook_round_trip():
+    rng = np.random.default_rng(5)
+    values = noisy_amounts(rng, 5000)
+    values = np.concatenate([values, np.nextafter(values, np.inf), np.nextafter(values, -np.inf),
+                             [8217.39, 8217.39 - 4.5e-13, -8217.39 + 4.5e-13, 1173.1899999999996, -0.0]])
+    expected = baseline_round_trip(values)
+    actual = money.truncate(values, RESULT_DIGITS)
+    assert [v for v, a, e in zip(values, actual, expected) if a != e] == []
+
+
+def test_vectorized_truncate_equals_truncate_value():
+    rng = np.random.default_rng(11)
+    values = np.concatenate([noisy_amounts(rng, 20000), [np.nan, np.inf, -np.inf, 1e20, -0.0, 0.0]])
+    for digits in (RESULT_DIGITS, None):
+        actual = money.truncate(values, digits)
+        expected = [money.truncate_value(v, digits) for v in values]
+        assert all(same(a, e) and math.copysign(1, a) == math.copysign(1, e) for a, e in zip(actual, expected))
+
+
+def test_mixed_sequences_fall_back_per_value():
+    mixed = [1, '12.345', None, True, 'abc', 12.349999999999, 10**30, '0.1299999999999999999']
+    assert all(same(a, money.truncate_value(v)) for v, a in zip(mixed, money.truncate(mixed)))
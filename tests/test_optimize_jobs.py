@@ -0,0 +1,75 @@
+"""Asynchronous optimization jobs: the job manager and the /api/optimize/jobs routes."""
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import optimize_jobs
+import optimizer_pool
+from conftest import SCENARIOS
+
+
+def test_job_manager_cancels_queued_and_running_jobs():
+    manager = optimize_jobs.JobManager(max_workers=1, max_pending=1)
+    started = threading.Event()
+
+    def slow(cancel):
+        started.set()
+        if cancel.wait(5):
+            raise optimizer_pool.OptimizerCancelled('Optimization cancelled')
+        return {'status': 'success'}, 200
+
+    running = manager.submit(slow)
+    assert started.wait(5)
+    queued = manager.submit(lambda cancel: ({'status': 'success'}, 200))
+    with pytest.raises(optimize_jobs.JobQueueFull):
+        manager.submit(lambda cancel: ({'status': 'success'}, 200))
+
+    assert manager.cancel(queued.id).state == optimize_jobs.CANCELLED
+    manager.cancel(running.id)
+    running.future.result(timeout=5)
+    assert running.state == optimize_jobs.CANCELLED
+    assert running.http_status == 409
+    assert manager.cancel('unknown') is None
+    manager.shutdown()
+
+
+class InProcessPool:
+    """Stands in for the optimizer pool: runs the job in this process"""
+    size = 1
+
+    def run(self, fn, *args, cancel=None, on_event=None, **kwargs):
+        return fn(*args, **kwargs)
+
+
+def test_job_routes_run_poll_and_refuse_late_cancel(app, monkeypatch):
+    monkeypatch.setattr(optimizer_pool, 'pool', InProcessPool())
+    monkeypatch.setattr(optimize_jobs, 'jobs', optimize_jobs.JobManager(max_workers=1))
+    client = app.test_client()
+
+    submitted = client.post('/api/optimize/jobs', json=SCENARIOS['a'], headers={'Cache-Control': 'no-cache'})
+    assert submitted.status_code == 202
+    job_id = submitted.get_json()['job']['id']
+    assert submitted.headers['Location'] == f'/api/optimize/jobs/{job_id}'
+
+    optimize_jobs.jobs.get(job_id).future.result(timeout=60)
+    status = client.get(f'/api/optimize/jobs/{job_id}').get_json()
+    assert status['job']['state'] == optimize_jobs.SUCCEEDED
+    assert status['result']['outbase_data']
+    assert client.delete(f'/api/optimize/jobs/{job_id}').status_code == 409
+    assert client.get('/api/optimize/jobs/unknown').status_code == 404
+    optimize_jobs.jobs.shutdown()
+
+
+def test_job_timestamps_are_utc():
+    manager = optimize_jobs.JobManager(max_workers=1)
+    job = manager.submit(lambda cancel: ({'status': 'success'}, 200))
+    job.future.result(timeout=5)
+    times = job.to_dict()
+    for field in ('created_at', 'started_at', 'finished_at'):
+        assert times[field].endswith('Z')
+        moment = datetime.fromisoformat(times[field].replace('Z', '+00:00'))
+        assert moment.utcoffset() == timedelta(0)
+        assert abs(datetime.now(timezone.utc) - moment) < timedelta(minutes=1)
+    assert times['elapsed_seconds'] >= 0
+    manager.shutdown()
@@ -0,0 +1,110 @@
+"""POST /api/optimize/stream: server-sent stage events, the result, and cancel on disconnect."""
+import json
+import threading
+
+import pytest
+
+import optimize_jobs
+import optimizer_pool
+import result_cache
+from conftest import SCENARIOS
+
+
+class Relay:
+    """Worker pipe stand-in: hands the job's emit() events to the caller's on_event"""
+
+    def __init__(self, on_event):
+        self.on_event = on_event
+
+    def send(self, message):
+        self.on_event(message[1])
+
+
+class InProcessPool:
+    """Stands in for the optimizer pool: runs the job here and relays its progress events"""
+    size = 1
+
+    def run(self, fn, *args, cancel=None, on_event=None, **kwargs):
+        optimizer_pool._job_conn = Relay(on_event) if on_event else None
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            optimizer_pool._job_conn = None
+
+
+class StalledPool:
+    """Emits the load stage, then waits until the run is cancelled"""
+    size = 1
+
+    def __init__(self):
+        self.cancelled = threading.Event()
+
+    def run(self, fn, *args, cancel=None, on_event=None, **kwargs):
+        on_event({'stage': 'load', 'elapsed_seconds': 0.01})
+        if not cancel.wait(10):
+            raise AssertionError('the run was not cancelled')
+        self.cancelled.set()
+        raise optimizer_pool.OptimizerCancelled('Optimization cancelled')
+
+
+@pytest.fixture
+def client(app, monkeypatch):
+    monkeypatch.setattr(result_cache, 'cache', result_cache.ResultCache(max_entries=0))
+    monkeypatch.setattr(optimize_jobs, 'jobs', optimize_jobs.JobManager(max_workers=1))
+    yield app.test_client()
+    optimize_jobs.jobs.shutdown()
+
+
+def parse(chunk):
+    """(event, data) of every server-sent event in chunk; comments are skipped"""
+    events = []
+    for block in chunk.decode().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.splitlines() if not line.startswith(':'))
+        if fields:
+            events.append((fields['event'], json.loads(fields['data'])))
+    return events
+
+
+def test_stages_arrive_in_order_then_the_result(client, monkeypatch):
+    monkeypatch.setattr(optimizer_pool, 'pool', InProcessPool())
+    reply = client.post('/api/optimize/stream', json=SCENARIOS['a'])
+    assert reply.mimetype == 'text/event-stream'
+    events = parse(reply.get_data())
+
+    names = [event for event, _ in events]
+    assert names == ['job'] + ['stage'] * 6 + ['result']
+    stages = [data['stage'] for event, data in events if event == 'stage']
+    assert stages == ['load', 'req_demand', 'optimize_buy', 'optimize_harvest', 'scrap_pro', 'bb_recom']
+    elapsed = [data['elapsed_seconds'] for event, data in events if event == 'stage']
+    assert elapsed == sorted(elapsed)
+
+    result = events[-1][1]
+    single = client.post('/api/optimize', json=SCENARIOS['a']).get_json()
+    assert result['status'] == 'success' and result['outbase_data'] == single['outbase_data']
+    # The last stage carries the out_bb rows the result returns
+    assert events[-2][1]['out_bb'] == result['outbase_data']
+    job = optimize_jobs.jobs.get(events[0][1]['id'])
+    assert job.state == optimize_jobs.SUCCEEDED
+
+
+def test_invalid_payload_ends_with_an_error_event(client, monkeypatch):
+    monkeypatch.setattr(optimizer_pool, 'pool', InProcessPool())
+    events = parse(client.post('/api/optimize/stream', json={}).get_data())
+    assert [event for event, _ in events] == ['job', 'error']
+    assert 'systemRecommendation' in events[1][1]['message']
+
+
+def test_closing_the_stream_cancels_the_run(client, monkeypatch):
+    pool = StalledPool()
+    monkeypatch.setattr(optimizer_pool, 'pool', pool)
+    reply = client.post('/api/optimize/stream', json=SCENARIOS['a'], buffered=False)
+    chunks = iter(reply.response)
+    (event, job), = parse(next(chunks))
+    assert event == 'job'
+    assert parse(next(chunks)) == [('stage', {'stage': 'load', 'elapsed_seconds': 0.01})]
+
+    reply.close()
+    assert pool.cancelled.wait(10)
+    running = optimize_jobs.jobs.get(job['id'])
+    running.future.result(timeout=10)
+    assert running.state == optimize_jobs.CANCELLED
@@ -0,0 +1,99 @@
+"""Optimizer pool jobs and the worker protocol."""
+import os
+import threading
+import time
+
+import pytest
+
+import optimize_excel
+import optimizer_pool
+from conftest import BASE_XLSX, SCENARIOS
+
+
+class EventPipe:
+    """Collects what a job sends to its caller through emit()"""
+
+    def __init__(self):
+        self.messages = []
+
+    def send(self, message):
+        self.messages.append(message)
+
+
+def test_run_frames_emits_the_optimizer_stages(monkeypatch):
+    pipe = EventPipe()
+    monkeypatch.setattr(optimizer_pool, '_job_conn', pipe)
+    frames = optimize_excel._payload_frames(SCENARIOS['a'])
+    result = optimizer_pool.run_frames(frames, str(BASE_XLSX), progress=True)
+
+    stages = [event['stage'] for kind, event in pipe.messages if kind == 'event']
+    # In-memory runs write no sheet, so there is no 'write' stage
+    assert stages == ['load', 'req_demand', 'optimize_buy', 'optimize_harvest', 'scrap_pro', 'bb_recom']
+    assert result['reference_version']
+
+
+def report_and_return(value):
+    """Job: one progress event, then the value"""
+    optimizer_pool.emit({'stage': 'half', 'value': value})
+    return value * 2
+
+
+def fail(message):
+    raise ValueError(message)
+
+
+@pytest.fixture(scope='module')
+def pool():
+    pool = optimizer_pool.OptimizerPool(size=1, max_tasks_per_worker=0, timeout=30, start_method='spawn')
+    yield pool
+    pool.shutdown()
+
+
+def test_workers_are_reused_and_relay_events(pool):
+    events = []
+    assert pool.run(report_and_return, 21, on_event=events.append) == 42
+    assert events == [{'stage': 'half', 'value': 21}]
+    assert pool.run(os.getpid) == pool.run(os.getpid)
+
+
+def test_job_error_keeps_the_worker(pool):
+    pid = pool.run(os.getpid)
+    with pytest.raises(optimizer_pool.OptimizerError) as raised:
+        pool.run(fail, 'bad input')
+    assert 'ValueError: bad input' in str(raised.value)
+    assert 'Traceback' in raised.value.worker_traceback
+    assert pool.run(os.getpid) == pid
+
+
+def test_timeout_replaces_only_that_worker(pool):
+    pid = pool.run(os.getpid)
+    with pytest.raises(optimizer_pool.OptimizerTimeout):
+        pool.run(time.sleep, 10, timeout=0.5)
+    assert pool.run(os.getpid) != pid
+
+
+def test_cancel_stops_a_running_job(pool):
+    cancel = threading.Event()
+    threading.Timer(0.3, cancel.set).start()
+    started = time.monotonic()
+    with pytest.raises(optimizer_pool.OptimizerCancelled):
+        pool.run(time.sleep, 10, cancel=cancel)
+    assert time.monotonic() - started < 5
+    assert pool.run(report_and_return, 1) == 2
+
+
+def test_workers_are_recycled_after_max_tasks():
+    pool = optimizer_pool.OptimizerPool(size=1, max_tasks_per_worker=2, timeout=30, start_method='spawn')
+    try:
+        pids = [pool.run(os.getpid) for _ in range(3)]
+    finally:
+        pool.shutdown()
+    assert pids[0] == pids[1] != pids[2]
+
+
+def test_run_many_keeps_order_and_failures_in_place(pool):
+    outcomes = pool.run_many(report_and_return, [((1,), {}), (('x',), {}), ((3,), {})])
+    assert outcomes == [2, 'xx', 6]
+    outcomes = pool.run_many(fail, [(('one',), {}), (('two',), {})])
+    assert [str(e) for e in outcomes] == ['ValueError: one', 'ValueError: two']
+
@@ -0,0 +1,59 @@
+"""Optimize payload schema: conversions, defaults and error reporting."""
+import numpy as np
+import pytest
+
+import payload_schema
+from conftest import SCENARIOS
+
+
+def recommendation(**row):
+    return {'systemRecommendation': [dict({'machine_type': 'PAS5500/200'}, **row)]}
+
+
+def test_values_are_converted_like_the_sheets_expect():
+    tables, margins = payload_schema.parse(recommendation(
+        offered_bundle='5.9', qtc_avg_bb_price='1234.5678', deal_outcome_probability=0.35,
+        required_margin=None, recommended_bb_price_on_bundle=-10.999))
+    row = tables['systemRecommendation'].iloc[0]
+    assert row['Offered Bundle'] == 5                      # whole numbers truncate toward zero
+    assert row['QTC average BB price'] == 1234.56         # money truncates to cents
+    assert row['Recommended BB Price on Bundle (K)'] == -10.99
+    assert row['Deal outcome probability'] == pytest.approx(35)  # fractions become percent
+    assert row['Required margin (%)'] == 0                 # null takes the default
+    assert tables['systemRecommendation']['Offered Bundle'].dtype == np.int64
+    assert margins['Refurbishment'] == 40
+
+
+def test_text_ids_keep_the_sent_value():
+    tables, _ = payload_schema.parse({**recommendation(),
+                                      'systems': [{'item': 350, 'demand_12m': '3'}, {'item': '450F'}]})
+    systems = tables['systems']
+    assert systems['System'].tolist() == ['350', '450F']
+    assert systems['Demand_12M'].tolist() == [3, 0]
+
+
+def test_every_invalid_field_is_reported_at_once():
+    with pytest.raises(payload_schema.PayloadError) as raised:
+        payload_schema.parse({'systemRecommendation': [{'offered_bundle': 'many'}, 'not a row',
+                                                       {'qtc_avg_bb_price': float('inf')}],
+                              'systems': {'item': 'x'},
+                              'refurbishmentMargin': 'high'})
+    fields = [e['field'] for e in raised.value.errors]
+    assert fields == ['systemRecommendation[1]', 'systemRecommendation[0].offered_bundle',
+                      'systemRecommendation[2].qtc_avg_bb_price', 'systems', 'refurbishmentMargin']
+
+
+def test_required_table_and_row_limit(monkeypatch):
+    with pytest.raises(payload_schema.PayloadError, match='systemRecommendation: required'):
+        payload_schema.parse({'systems': []})
+    monkeypatch.setattr(payload_schema, 'MAX_ROWS', 2)
+    with pytest.raises(payload_schema.PayloadError, match='too many rows'):
+        payload_schema.parse({'systemRecommendation': [{}, {}, {}]})
+
+
+def test_invalid_payload_is_a_400_listing_the_errors(app):
+    payload = dict(SCENARIOS['a'], systemRecommendation=[{'machine_type': 'PAS5500/200', 'offered_bundle': 'x'}])
+    reply = app.test_client().post('/api/optimize', json=payload)
+    assert reply.status_code == 400
+    assert reply.get_json()['errors'] == [{'field': 'systemRecommendation[0].offered_bundle',
+                                           'message': "expected a finite number, got 'x'"}]
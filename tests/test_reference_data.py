@@ -0,0 +1,76 @@
+"""Per-process Base.xlsx reference cache: content-hash keys, hits and invalidation."""
+import hashlib
+import os
+import shutil
+
+import openpyxl
+import pytest
+
+import reference_data
+from conftest import BASE_XLSX
+from data_source import FrameSource
+from toolBox import tools
+
+
+@pytest.fixture
+def workbook(tmp_path, monkeypatch):
+    """Private copy of Base.xlsx (without a compiled snapshot)"""
+    monkeypatch.setenv('BASE_SNAPSHOT_DIR', str(tmp_path / 'no-snapshot'))
+    path = tmp_path / 'Base.xlsx'
+    shutil.copy2(BASE_XLSX, path)
+    return path
+
+
+def test_version_is_the_content_sha256(workbook):
+    assert reference_data.file_hash(workbook) == hashlib.sha256(workbook.read_bytes()).hexdigest()
+    assert reference_data.workbook_version(workbook) == reference_data.file_hash(BASE_XLSX)
+
+
+def test_workbook_version_rehashes_only_after_a_change(workbook, monkeypatch):
+    calls = []
+    file_hash = reference_data.file_hash
+    monkeypatch.setattr(reference_data, 'file_hash', lambda path: calls.append(path) or file_hash(path))
+    version = reference_data.workbook_version(workbook)
+    assert reference_data.workbook_version(workbook) == version
+    assert len(calls) == 1
+    os.utime(workbook, ns=(1, 1))
+    assert reference_data.workbook_version(workbook) == version
+    assert len(calls) == 2
+
+
+def test_cache_hits_until_the_content_changes(workbook):
+    cache = reference_data.ReferenceCache(workbook, interval=0)
+    first = cache.get()
+    assert cache.get() is first and cache.reloads == 1
+
+    # Touched but identical: same snapshot, not rebuilt
+    os.utime(workbook, ns=(1, 1))
+    assert cache.get() is first and cache.reloads == 1
+
+    book = openpyxl.load_workbook(workbook)
+    assert book['QTC']['E1'].value == 'Audit / De-install'
+    book['QTC']['E2'] = 999
+    book.save(workbook)
+    changed = cache.get()
+    assert changed is not first and cache.reloads == 2
+    assert changed.version == reference_data.file_hash(workbook) != first.version
+    assert changed.frames['QTC']['Audit_De_install'].iloc[0] == 999
+    assert first.frames['QTC']['Audit_De_install'].iloc[0] != 999
+
+
+def test_one_cache_per_workbook(workbook, monkeypatch):
+    monkeypatch.chdir(workbook.parent)
+    cache = reference_data.get_cache('Base.xlsx')
+    try:
+        assert reference_data.get_cache(workbook) is cache
+        assert reference_data.get_reference(workbook) is cache.get()
+    finally:
+        reference_data._caches.pop(cache.path).stop_watcher()
+
+
+def test_tools_get_copies_of_the_cached_frames(workbook):
+    reference = reference_data.ReferenceData.build(workbook)
+    tool = tools(FrameSource({}), reference)
+    qtc = tool.read_data()[3]
+    qtc['Audit_De_install'] = -1
+    assert (reference.frames['QTC']['Audit_De_install'] != -1).all()
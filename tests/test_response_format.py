@@ -0,0 +1,50 @@
+"""Response formats: columnar tables, negotiation and compression."""
+import gzip
+import json
+
+import pytest
+
+import response_format
+from conftest import SCENARIOS
+
+
+@pytest.fixture(scope='module')
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture(scope='module')
+def rows(client):
+    return client.post('/api/optimize', json=SCENARIOS['a']).get_json()
+
+
+def test_columnar_holds_the_same_tables(client, rows):
+    reply = client.post('/api/optimize?format=columnar', json=SCENARIOS['a'])
+    assert reply.mimetype == response_format.COLUMNAR_MIMETYPE
+    body = json.loads(reply.get_data())
+    for key in response_format.TABLE_KEYS:
+        table = rows[key]
+        assert body[key] == {column: [row[column] for row in table] for column in table[0]}
+    assert body['warnings'] == rows['warnings']
+
+
+def test_accept_header_selects_the_format(client):
+    reply = client.post('/api/optimize', json=SCENARIOS['a'], headers={'Accept': response_format.COLUMNAR_MIMETYPE})
+    assert reply.mimetype == response_format.COLUMNAR_MIMETYPE
+    assert 'Accept' in reply.headers['Vary']
+
+
+def test_unknown_or_unavailable_formats_are_refused(client):
+    assert client.post('/api/optimize?format=xml', json=SCENARIOS['a']).status_code == 400
+    if response_format.pyarrow is None:
+        assert client.post('/api/optimize?format=arrow', json=SCENARIOS['a']).status_code == 406
+    body = {'scenarios': [SCENARIOS['a']]}
+    assert client.post('/api/optimize/batch?format=arrow', json=body).status_code == 406
+
+
+def test_large_bodies_are_compressed_when_accepted(client, rows):
+    reply = client.post('/api/optimize', json=SCENARIOS['a'], headers={'Accept-Encoding': 'gzip'})
+    assert reply.headers['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(reply.get_data())) == rows
+    plain = client.post('/api/optimize', json=SCENARIOS['a'])
+    assert 'Content-Encoding' not in plain.headers
@@ -0,0 +1,92 @@
+"""Result cache: LRU/TTL bounds, request keys and how /api/optimize fills it."""
+import pandas as pd
+import pytest
+
+import optimizer_pool
+import reference_data
+import result_cache
+from conftest import SCENARIOS
+
+
+def test_request_key_normalizes_values_and_options():
+    a = {'S': pd.DataFrame({'x': [1, 2]})}
+    b = {'S': pd.DataFrame({'x': [1, 2]})}
+    assert result_cache.request_key(a, 'v1', engine='greedy') == result_cache.request_key(b, 'v1', engine='greedy')
+    assert result_cache.request_key(a, 'v1', engine='greedy') != result_cache.request_key(a, 'v2', engine='greedy')
+    assert result_cache.request_key(a, 'v1', engine='greedy') != result_cache.request_key(a, 'v1', engine='flow')
+
+
+def test_lru_eviction_and_ttl():
+    now = [0.0]
+    cache = result_cache.ResultCache(max_entries=2, max_bytes=10 ** 6, ttl=10, clock=lambda: now[0])
+    cache.put('a', {'v': 1})
+    cache.put('b', {'v': 2})
+    assert cache.get('a') == {'v': 1}
+    cache.put('c', {'v': 3})  # evicts b, the least recently used
+    assert cache.get('b') is None
+    assert cache.evictions == 1
+    now[0] = 11
+    assert cache.get('a') is None
+    assert cache.expirations == 1
+
+
+class InProcessPool:
+    """Stands in for the optimizer pool: runs the job here and reports an older reference version"""
+    size = 1
+
+    def __init__(self, version):
+        self.version = version
+        self.calls = 0
+
+    def run(self, fn, *args, cancel=None, on_event=None, **kwargs):
+        self.calls += 1
+        result = fn(*args, **kwargs)
+        result['reference_version'] = self.version
+        return result
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    fresh = result_cache.ResultCache()
+    monkeypatch.setattr(result_cache, 'cache', fresh)
+    return fresh
+
+
+def test_result_is_cached_under_the_version_the_worker_used(app, cache, monkeypatch):
+    # The web process already sees a new Base.xlsx while the worker ran on the old one
+    pool = InProcessPool('old-version')
+    monkeypatch.setattr(optimizer_pool, 'pool', pool)
+    monkeypatch.setattr(reference_data, 'workbook_version', lambda path: 'new-version')
+    client = app.test_client()
+
+    first = client.post('/api/optimize', json=SCENARIOS['a'])
+    assert first.status_code == 200
+    assert first.headers['X-Cache'] == 'MISS'
+    assert 'reference_version' not in first.get_json()
+    again = client.post('/api/optimize', json=SCENARIOS['a'])
+    assert again.headers['X-Cache'] == 'MISS'
+    assert pool.calls == 2
+
+    # Once the web process is on the worker's version the entry is found
+    monkeypatch.setattr(reference_data, 'workbook_version', lambda path: 'old-version')
+    hit = client.post('/api/optimize', json=SCENARIOS['a'])
+    assert hit.headers['X-Cache'] == 'HIT'
+    assert pool.calls == 2
+    assert hit.get_json()['outbase_data'] == first.get_json()['outbase_data']
+
+
+def test_batch_caches_under_the_worker_version(app, cache, monkeypatch):
+    pool = InProcessPool('old-version')
+    pool.run_many = lambda fn, jobs: [pool.run(fn, *args, **kwargs) for args, kwargs in jobs]
+    monkeypatch.setattr(optimizer_pool, 'pool', pool)
+    monkeypatch.setattr(reference_data, 'workbook_version', lambda path: 'new-version')
+    client = app.test_client()
+
+    body = {'scenarios': [{'id': 'a', **SCENARIOS['a']}]}
+    assert client.post('/api/optimize/batch', json=body).get_json()['status'] == 'success'
+    client.post('/api/optimize/batch', json=body)
+    assert pool.calls == 2
+
+    monkeypatch.setattr(reference_data, 'workbook_version', lambda path: 'old-version')
+    client.post('/api/optimize/batch', json=body)
+    assert pool.calls == 2
@@ -0,0 +1,81 @@
+"""Margin sensitivity curves: the grid spec and agreement with separate runs."""
+import pytest
+
+import optimize_excel
+import optimizer_pool
+import result_cache
+from conftest import make_payload
+
+BUNDLES, PIPES = [2, 1, 0, 3, 4, 2, 1], [0, 1, 0, 0, 0, 2, 0]
+
+
+class InProcessPool:
+    """Stands in for the optimizer pool: runs the job here"""
+    size = 1
+
+    def __init__(self):
+        self.calls = 0
+
+    def run(self, fn, *args, cancel=None, on_event=None, **kwargs):
+        self.calls += 1
+        return fn(*args, **kwargs)
+
+
+@pytest.fixture
+def client(app, monkeypatch):
+    monkeypatch.setattr(result_cache, 'cache', result_cache.ResultCache(max_entries=0))
+    monkeypatch.setattr(optimizer_pool, 'pool', InProcessPool())
+    return app.test_client()
+
+
+@pytest.mark.parametrize('spec, grid', [
+    (None, None), (False, None), ('0', None),
+    (True, [float(m) for m in range(81)]),
+    ('1', [float(m) for m in range(81)]),
+    ([40, 12.5], [40.0, 12.5]),
+    ({'min': 20, 'max': 30, 'step': 5}, [20.0, 25.0, 30.0]),
+    ({'min': 0, 'max': 1, 'step': 0.1}, [i * 0.1 for i in range(11)]),
+])
+def test_margin_grid(spec, grid):
+    assert optimize_excel._margin_grid(spec) == grid
+
+
+@pytest.mark.parametrize('spec', [[], 'often', [101], [-1], [float('nan')], {'step': 0},
+                                  {'min': 50, 'max': 10}, {'min': 0, 'max': 100, 'step': 0.01}])
+def test_invalid_margin_grid(spec):
+    with pytest.raises(ValueError):
+        optimize_excel._margin_grid(spec)
+
+
+def test_curves_match_runs_at_each_margin(client):
+    margins = [30, 35, 40]
+    reply = client.post('/api/optimize', json={**make_payload(BUNDLES, PIPES), 'sensitivity': margins})
+    assert reply.status_code == 200
+    curves = reply.get_json()['sensitivity']
+    assert curves['margins'] == margins
+    machines = {row['Machine']: row['Recommended BB Price'] for row in curves['machines']}
+    metrics = {row['Metric']: row['Max_BBB_Valuation'] for row in curves['metrics']}
+
+    for i, margin in enumerate(margins):
+        run = client.post('/api/optimize', json=make_payload(BUNDLES, PIPES, margin=margin)).get_json()
+        assert 'sensitivity' not in run
+        for row in run['outbase_data']:
+            assert machines[row['Machine']][i] == row['Recommended BB Price'], (margin, row['Machine'])
+        if margin == 35:
+            # The payload's maxBuyback rows all require 35%
+            for row in run['outprofit_data']:
+                if row['Metric'] in metrics:
+                    assert metrics[row['Metric']][i] == row['Max_BBB_Valuation'], row['Metric']
+    assert {'Refurbishment', 'Total With Scrap'} <= metrics.keys()
+
+
+def test_one_run_for_the_whole_grid(client):
+    reply = client.post('/api/optimize?sensitivity=1', json=make_payload(BUNDLES, PIPES))
+    assert len(reply.get_json()['sensitivity']['margins']) == 81
+    assert optimizer_pool.pool.calls == 1
+
+
+def test_invalid_sensitivity_is_a_400(client):
+    reply = client.post('/api/optimize', json={**make_payload(BUNDLES, PIPES), 'sensitivity': [150]})
+    assert reply.status_code == 400 and 'sensitivity' in reply.get_json()['message']
+    assert optimizer_pool.pool.calls == 0
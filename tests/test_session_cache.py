@@ -0,0 +1,55 @@
+"""Session validation cache: TTL, session expiry, invalidation and stale lookups."""
+from datetime import datetime, timedelta
+
+from session_cache import SessionCache
+
+ALICE = {'id': 1, 'username': 'alice'}
+
+
+def make_cache(**options):
+    now = [0.0]
+    return SessionCache(clock=lambda: now[0], **options), now
+
+
+def test_entries_live_for_the_ttl_but_never_past_the_session():
+    cache, now = make_cache(ttl=30)
+    cache.put('long', ALICE, datetime.utcnow() + timedelta(days=1))
+    cache.put('ending', ALICE, datetime.utcnow() + timedelta(seconds=5))
+    cache.put('ended', ALICE, datetime.utcnow() - timedelta(seconds=1))
+    assert cache.get('ended') is None
+    now[0] = 10
+    assert cache.get('long') == ALICE
+    assert cache.get('ending') is None
+    now[0] = 31
+    assert cache.get('long') is None
+    assert cache.stats()['expirations'] == 2
+
+
+def test_invalidation_drops_a_token_or_all_of_a_user():
+    cache, _ = make_cache()
+    cache.put('a', ALICE)
+    cache.put('b', ALICE)
+    cache.put('c', {'id': 2})
+    cache.invalidate('a')
+    assert cache.get('a') is None and cache.get('b') == ALICE
+    cache.invalidate_user(1)
+    assert cache.get('b') is None and cache.get('c') == {'id': 2}
+    assert cache.stats()['invalidations'] == 2
+
+
+def test_lookup_that_raced_an_invalidation_is_not_stored():
+    cache, _ = make_cache()
+    generation = cache.generation      # database lookup starts
+    cache.invalidate_user(1)           # user deactivated meanwhile
+    cache.put('a', ALICE, generation=generation)
+    assert cache.get('a') is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache, _ = make_cache(max_entries=2)
+    cache.put('a', ALICE)
+    cache.put('b', ALICE)
+    cache.get('a')
+    cache.put('c', ALICE)
+    assert cache.get('b') is None and cache.get('a') == ALICE
+    assert cache.stats()['evictions'] == 1
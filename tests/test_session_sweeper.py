@@ -0,0 +1,42 @@
+"""Expired session sweeper: bounded batches and the admin-only stats route."""
+from datetime import datetime, timedelta
+
+from auth_models import Session, get_db_engine, get_db_session
+from session_sweeper import SessionSweeper
+from conftest import register
+
+
+def add_sessions(engine, expired, live):
+    now = datetime.utcnow()
+    db = get_db_session(engine)
+    try:
+        for i in range(expired + live):
+            db.add(Session(user_id=1, session_token=Session.generate_token(),
+                           expires_at=now + (timedelta(days=1) if i >= expired else -timedelta(minutes=1))))
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_sweep_deletes_expired_sessions_in_bounded_batches(tmp_path):
+    engine = get_db_engine(f"sqlite:///{tmp_path / 'sessions.db'}")
+    add_sessions(engine, expired=25, live=3)
+    sweeper = SessionSweeper(engine, interval=0, batch_size=10, max_batches=2)
+
+    first = sweeper.sweep()
+    assert (first['purged'], first['batches'], first['complete']) == (20, 2, False)
+    second = sweeper.sweep()
+    assert (second['purged'], second['complete'], second['table_rows']) == (5, True, 3)
+    assert sweeper.stats()['total_purged'] == 25
+    assert not sweeper.start()  # interval 0: no thread
+
+
+def test_sweeper_stats_are_admin_only(app):
+    client = app.test_client()
+    assert client.get('/api/auth/sweeper').status_code == 401
+    _, token = register(client)
+    assert client.get('/api/auth/sweeper', headers={'Authorization': f'Bearer {token}'}).status_code == 403
+    _, token = register(client, admin=True)
+    reply = client.get('/api/auth/sweeper', headers={'Authorization': f'Bearer {token}'})
+    assert reply.status_code == 200
+    assert 'total_purged' in reply.get_json()['sweeper']
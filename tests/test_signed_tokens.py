@@ -0,0 +1,105 @@
+"""Signed session tokens: signature, key rotation and revocations."""
+from datetime import timedelta
+
+import pytest
+
+import signed_tokens
+from auth_models import get_db_engine
+from auth_service import AuthService
+
+KEY = 'k' * 32
+LIFETIME = timedelta(days=7)
+USER = {'id': 7, 'username': 'alice', 'is_admin': False}
+
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Now, a fifth of a second into the current second (sync compares with the real time)
+    fixed = Clock(int(signed_tokens.time.time()) + 0.2)
+    monkeypatch.setattr(signed_tokens.time, 'time', fixed)
+    return fixed
+
+
+@pytest.fixture
+def engine(tmp_path):
+    return get_db_engine(f"sqlite:///{tmp_path / 'auth.db'}")
+
+
+def test_verify_rejects_tampering_unknown_keys_and_expiry(clock):
+    signer = signed_tokens.TokenSigner({'a': KEY.encode()})
+    token, claims = signer.issue(USER, LIFETIME)
+    assert signer.verify(token) == claims
+
+    version, payload, signature = token.split('.')
+    forged = signed_tokens._b64encode(signed_tokens._b64decode(payload).replace(b'false', b'true '))
+    assert signer.verify(f'{version}.{forged}.{signature}') is None
+    assert signed_tokens.TokenSigner({'b': ('x' * 32).encode()}).verify(token) is None
+    assert signer.verify(token, now=claims['exp']) is None
+
+
+def test_rotation_keeps_tokens_of_the_old_key(clock):
+    old = signed_tokens.TokenSigner(signed_tokens.parse_keys(f'a:{KEY}'))
+    token, _ = old.issue(USER, LIFETIME)
+    rotated = signed_tokens.TokenSigner(signed_tokens.parse_keys(f"b:{'n' * 32},a:{KEY}"))
+    assert rotated.verify(token) is not None
+    assert rotated.issue(USER, LIFETIME)[1]['kid'] == 'b'
+    with pytest.raises(ValueError):
+        signed_tokens.parse_keys('a:short')
+
+
+def test_login_in_the_same_second_after_reactivation_is_valid(clock, engine):
+    # Regression: iat was whole seconds, so a token issued in the same second
+    # after revoke_user compared <= the fractional cutoff and was rejected
+    signer = signed_tokens.TokenSigner({'a': KEY.encode()})
+    revocations = signed_tokens.RevocationSet(engine, interval=0)
+    before, before_claims = signer.issue(USER, LIFETIME)
+    clock.now += 0.3
+    revocations.revoke_user(USER['id'], LIFETIME)
+    clock.now += 0.3
+    after, after_claims = signer.issue(USER, LIFETIME)
+    assert int(before_claims['iat']) == int(after_claims['iat'])
+
+    assert revocations.is_revoked(signer.verify(before))
+    assert not revocations.is_revoked(signer.verify(after))
+
+    # Another server learns the same cutoff from the revocations table
+    assert revocations.sync()
+    other = signed_tokens.RevocationSet(engine, interval=0)
+    assert other.is_revoked(before_claims)
+    assert not other.is_revoked(after_claims)
+
+
+def test_logout_revokes_one_token_everywhere(clock, engine):
+    signer = signed_tokens.TokenSigner({'a': KEY.encode()})
+    local = signed_tokens.RevocationSet(engine, interval=0)
+    first, first_claims = signer.issue(USER, LIFETIME)
+    _, second_claims = signer.issue(USER, LIFETIME)
+    local.revoke(first_claims['jti'], first_claims['exp'])
+    assert local.sync()
+    other = signed_tokens.RevocationSet(engine, interval=0)
+    assert other.is_revoked(first_claims)
+    assert not other.is_revoked(second_claims)
+
+
+def test_auth_service_reactivated_user_can_log_in_again(tmp_path):
+    service = AuthService(db_url=f"sqlite:///{tmp_path / 'users.db'}", token_mode='signed',
+                          signer=signed_tokens.TokenSigner({'a': KEY.encode()}))
+    service.revocations.interval = 0  # no sync thread
+    ok, _, user = service.register_user('carol', 'carol@example.com', 'secret-password')
+    assert ok
+    _, _, _, old_token = service.login('carol', 'secret-password')
+    assert service.set_user_active(user['id'], False)
+    assert service.set_user_active(user['id'], True)
+    _, _, _, new_token = service.login('carol', 'secret-password')
+
+    assert service.validate_session(old_token) == (False, None)
+    valid, current = service.validate_session(new_token)
+    assert valid and current['username'] == 'carol'
@@ -0,0 +1,149 @@
+"""Optimizer stages in toolBox: batched allocation with the per-unit loops' totals."""
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import toolBox
+from toolBox import tools
+
+
+def repeated(start, value, k):
+    """The per-unit loops' total: value added k times"""
+    for _ in range(k):
+        start += value
+    return start
+
+
+def test_add_repeated_rounds_like_the_loop(monkeypatch):
+    rng = np.random.default_rng(7)
+    monkeypatch.setattr(toolBox, 'ACCUMULATE_CHUNK', 64)
+    for _ in range(200):
+        start = round(float(rng.uniform(-1e5, 1e5)), 2)
+        value = round(float(rng.uniform(-1e5, 1e5)), int(rng.integers(0, 4)))
+        k = int(rng.integers(0, 300))
+        assert toolBox._add_repeated(start, value, k) == repeated(start, value, k)
+    # Closed form differs in the last bit here; the loop's rounding is kept
+    assert 10 * 0.1 != repeated(0.0, 0.1, 10)
+    assert toolBox._add_repeated(0.0, 0.1, 10) == repeated(0.0, 0.1, 10)
+    assert toolBox._add_repeated(5, -1, 3) == 2
+
+
+def buy_inputs(units, demand, delta=1234.57, inventory=0, pipeline=0):
+    """One machine type A offered `units` times for one system X with `demand` required"""
+    qtc = pd.DataFrame({'base': ['A'], 'output': ['X'], 'Buy': [100.0], 'Tot_cost': [500.25],
+                        'Sales_price': [500.25 + delta]})
+    qtc['Cost'] = qtc['Tot_cost'] - qtc['Buy']
+    qtc['Delta'] = delta
+    demand = pd.DataFrame({'System': ['X'], 'req_demand': [demand]})
+    inv = pd.DataFrame({'System': ['A'], 'CoreInventory': [inventory]})
+    bundle = pd.DataFrame({'Machine': ['A'], 'Bundle': [units], 'Pipe_units': 0, 'Pipe_prob': 50,
+                           'Pipeline': [pipeline]})
+    return demand, bundle, qtc, qtc.copy(), inv
+
+
+def test_optimize_buy_allocates_in_one_batch():
+    demand, bundle, qtc, inv_delta, inv = buy_inputs(units=5_000_000, demand=3_000_000)
+    started = time.perf_counter()
+    out = tools().optimize_buy(demand, bundle, qtc, inv_delta, inv)
+    assert time.perf_counter() - started < 1.0   # independent of the unit count
+    row = out.iloc[0]
+    assert (row['bb'], row['to_ref'], row['Bundle']) == (3_000_000, 3_000_000, 2_000_000)
+    assert row['delta'] == repeated(0.0, 1234.57, 3_000_000)
+    assert row['price'] == repeated(0.0, 500.25 + 1234.57, 3_000_000)
+    assert demand['req_demand'].iloc[0] == 0
+
+
+def test_optimize_buy_fractional_quantities_step_one_unit():
+    demand, bundle, qtc, inv_delta, inv = buy_inputs(units=3, demand=1.5)
+    out = tools().optimize_buy(demand, bundle, qtc, inv_delta, inv)
+    # 'while demand > 0' takes two units for 1.5 demand
+    assert out.iloc[0]['bb'] == 2
+    assert out.iloc[0]['delta'] == 1234.57 + 1234.57
+
+
+def harvest_inputs(machines, module_demand, part_demand):
+    bundle = tools()._recommend_frame(pd.DataFrame({'Machine': ['H'], 'Bundle': [machines], 'Pipe_units': 0,
+                                                     'Pipe_prob': 50, 'Pipeline': [0]}))
+    mods = pd.DataFrame({'Module': ['M1', 'M2'], 'req_demand': module_demand})
+    parts = pd.DataFrame({'Part': ['P1'], 'req_demand': part_demand})
+    delta_mod = pd.DataFrame({'Module': ['M1', 'M2'], 'Delta_Cost': [10.01, 20.02], '275_SCP': [30.03, 40.04],
+                              'Total_Cost': [5.05, 6.06]})
+    delta_parts = pd.DataFrame({'Part': ['P1'], 'Delta_Cost': [1.11], '275_SCP': [2.22], 'Total_Cost': [0.33]})
+    scrap = pd.DataFrame({'Type': ['Module', 'Module', 'Part'], 'id_component': ['M1', 'M2', 'P1'],
+                          'residual_value': [0.5, 0.25, 0.1], 'scrap_value': [1.5, 1.25, 1.1]})
+    return mods, parts, bundle, delta_mod, delta_parts, scrap
+
+
+def test_harvest_totals_in_one_step():
+    mods, parts, bundle, delta_mod, delta_parts, scrap = harvest_inputs(2_000_000, [500_000, 1_500_000], [10])
+    started = time.perf_counter()
+    out = tools().optimize_harvest(mods, parts, bundle, delta_mod, delta_parts, 'H', scrap)
+    assert time.perf_counter() - started < 1.0   # independent of the machine count
+    # Module demand keeps machines coming until M2's 1.5M units are sold
+    assert out.iloc[0]['to_harv'] == 1_500_000
+    assert out.iloc[0]['Bundle'] == 500_000
+    assert mods['Delta'].tolist() == [repeated(0.0, 10.01, 500_000), repeated(0.0, 20.02, 1_500_000)]
+    assert mods['cost_scrap'].tolist() == [repeated(0.0, 1.5, 1_500_000), repeated(0.0, 1.25, 500_000)]
+    assert parts['Delta'].tolist() == [repeated(0.0, 1.11, 10)]
+    assert parts['price_scrap'].tolist() == [repeated(0.0, 0.1, 2_000_000 - 10)]
+
+
+def candidate_inputs():
+    """Harvest candidates on two platforms: H1 and H3 share platform a's rows, H2 has b's"""
+    bundle = tools()._recommend_frame(pd.DataFrame({'Machine': ['H1', 'H2', 'H3'], 'Bundle': [40, 30, 20],
+                                                     'Pipe_units': 0, 'Pipe_prob': 50, 'Pipeline': [0, 0, 0]}))
+    mods = pd.DataFrame({'Module': ['M1', 'M2', 'M3'], 'req_demand': [25, 12, 7]})
+    parts = pd.DataFrame({'Part': ['P1', 'P2'], 'req_demand': [9, 4]})
+    delta_mod = pd.DataFrame({'Module': ['M1', 'M2', 'M3'], 'Delta_Cost': [10.01, 20.02, 30.03],
+                              '275_SCP': [30.03, 40.04, 50.05], 'Total_Cost': [5.05, 6.06, 7.07]})
+    delta_parts = pd.DataFrame({'Part': ['P1', 'P2'], 'Delta_Cost': [1.11, 2.22], '275_SCP': [2.22, 3.33],
+                                'Total_Cost': [0.33, 0.44]})
+    scrap = pd.DataFrame({'Type': ['Module'] * 3 + ['Part'] * 2, 'id_component': ['M1', 'M2', 'M3', 'P1', 'P2'],
+                          'residual_value': [0.5, 0.25, 0.75, 0.1, 0.2], 'scrap_value': [1.5, 1.25, 1.75, 1.1, 1.2]})
+    return mods, parts, bundle, delta_mod, delta_parts, scrap
+
+
+def test_harvest_groups_on_threads_match_the_sequential_run(monkeypatch):
+    candidates = [('H1', 'a'), ('H2', 'b'), ('H3', 'a')]
+    systems = {'mod_systems': ['a', 'b', 'a'], 'part_systems': ['b', 'a']}
+
+    sequential = tools().optimize_harvest_candidates(candidates, *candidate_inputs(), workers=1, **systems)
+
+    threads = set()
+    harvest = tools.optimize_harvest
+
+    def recording(self, *args):
+        threads.add(threading.get_ident())
+        return harvest(self, *args)
+
+    monkeypatch.setattr(tools, 'optimize_harvest', recording)
+    parallel = tools().optimize_harvest_candidates(candidates, *candidate_inputs(), workers=4, **systems)
+
+    assert len(threads) == 2   # one per group
+    pd.testing.assert_frame_equal(parallel[0], sequential[0])
+    strip = [{k: v for k, v in t.items() if k != 'seconds'} for t in sequential[1]]
+    assert [{k: v for k, v in t.items() if k != 'seconds'} for t in parallel[1]] == strip
+    # H1 and H3 compete for platform a's demand in priority order; H2 runs on its own
+    # H1 fills platform a's demand before H3, which shares it; H2 has b's to itself
+    assert [(t['machine'], t['group'], t['harvested']) for t in strip] == [('H2', 0, 12), ('H1', 1, 25), ('H3', 1, 0)]
+
+
+def test_scrap_pro_scraps_whole_rows_at_once():
+    bundle = pd.DataFrame({'Machine': ['A', 'B', 'C'], 'Bundle': [3_000_000, -1_000_000, 4_000_000],
+                           'bb': [1, 0, 0], 'cost_scrap': [0.5, 0.0, 0.0], 'price_scrap': [0.0, 0.0, 0.0]})
+    qtc = pd.DataFrame({'Input_type': ['A', 'C'], 'Audit_De_install': [10.1, 20.2], 'Freight_inbound': [1.01, 2.02]})
+    scrap = pd.DataFrame({'Type': 'System', 'id_component': ['A', 'C'], 'scrap_value': [3.3, 4.4],
+                          'residual_value': [7.7, 8.8]})
+    tool = tools()
+    started = time.perf_counter()
+    out = tool.scrap_pro(bundle, scrap, qtc)
+    assert time.perf_counter() - started < 1.0   # independent of the unit count
+    # 6M units are left in total: A scraps all 3M, B is negative, C the remaining 3M
+    assert out['Bundle'].tolist() == [0, -1_000_000, 1_000_000]
+    assert out['bb'].tolist() == [3_000_001, 0, 3_000_000]
+    assert out['cost_scrap'].tolist() == [repeated(0.5, 10.1 + 1.01 + 3.3, 3_000_000), 0.0,
+                                          repeated(0.0, 20.2 + 2.02 + 4.4, 3_000_000)]
+    assert out['price_scrap'].tolist() == [repeated(0.0, 7.7, 3_000_000), 0.0, repeated(0.0, 8.8, 3_000_000)]
+    assert tool.warnings.get('missing_keys') is None
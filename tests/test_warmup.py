@@ -0,0 +1,84 @@
+"""App factory warm-up, /ready and the reference data preloaded in the pool's fork server."""
+from pathlib import Path
+
+import pytest
+
+import optimize_excel
+import optimizer_pool
+import reference_data
+import warmup
+from conftest import BASE_XLSX
+
+
+@pytest.fixture
+def readiness(monkeypatch):
+    fresh = warmup.Readiness()
+    monkeypatch.setattr(warmup, 'readiness', fresh)
+    return fresh
+
+
+class StartedPool:
+    """Stands in for the optimizer pool: records the warm-up instead of starting processes"""
+    size = 2
+    start_method = 'spawn'
+
+    def __init__(self):
+        self.preloaded = None
+        self.warmed = None
+
+    def preload_reference(self, base_path):
+        self.preloaded = base_path
+
+    def warm_up(self, fn=None, *args):
+        self.warmed = (fn, args)
+
+
+def test_create_app_warms_up_and_ready_waits_for_the_pool(readiness, monkeypatch):
+    monkeypatch.setattr(optimize_excel, 'BASE_PATH', BASE_XLSX)
+    client = optimize_excel.create_app(warm_up=True).test_client()
+    checks = readiness.to_dict()['checks']
+    assert all(checks[c]['ok'] for c in ('imports', 'reference', 'auth_db'))
+    assert checks['reference']['version'] == reference_data.workbook_version(BASE_XLSX)[:12]
+    reply = client.get('/ready')
+    assert reply.status_code == 503 and reply.get_json()['status'] == 'starting'
+
+    pool = StartedPool()
+    assert warmup.warm_pool(pool, optimizer_pool.load_reference, str(BASE_XLSX), base_path=BASE_XLSX)
+    assert pool.preloaded == BASE_XLSX and pool.warmed == (optimizer_pool.load_reference, (str(BASE_XLSX),))
+    reply = client.get('/ready')
+    assert reply.status_code == 200 and reply.get_json()['checks']['optimizer_pool']['workers'] == 2
+
+
+def test_create_app_without_warm_up_is_not_ready(readiness):
+    client = optimize_excel.create_app(warm_up=False).test_client()
+    reply = client.get('/ready')
+    assert reply.status_code == 503
+    assert all(check.get('pending') for check in reply.get_json()['checks'].values())
+
+
+def test_failed_step_is_reported(readiness, tmp_path):
+    missing = tmp_path / 'missing.xlsx'
+    warmup.warm_up(missing)
+    reference_data._caches.pop(str(missing.resolve())).stop_watcher()
+    state = readiness.to_dict()
+    assert state['status'] == 'failed' and not state['checks']['reference']['ok']
+
+
+def preloaded_reference(base_path):
+    """Job: whether this worker forked with the workbook's snapshot, and its load count after using it"""
+    cache = reference_data._caches.get(str(Path(base_path).resolve()))
+    inherited = cache is not None and cache._snapshot is not None
+    reference_data.get_reference(base_path)
+    return inherited, reference_data.get_cache(base_path).reloads
+
+
+def test_forkserver_workers_inherit_the_preloaded_reference(monkeypatch):
+    monkeypatch.delenv(reference_data.PRELOAD_ENV, raising=False)
+    pool = optimizer_pool.OptimizerPool(size=1, max_tasks_per_worker=1, timeout=120, start_method='forkserver')
+    pool.preload_reference(BASE_XLSX)
+    try:
+        # Both the first worker and its recycled replacement fork with it
+        assert pool.run(preloaded_reference, str(BASE_XLSX)) == (True, 1)
+        assert pool.run(preloaded_reference, str(BASE_XLSX)) == (True, 1)
+    finally:
+        pool.shutdown()
@@ -0,0 +1,79 @@
+"""Per-request workspaces: private MasterDB.xlsx copies and atomic publishing."""
+import copy
+import threading
+
+import pytest
+
+import optimize_excel
+import optimizer_pool
+import workspace
+from conftest import BASE_XLSX, SCENARIOS
+
+
+def test_workspaces_are_private_and_cleaned_up(tmp_path):
+    with workspace.Workspace.create(tmp_path) as a, workspace.Workspace.create(tmp_path) as b:
+        assert a.root != b.root and a.master_db != b.master_db
+        assert a.root.is_dir() and b.root.is_dir()
+    assert not a.root.exists() and not b.root.exists()
+
+
+def test_publish_replaces_the_target_without_leftovers(tmp_path):
+    target = tmp_path / 'MasterDB.xlsx'
+    target.write_bytes(b'previous')
+    with workspace.Workspace.create(tmp_path / 'runs') as ws:
+        ws.master_db.write_bytes(b'new results')
+        ws.publish(target)
+    assert target.read_bytes() == b'new results'
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['MasterDB.xlsx', 'runs']
+
+
+class WorkbookPool:
+    """Stands in for the optimizer pool: both runs are in flight at once, each writing its own copy"""
+    size = 2
+
+    def __init__(self, result):
+        self.result = result
+        self.both_running = threading.Barrier(2, timeout=10)
+        self.paths = []
+
+    def run(self, fn, path, cancel=None, on_event=None, **kwargs):
+        assert fn is optimizer_pool.run_workbook
+        self.paths.append(path)
+        assert path.read_bytes() == b'shared input'
+        self.both_running.wait()
+        path.write_bytes(f'output of {path.parent.name}'.encode())
+        return copy.deepcopy(self.result)
+
+
+@pytest.fixture(scope='module')
+def result():
+    frames = optimize_excel._payload_frames(SCENARIOS['a'])
+    return optimizer_pool.run_frames(frames, str(BASE_XLSX))
+
+
+def test_concurrent_excel_input_runs_use_their_own_copy(app, result, tmp_path, monkeypatch):
+    master = tmp_path / 'MasterDB.xlsx'
+    master.write_bytes(b'shared input')
+    monkeypatch.setattr(optimize_excel, 'MASTER_DB_PATH', master)
+    monkeypatch.setattr(workspace, 'WORKSPACE_ROOT', tmp_path / 'runs')
+    monkeypatch.delenv('MASTER_EXCEL_PATH', raising=False)
+    pool = WorkbookPool(result)
+    monkeypatch.setattr(optimizer_pool, 'pool', pool)
+
+    replies = []
+
+    def post():
+        replies.append(app.test_client().post('/api/optimize', json={'use_excel_inputs': True}).status_code)
+
+    threads = [threading.Thread(target=post) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert replies == [200, 200]
+    assert len({path.parent for path in pool.paths}) == 2
+    # One run's complete output was published; the scratch directories are gone
+    assert master.read_bytes() in {f'output of {path.parent.name}'.encode() for path in pool.paths}
+    assert list((tmp_path / 'runs').iterdir()) == []
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['MasterDB.xlsx', 'runs']